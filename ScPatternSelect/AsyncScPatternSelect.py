@@ -0,0 +1,583 @@
+import os
+import time
+import asyncio
+from .ScPatternSelect import ScPatternSelect
+from .tools.async_ca import AsyncCA
+from .tools.run_result import RunPatternResult, get_remaining, get_stage_timeouts
+from .tools.stats import network_stats, get_caput_outcome
+from .tools.tracing import tracer
+
+
+class AsyncScPatternSelect:
+    def __init__(
+        self,
+        system: str,
+        unit: str,
+        ioc: str,
+        timeout: float = 0.5,
+        cache_dir: str = None,
+        pva=None,
+        ca: AsyncCA = None,
+        transport=None,
+    ):
+        """
+        asyncio version of ScPatternSelect, everything that touches the
+        network or the pattern table is a coroutine
+        the table is kept by an unconnected ScPatternSelect, patt_sel,
+        fed by a p4p asyncio monitor
+        use connect, or async with, before anything else
+
+        input
+        -------
+        system, unit, ioc, timeout, cache_dir:
+            same as ScPatternSelect
+        pva:
+            p4p.client.asyncio.Context to share between TPGs,
+            None: make one on connect
+        ca:
+            AsyncCA to share between TPGs,
+            None: make one on transport
+        transport:
+            does the network operations, see tools/transport.py
+            None: an EpicsTransport
+        """
+        self.patt_sel = ScPatternSelect(
+            system,
+            unit,
+            ioc,
+            timeout,
+            blocking=False,
+            cache_dir=cache_dir,
+            connect=False,
+            transport=transport,
+        )
+        self.globals = self.patt_sel.globals
+        self.timeout = timeout
+        self.transport = self.patt_sel.transport
+        self.pva = pva
+        self.owns_pva = pva is None
+        self.ca = ca
+        self.owns_ca = ca is None
+        if self.ca is None:
+            self.ca = AsyncCA(timeout, self.transport)
+        self.patt_table_sub = None
+        self.patt_table_update = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def connect(self, blocking: bool = True):
+        """
+        starts the pattern NTTable monitor
+
+        input
+        -------
+        blocking:
+            True: get the pattern NTTable before returning,
+            skipped if the cached table is current
+            False: return right away, the monitor fills in the table,
+            use wait_ready to wait for it
+        """
+        if self.pva is None:
+            self.pva = self.transport.open_async_context()
+
+        # tables are applied in the order they arrive
+        self.patt_table_update = asyncio.Lock()
+        self.patt_table_sub = self.pva.monitor(
+            self.globals.get_patt_table_name(),
+            self.patt_table_callback,
+            notify_disconnect=True,
+        )
+        if blocking and not await self.check_pattern_table_cache():
+            await self.get_pattern_table()
+
+    async def close(self):
+        """
+        stops the monitor, and closes the PVA context and the CA
+        channels if they are not shared
+        """
+        if self.patt_table_sub is not None:
+            self.patt_table_sub.close()
+            await self.patt_table_sub.wait_closed()
+            self.patt_table_sub = None
+
+        if self.owns_pva and self.pva is not None:
+            self.pva.close()
+            self.pva = None
+
+        if self.owns_ca:
+            self.ca.close()
+
+    async def patt_table_callback(self, value):
+        """
+        monitor callback for the pattern NTTable, see
+        PatternTableMonitor.patt_table_callback
+        """
+        if isinstance(value, Exception):
+            from p4p.client.asyncio import Cancelled
+
+            if isinstance(value, Cancelled):
+                return
+
+            # the monitor reports a disconnect before the first connection
+            if self.patt_sel.is_patt_table_live:
+                network_stats.record(
+                    self.globals.get_tpg_base_pv(), "pva_monitor", outcome="error"
+                )
+                print(f"Pattern NTTable monitor: {value!r}")
+                await self.get_pattern_table()
+            return
+
+        if not self.patt_sel.is_table_changed(value):
+            return
+
+        await self.set_pattern_table(value)
+
+    async def get_pattern_table(self):
+        """
+        gets the pattern NTTable, the monitor keeps it up to date after this
+        """
+        start = time.perf_counter()
+        try:
+            patt_table = await asyncio.wait_for(
+                self.pva.get(self.globals.get_patt_table_name()), self.timeout
+            )
+        except asyncio.TimeoutError:
+            network_stats.record(
+                self.globals.get_tpg_base_pv(),
+                "pva_get_table",
+                time.perf_counter() - start,
+                "timeout",
+            )
+            self.patt_sel.set_patt_table_unavailable()
+            print(self.globals.get_patt_table_name())
+            print(
+                "The pattern NTTable is not available right not.  Will connect when it is available"
+            )
+        else:
+            network_stats.record(
+                self.globals.get_tpg_base_pv(),
+                "pva_get_table",
+                time.perf_counter() - start,
+            )
+            print("Pattern Connected")
+            await self.set_pattern_table(patt_table)
+
+    async def set_pattern_table(self, patt_table):
+        """
+        builds the snapshot of a new table on a worker thread,
+        see ScPatternSelect.set_pattern_table
+        """
+        loop = asyncio.get_running_loop()
+        async with self.patt_table_update:
+            await loop.run_in_executor(
+                None, self.patt_sel.set_pattern_table, patt_table
+            )
+
+    async def check_pattern_table_cache(self):
+        """
+        see ScPatternSelect.check_pattern_table_cache
+        """
+        if not self.patt_sel.is_cache_checkable():
+            return False
+
+        start = time.perf_counter()
+        try:
+            patt_table = await asyncio.wait_for(
+                self.pva.get(
+                    self.globals.get_patt_table_name(), request="field(timeStamp)"
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            network_stats.record(
+                self.globals.get_tpg_base_pv(),
+                "pva_get_timestamp",
+                time.perf_counter() - start,
+                "timeout",
+            )
+            print(self.globals.get_patt_table_name())
+            print(
+                "The pattern NTTable is not available right not.  Will connect when it is available"
+            )
+            return True
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            "pva_get_timestamp",
+            time.perf_counter() - start,
+        )
+
+        return self.patt_sel.check_cache_timestamp(patt_table)
+
+    async def wait_ready(self, timeout=None):
+        """
+        waits for the first pattern NTTable to arrive
+        see ScPatternSelect.wait_ready
+        """
+        return await self.patt_sel.wait_ready_async(timeout)
+
+    async def load_pattern(self, pattern_name: str, timeout=None):
+        """
+        Loads the given pattern to the tpg
+        see ScPatternSelect.load_pattern
+        timeout is the seconds to wait for both puts to complete, one
+        deadline shared by the path and the load put,
+        None gives each put the AsyncCA timeout
+
+        output
+        -------
+        True
+            if the path and load puts completed
+        False
+            if the pattern does not exist, the table is stale
+            or a put did not complete in time
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with tracer.span("load_pattern", pattern_name=pattern_name):
+            if self.patt_sel.is_patt_table_stale:
+                print("The pattern table is stale, wait for the NTTable to connect")
+                return False
+
+            with tracer.span("get_relative_pattern_path"):
+                rel_patt_path = self.patt_sel.get_relative_pattern_path(pattern_name)
+            if rel_patt_path is None:
+                return False
+
+            path_caput = await self.caput(
+                "caput_path",
+                self.globals.get_path_set_pv(),
+                rel_patt_path,
+                get_remaining(deadline),
+            )
+            if path_caput != 1:
+                return False
+
+            load_caput = await self.caput(
+                "caput_load", self.globals.get_load_pv(), 1, get_remaining(deadline)
+            )
+            return load_caput == 1
+
+    async def apply_pattern(self, pattern_name: str, timeout=None):
+        """
+        Apply the loaded pattern to the tpg
+        see ScPatternSelect.apply_pattern
+        timeout is the seconds to wait for the put to complete,
+        None uses the AsyncCA timeout
+
+        output
+        -------
+        True
+            if the apply put completed
+        False
+            if the pattern does not exist, is not the loaded pattern
+            or the put did not complete
+        """
+        with tracer.span("apply_pattern", pattern_name=pattern_name):
+            if not self.patt_sel.pattern_exists(pattern_name):
+                return False
+
+            pattern_loaded = await self.get_pattern_loaded()
+            # the monitor can lag a load put made just before,
+            # so a mismatch is checked again with a get on a worker thread
+            if pattern_name != pattern_loaded:
+                loop = asyncio.get_running_loop()
+                pattern_loaded = await loop.run_in_executor(
+                    None,
+                    self.patt_sel.caget_pattern_readback,
+                    self.globals.get_pattern_loaded_pv(),
+                )
+            if pattern_name != pattern_loaded:
+                return False
+
+            caput_val = await self.caput(
+                "caput_apply", self.globals.get_apply_pv(), 1, timeout
+            )
+            return caput_val == 1
+
+    async def run_pattern(self, pattern_name: str, timeouts=None):
+        """
+        Load and apply the given pattern to the tpg
+        runs the load, loaded, apply and applied stages,
+        see ScPatternSelect.run_pattern
+
+        output
+        -------
+        RunPatternResult
+            truthy if the pattern is running, has the stage that failed
+            and the time each stage took
+        """
+        stage_timeouts = get_stage_timeouts(timeouts)
+        result = RunPatternResult(pattern_name)
+
+        def shows_pattern(patt_path):
+            return patt_path is not None and (
+                os.path.split(patt_path)[-1] == pattern_name
+            )
+
+        loaded_pv = self.globals.get_pattern_loaded_pv()
+        running_pv = self.globals.get_pattern_running_pv()
+        # a readback that showed another pattern before the put must get
+        # an update after it, see ScPatternSelect.run_pattern
+        num_updates = {}
+
+        def get_num_updates(pvname):
+            if shows_pattern(self.ca.get_value(pvname, as_string=True)):
+                return None
+            return self.ca.get_num_updates(pvname)
+
+        def wait_for_pattern(pvname, timeout):
+            return self.ca.wait_for_value(
+                pvname,
+                shows_pattern,
+                as_string=True,
+                timeout=timeout,
+                after=num_updates[pvname],
+            )
+
+        def load(timeout):
+            num_updates[loaded_pv] = get_num_updates(loaded_pv)
+            return self.load_pattern(pattern_name, timeout)
+
+        def apply(timeout):
+            num_updates[running_pv] = get_num_updates(running_pv)
+            return self.apply_pattern(pattern_name, timeout)
+
+        stages = {
+            "load": load,
+            "loaded": lambda timeout: wait_for_pattern(loaded_pv, timeout),
+            "apply": apply,
+            "applied": lambda timeout: wait_for_pattern(running_pv, timeout),
+        }
+        with tracer.span("run_pattern", pattern_name=pattern_name):
+            for stage, run_stage in stages.items():
+                start = time.perf_counter()
+                with tracer.span(f"run_pattern.{stage}"):
+                    is_done = await run_stage(stage_timeouts[stage])
+                result.latencies[stage] = time.perf_counter() - start
+                # the puts record themselves, the readback waits are recorded here
+                if stage in ("loaded", "applied"):
+                    network_stats.record(
+                        self.globals.get_tpg_base_pv(),
+                        f"wait_{stage}",
+                        result.latencies[stage],
+                        "ok" if is_done else "timeout",
+                    )
+                if not is_done:
+                    result.failed_stage = stage
+                    return result
+
+        result.success = True
+        return result
+
+    async def get_pattern_running(self):
+        """
+        returns the name of the pattern running on the TPG
+        answered from the AsyncCA monitor, so a read right after a put
+        can still give the value before it, see
+        ScPatternSelect.get_pattern_running
+        None if the readback is not available
+        """
+        return (await self.get_pattern_running_with_timestamp())[0]
+
+    async def get_pattern_running_with_timestamp(self):
+        """
+        see ScPatternSelect.get_pattern_running_with_timestamp
+        """
+        return await self.get_pattern_readback(self.globals.get_pattern_running_pv())
+
+    async def get_pattern_loaded(self):
+        """
+        returns the name of the pattern loaded to the TPG
+        answered from the AsyncCA monitor, so a read right after a put
+        can still give the value before it, see
+        ScPatternSelect.get_pattern_loaded
+        None if the readback is not available
+        """
+        return (await self.get_pattern_loaded_with_timestamp())[0]
+
+    async def get_pattern_loaded_with_timestamp(self):
+        """
+        see ScPatternSelect.get_pattern_loaded_with_timestamp
+        """
+        return await self.get_pattern_readback(self.globals.get_pattern_loaded_pv())
+
+    async def get_pattern_readback(self, pvname: str):
+        """
+        returns (pattern name, timestamp) from a pattern path readback PV
+        answered from the AsyncCA monitor after the first call
+        """
+        patt_path = await self.ca.caget(pvname, as_string=True)
+        if patt_path is None:
+            return None, None
+
+        return os.path.split(patt_path)[-1], self.ca.get_timestamp(pvname)
+
+    async def get_pattern_running_data(self):
+        """
+        returns the pattern data of the running pattern
+        see ScPatternSelect.get_pattern_data
+        """
+        running_pattern = await self.get_pattern_running()
+        if running_pattern is None:
+            return None
+
+        return self.patt_sel.get_pattern_data(running_pattern)
+
+    async def get_dest_timing_state(self, timeout: float = 1.0):
+        """
+        reads the timing state of every destination at once on a worker
+        thread, see ScPatternSelect.get_dest_timing_state
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self.patt_sel.get_dest_timing_state, timeout
+        )
+
+    async def stop_beam(self):
+        """
+        stops the beam using tpg beam classes
+        see ScPatternSelect.stop_beam
+        """
+        return await self.caput(
+            "caput_beam_stop", self.globals.get_beam_stop_proc_pv(), 1
+        )
+
+    async def tpg_beam_class_reset(self):
+        """
+        attempts to recover the tpg beam classes (opposite of stop_beam)
+        see ScPatternSelect.tpg_beam_class_reset
+        """
+        return await self.caput(
+            "caput_tpg_bc_reset", self.globals.get_tpg_bc_reset_proc_pv(), 1
+        )
+
+    async def caput(self, operation: str, pvname: str, value, timeout=None):
+        """
+        AsyncCA.caput, recorded in network_stats as operation and traced
+        as a span, see ScPatternSelect.caput
+        """
+        start = time.perf_counter()
+        with tracer.span(operation, pvname=pvname):
+            caput_val = await self.ca.caput(pvname, value, timeout)
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            operation,
+            time.perf_counter() - start,
+            get_caput_outcome(caput_val),
+        )
+        return caput_val
+
+    def stats(self):
+        """
+        returns the network stats of this TPG, see ScPatternSelect.stats
+        """
+        return self.patt_sel.stats()
+
+    # table queries, answered from the in memory snapshot
+    # see the ScPatternSelect method of the same name
+
+    async def get_patt_table_snapshot(self):
+        """
+        returns the current PatternTableSnapshot, None if the pattern NTTable
+        is down
+        see ScPatternSelect.get_patt_table_snapshot
+        """
+        return self.patt_sel.get_patt_table_snapshot()
+
+    async def get_patt_table_diff(self):
+        """
+        returns the PatternTableDiff between the last two pattern tables
+        see ScPatternSelect.get_patt_table_diff
+        """
+        return self.patt_sel.get_patt_table_diff()
+
+    async def get_is_patt_table_available(self):
+        """
+        returns True if there is a pattern table to answer queries
+        see ScPatternSelect.get_is_patt_table_available
+        """
+        return self.patt_sel.get_is_patt_table_available()
+
+    async def get_is_patt_table_stale(self):
+        """
+        True while the pattern table is the cached copy
+        see ScPatternSelect.get_is_patt_table_stale
+        """
+        return self.patt_sel.get_is_patt_table_stale()
+
+    async def pattern_exists(self, pattern_name: str):
+        """
+        check if the given pattern exists
+        see ScPatternSelect.pattern_exists
+        """
+        return self.patt_sel.pattern_exists(pattern_name)
+
+    async def get_pattern_row_num(self, pattern_name: str):
+        """
+        returns the row the pattern is in in the NTTable
+        see ScPatternSelect.get_pattern_row_num
+        """
+        return self.patt_sel.get_pattern_row_num(pattern_name)
+
+    async def is_pattern_verified(self, pattern_name: str):
+        """
+        return weather the given pattern is verified
+        see ScPatternSelect.is_pattern_verified
+        """
+        return self.patt_sel.is_pattern_verified(pattern_name)
+
+    async def get_relative_pattern_path(self, pattern_name: str):
+        """
+        returns the path to the pattern relative to TpgPatternSettup
+        see ScPatternSelect.get_relative_pattern_path
+        """
+        return self.patt_sel.get_relative_pattern_path(pattern_name)
+
+    async def get_pattern_data(self, pattern_name: str):
+        """
+        returns a dictionary of the given pattern's information
+        see ScPatternSelect.get_pattern_data
+        """
+        return self.patt_sel.get_pattern_data(pattern_name)
+
+    async def get_num_patterns(self):
+        """
+        returns the number of rows in the pattern table
+        see ScPatternSelect.get_num_patterns
+        """
+        return self.patt_sel.get_num_patterns()
+
+    async def get_available_rates(self, *args, **kwargs):
+        """
+        returns the available rates for the destination
+        see ScPatternSelect.get_available_rates
+        """
+        return self.patt_sel.get_available_rates(*args, **kwargs)
+
+    async def get_pattern_name_by_rate(self, *args, **kwargs):
+        """
+        returns the pattern with the given rates and timing sources
+        see ScPatternSelect.get_pattern_name_by_rate
+        """
+        return self.patt_sel.get_pattern_name_by_rate(*args, **kwargs)
+
+    async def get_pattern_names_by_rate(self, *args, **kwargs):
+        """
+        returns the patterns for many destination configurations at once
+        see ScPatternSelect.get_pattern_names_by_rate
+        """
+        return self.patt_sel.get_pattern_names_by_rate(*args, **kwargs)
+
+    async def get_nearest_patterns(self, *args, **kwargs):
+        """
+        returns the patterns closest to the given rates
+        see ScPatternSelect.get_nearest_patterns
+        """
+        return self.patt_sel.get_nearest_patterns(*args, **kwargs)
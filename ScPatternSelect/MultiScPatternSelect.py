@@ -0,0 +1,197 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .ScPatternSelect import ScPatternSelect
+from .tools.run_result import FanOutResult
+
+
+class MultiScPatternSelect:
+    def __init__(
+        self,
+        tpgs,
+        timeout: float = 0.5,
+        cache_dir: str = None,
+        connect: bool = True,
+        max_workers: int = None,
+        transport=None,
+    ):
+        """
+        runs ScPatternSelect calls on several TPGs at once
+        every call goes to all the units in parallel and returns a
+        FanOutResult with the result and latency of each unit, so a call
+        takes as long as the slowest unit instead of the sum of them
+
+        input
+        -------
+        tpgs:
+            list of (system, unit, ioc), i.e. [("SYS0", "1", "sioc-sys0-ts01")]
+        timeout, cache_dir, connect, transport:
+            same as ScPatternSelect, the units connect in parallel
+        max_workers:
+            threads to run the calls on, None: one per unit
+
+        the first exception of a unit is raised, after the units that
+        were built are closed
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(len(tpgs), 1),
+            thread_name_prefix="MultiScPatternSelect",
+        )
+        self.patt_sels = {}
+
+        def make_patt_sel(system, unit, ioc):
+            return ScPatternSelect(
+                system,
+                unit,
+                ioc,
+                timeout,
+                cache_dir=cache_dir,
+                connect=connect,
+                transport=transport,
+            )
+
+        try:
+            futures = {
+                (system, unit): self.executor.submit(make_patt_sel, system, unit, ioc)
+                for system, unit, ioc in tpgs
+            }
+            # every unit is waited for, the ones built after another
+            # failed are closed with the rest
+            errors = []
+            for unit_key, future in futures.items():
+                try:
+                    self.patt_sels[unit_key] = future.result()
+                except Exception as err:
+                    errors.append(err)
+            if errors:
+                raise errors[0]
+        except BaseException:
+            # closes the units that were built and stops the threads
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        closes every unit and stops the threads
+        """
+        for patt_sel in self.patt_sels.values():
+            patt_sel.close()
+
+        self.executor.shutdown()
+
+    def get_units(self):
+        """
+        returns the (system, unit) of every TPG
+        """
+        return list(self.patt_sels)
+
+    def fan_out(self, method_name: str, *args, units=None, unit_args=None, **kwargs):
+        """
+        calls the ScPatternSelect method on every unit at the same time
+
+        input
+        -------
+        method_name:
+            name of the ScPatternSelect method, i.e. "get_pattern_running"
+        args, kwargs:
+            passed to the method on every unit
+        units:
+            list of (system, unit) to call, None: all of them
+        unit_args:
+            (system, unit) -> tuple of args, used instead of args for that unit
+
+        output
+        -------
+        FanOutResult
+            the result, latency and exception of each unit,
+            a unit that raises does not stop the others
+        """
+        if units is None:
+            units = self.get_units()
+        if unit_args is None:
+            unit_args = {}
+
+        fan_out_result = FanOutResult(method_name)
+
+        def call(unit_key):
+            method = getattr(self.patt_sels[unit_key], method_name)
+            start = time.perf_counter()
+            try:
+                return method(*unit_args.get(unit_key, args), **kwargs), None
+            except Exception as err:
+                return None, err
+            finally:
+                fan_out_result.latencies[unit_key] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        futures = {unit_key: self.executor.submit(call, unit_key) for unit_key in units}
+        for unit_key, future in futures.items():
+            result, err = future.result()
+            fan_out_result.results[unit_key] = result
+            if err is not None:
+                print(f"{method_name} on {unit_key}: {err!r}")
+                fan_out_result.errors[unit_key] = err
+        fan_out_result.elapsed = time.perf_counter() - start
+
+        return fan_out_result
+
+    def get_pattern_running(self, units=None):
+        """
+        returns a FanOutResult of the pattern running on every unit
+        see ScPatternSelect.get_pattern_running
+        """
+        return self.fan_out("get_pattern_running", units=units)
+
+    def get_pattern_loaded(self, units=None):
+        """
+        returns a FanOutResult of the pattern loaded on every unit
+        see ScPatternSelect.get_pattern_loaded
+        """
+        return self.fan_out("get_pattern_loaded", units=units)
+
+    def run_pattern(self, pattern_names, timeouts=None):
+        """
+        runs patterns on several units at the same time
+
+        input
+        -------
+        pattern_names:
+            pattern name to run on every unit,
+            or (system, unit) -> pattern name to run a different one on each
+        timeouts:
+            stage -> seconds, see ScPatternSelect.run_pattern
+
+        output
+        -------
+        FanOutResult
+            the RunPatternResult of each unit
+        """
+        if isinstance(pattern_names, str):
+            return self.fan_out("run_pattern", pattern_names, timeouts=timeouts)
+
+        return self.fan_out(
+            "run_pattern",
+            units=list(pattern_names),
+            unit_args={
+                unit_key: (pattern_name,)
+                for unit_key, pattern_name in pattern_names.items()
+            },
+            timeouts=timeouts,
+        )
+
+    def query(self, method_name: str, *args, units=None, **kwargs):
+        """
+        runs a pattern table query on every unit,
+        i.e. query("get_pattern_name_by_rate", sxr_rate=10)
+
+        output
+        -------
+        FanOutResult
+            what the query returned on each unit
+        """
+        return self.fan_out(method_name, *args, units=units, **kwargs)
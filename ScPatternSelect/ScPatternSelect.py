@@ -1,53 +1,521 @@
 import os
+import time
+import weakref
+import threading
+import numpy as np
 from .tools.globals import globals
-from epics import caput, caget
-
-from p4p.client.thread import Context
+from .tools.pattern_table import PatternTableSnapshot
+from .tools.table_cache import PatternTableCache, PatternTableCacheWriter
+from .tools.connection_pool import (
+    get_connection_pool,
+    get_patt_table_timestamp,
+    is_table_changed,
+    release_connections,
+)
+from .tools.run_result import RunPatternResult, get_remaining, get_stage_timeouts
+from .tools.stats import network_stats, get_caput_outcome
+from .tools.tracing import tracer
+
+# epics and p4p load libca and pvAccess, they and asyncio are imported on
+# first use so importing ScPatternSelect for the globals stays cheap
+# benchmarks/bench_import.py checks this
 
 
 class ScPatternSelect:
-    def __init__(self, system: str, unit: str, ioc: str, timeout: float = 0.5):
-        """"""
+    def __init__(
+        self,
+        system: str,
+        unit: str,
+        ioc: str,
+        timeout: float = 0.5,
+        blocking: bool = True,
+        cache_dir: str = None,
+        connect: bool = True,
+        transport=None,
+    ):
+        """
+        input
+        -------
+        system, unit, ioc:
+            the TPG to select patterns on, i.e. "SYS0", "1", "sioc-sys0-ts01"
+        timeout:
+            timeout of the get of the pattern NTTable
+        blocking:
+            True: get the pattern NTTable before returning
+            False: return right away, the monitor fills in the table
+            in the background, use wait_ready or wait_ready_async
+            to wait for it
+        cache_dir:
+            directory to keep a copy of the pattern table in
+            the copy is loaded here so queries work before the NTTable
+            connects, the table is read only and stale until it does
+            None: no cache
+        connect:
+            True: monitor the pattern NTTable
+            False: do not open a PVA connection, the owner passes
+            table values to set_pattern_table, used by AsyncScPatternSelect
+        transport:
+            does the network operations, see tools/transport.py
+            None: EpicsTransport, pyepics and p4p
+            LocalTransport serves a TPG from memory with no network
+        """
         # TODO: make connecting to the nttabe safer
         self.system = system
         self.unit = unit
         self.ioc = ioc
         self.timeout = timeout
         self.globals = globals(self.system, self.unit, self.ioc)
-        self.pva = Context("pva", nt=False)
-        self.patt_table_sub = self.pva.monitor(
-            self.globals.get_patt_table_name(), self.patt_table_callback
-        )
-        self.get_pattern_table()
+        self.is_patt_table_live = False
+        self.patt_table_version = 0
+        self.patt_table_snapshot = None
+        # timeStamp of the table set_pattern_table last built a snapshot of
+        self.patt_table_timestamp = None
+        self.is_patt_table_available = False
+        self.is_patt_table_stale = False
+        self.patt_table_lock = threading.Lock()
+        self.patt_table_ready = threading.Event()
+        self.patt_table_ready_callbacks = []
+        self.patt_table_cache = None
+        self.patt_table_cache_timestamp = None
+        # writes the tables of an unconnected instance, connected ones
+        # share the writer of their PatternTableMonitor
+        self.patt_table_cache_writer = None
+        if cache_dir is not None:
+            cache_name = self.globals.get_patt_table_name().replace(":", "_")
+            self.patt_table_cache = PatternTableCache(
+                os.path.join(cache_dir, f"{cache_name}.cache")
+            )
+            self.load_pattern_table_cache()
+            if not connect:
+                self.patt_table_cache_writer = PatternTableCacheWriter(
+                    self.patt_table_cache, self.patt_table_cache_timestamp
+                )
+
         self.init_err_mesages()
+        # instances on the same transport share its connections
+        self.connection_pool = get_connection_pool(transport)
+        self.transport = self.connection_pool.transport
+        self.readbacks = {}
+        self.readbacks_lock = threading.RLock()
+        self.pva = None
+        self.patt_table_monitor = None
+        # releases the connections on close, or when the instance is
+        # garbage collected without being closed
+        self.release_connections = weakref.finalize(
+            self,
+            release_connections,
+            self.connection_pool,
+            self.globals.get_patt_table_name() if connect else None,
+            self.readbacks,
+            self.readbacks_lock,
+        )
+        if not connect:
+            return
+
+        # one monitor and snapshot per TPG, shared with other instances
+        self.patt_table_monitor = self.connection_pool.acquire_patt_table_monitor(
+            self.globals.get_patt_table_name(), self, self.patt_table_cache
+        )
+        self.pva = self.patt_table_monitor.pva
+        self.preconnect()
+        if (
+            blocking
+            and not self.is_patt_table_live
+            and not self.check_pattern_table_cache()
+        ):
+            self.get_pattern_table()
+
+    def close(self):
+        """
+        releases the pattern NTTable monitor and the readbacks
+        the connections close once no other instance on the TPG uses them
+        """
+        if self.patt_table_monitor is not None:
+            self.patt_table_monitor.remove_subscriber(self)
+            self.patt_table_monitor = None
+            self.pva = None
 
-    # what should the behavior be when unable to connect to the nttable?
-    # Wait until connected?
-    # Once it does the initial get everything is fine
-    def patt_table_callback(self, *args, **kwargs):
-        """temp callback"""
-        self.get_pattern_table()
+        # runs once, a second close does nothing
+        self.release_connections()
+
+    def preconnect(self, timeout: float = 0):
+        """
+        starts connecting every channel access PV used to load and apply
+        patterns and stop the beam, see globals.get_ca_pvs
+        the searches all go out at once, so the first load_pattern or
+        stop_beam finds its PVs connected
+        called by __init__ without waiting
+
+        input
+        -------
+        timeout:
+            seconds to wait for the connections, 0: do not wait
+
+        output
+        -------
+        list of the PVs that are not connected yet
+        """
+        for pvname in (
+            self.globals.get_pattern_loaded_pv(),
+            self.globals.get_pattern_running_pv(),
+        ):
+            self.get_readback(pvname)
+
+        return self.transport.connect_many(self.globals.get_ca_pvs(), timeout)
 
     def get_pattern_table(self):
-        self.is_patt_table_available = False
+        """
+        gets the pattern NTTable with a blocking get
+        the monitor keeps it up to date after this
+        see PatternTableMonitor.get_pattern_table
+        """
+        return self.patt_table_monitor.get_pattern_table(self.timeout)
+
+    def set_patt_table_unavailable(self):
+        """
+        called when the pattern NTTable can not be reached
+        a cached table keeps answering queries, read only
+        """
+        if self.patt_table_cache is not None and self.patt_table_snapshot is not None:
+            self.is_patt_table_stale = True
+        else:
+            self.is_patt_table_available = False
+
+    def set_pattern_table(self, patt_table):
+        """
+        takes a new pattern NTTable value and builds the snapshot
+        that all the queries run against
+        the snapshot is diffed against the last one so only changed rows
+        are reindexed, see get_patt_table_diff
+
+        connected instances get their snapshots from the shared
+        PatternTableMonitor instead, this is for unconnected ones
+        the table is written to the cache on the writer's thread
+        """
+        start = time.perf_counter()
+        with self.patt_table_lock:
+            patt_table_snapshot = PatternTableSnapshot(
+                patt_table["value"],
+                self.patt_table_version + 1,
+                previous=self.patt_table_snapshot,
+            )
+            self.patt_table_timestamp = get_patt_table_timestamp(patt_table)
+        network_stats.record_table_update(
+            self.globals.get_tpg_base_pv(), time.perf_counter() - start
+        )
+
+        self.install_patt_table_snapshot(patt_table_snapshot)
+        if self.patt_table_cache_writer is not None:
+            self.patt_table_cache_writer.write(
+                patt_table["value"], self.patt_table_timestamp
+            )
+
+    def is_table_changed(self, patt_table):
+        """
+        returns False if patt_table holds the same table as the snapshot,
+        for unconnected instances, see PatternTableMonitor.is_table_changed
+        always True while the table is unavailable or stale
+        """
+        with self.patt_table_lock:
+            if (
+                not self.is_patt_table_live
+                or not self.is_patt_table_available
+                or self.is_patt_table_stale
+            ):
+                return True
+            patt_table_timestamp = self.patt_table_timestamp
+
+        return is_table_changed(patt_table, patt_table_timestamp)
+
+    def install_patt_table_snapshot(self, patt_table_snapshot):
+        """
+        makes a snapshot of a live table the current one
+
+        the new snapshot is swapped in with a single assignment, readers
+        never see a half built table and do not need the lock
+        the snapshot keeps a compact copy of the table, the p4p Value is
+        not kept, see get_patt_table_memory_footprint
+        once the table is live a snapshot no newer than the current one
+        is ignored, two updates installed from different threads can
+        arrive out of order
+
+        input
+        -------
+        patt_table_snapshot:
+            the PatternTableSnapshot, may be shared with other instances
+        """
+        with self.patt_table_lock:
+            if (
+                self.is_patt_table_live
+                and patt_table_snapshot.version <= self.patt_table_version
+            ):
+                return
+
+            self.is_patt_table_live = True
+            self.patt_table_version = patt_table_snapshot.version
+            self.patt_table_snapshot = patt_table_snapshot
+            self.is_patt_table_available = True
+            self.is_patt_table_stale = False
+
+            ready_callbacks = []
+            if not self.patt_table_ready.is_set():
+                self.patt_table_ready.set()
+                ready_callbacks = self.patt_table_ready_callbacks
+                self.patt_table_ready_callbacks = []
+
+        for ready_callback in ready_callbacks:
+            ready_callback()
+
+    def load_pattern_table_cache(self):
+        """
+        loads the cached pattern table as a stale snapshot
+        queries work right away, load_pattern waits for the live table
+
+        output
+        -------
+        True
+            the cached table was loaded
+        False
+            there is no usable cache or a live table already arrived
+        """
+        cached = self.patt_table_cache.read()
+        if cached is None:
+            return False
+
+        table, timestamp = cached
+        with self.patt_table_lock:
+            if self.patt_table_snapshot is not None:
+                return False
+
+            self.patt_table_version = 1
+            self.patt_table_snapshot = PatternTableSnapshot(table, 1)
+            self.patt_table_cache_timestamp = timestamp
+            self.is_patt_table_stale = True
+            self.is_patt_table_available = True
+
+        print("Pattern table loaded from cache, stale until the NTTable connects")
+        return True
+
+    def check_pattern_table_cache(self):
+        """
+        gets only the timeStamp of the pattern NTTable and compares it to
+        the cached table, so a current cache skips the full get
+
+        output
+        -------
+        True
+            the cached table is current, or the NTTable is not reachable
+            either way a full get is not needed
+        False
+            there is no stale cached table to check, or it is out of date
+        """
+        if not self.is_cache_checkable():
+            return False
+
+        start = time.perf_counter()
         try:
-            self.patt_table = self.pva.get(
-                self.globals.get_patt_table_name(), timeout=self.timeout
+            patt_table = self.pva.get(
+                self.globals.get_patt_table_name(),
+                request="field(timeStamp)",
+                timeout=self.timeout,
             )
         except TimeoutError as err:
+            network_stats.record(
+                self.globals.get_tpg_base_pv(),
+                "pva_get_timestamp",
+                time.perf_counter() - start,
+                "timeout",
+            )
             print(str(err))
             print(
                 "The pattern NTTable is not available right not.  Will connect when it is available"
             )
-        else:
-            print("Pattern Connected")
-            self.is_patt_table_available = True
+            return True
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            "pva_get_timestamp",
+            time.perf_counter() - start,
+        )
+
+        return self.check_cache_timestamp(patt_table)
+
+    def is_cache_checkable(self):
+        """
+        returns True if the table is the stale cached copy and the cache
+        has the timeStamp to check it with
+        """
+        return self.is_patt_table_stale and self.patt_table_cache_timestamp is not None
+
+    def check_cache_timestamp(self, patt_table):
+        """
+        compares the timeStamp of the pattern NTTable to the cached table,
+        a current cached table is no longer stale
+
+        input
+        -------
+        patt_table:
+            the pattern NTTable value, only the timeStamp is needed
+
+        output
+        -------
+        True
+            the cached table is current
+        False
+            it is out of date
+        """
+        if get_patt_table_timestamp(patt_table) != self.patt_table_cache_timestamp:
+            return False
+
+        print("Pattern table cache is current")
+        self.is_patt_table_stale = False
+        return True
+
+    def get_patt_table_timestamp(self, patt_table):
+        """
+        returns (secondsPastEpoch, nanoseconds, userTag) of a pattern NTTable
+        value, or None if the server does not set the timeStamp
+        """
+        return get_patt_table_timestamp(patt_table)
+
+    def wait_ready(self, timeout=None):
+        """
+        waits for the first pattern NTTable to arrive
+
+        input
+        -------
+        timeout:
+            seconds to wait, None waits forever
+
+        output
+        -------
+        True
+            the pattern NTTable has been received
+        False
+            timed out
+        """
+        return self.patt_table_ready.wait(timeout)
+
+    async def wait_ready_async(self, timeout=None):
+        """
+        awaitable version of wait_ready, does not block the event loop
+        """
+        # already imported by whoever runs the event loop
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+
+        def set_ready():
+            if not ready.done():
+                ready.set_result(True)
+
+        def on_ready():
+            # the table can arrive after a timed out wait closed its loop
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(set_ready)
+
+        self.add_ready_callback(on_ready)
+
+        try:
+            return await asyncio.wait_for(ready, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            # a timed out or cancelled wait does not leave its callback
+            self.remove_ready_callback(on_ready)
+
+    def add_ready_callback(self, ready_callback):
+        """
+        calls ready_callback with no arguments once the first pattern NTTable
+        arrives, right away if it already has
+        the callback runs on the thread that received the table
+        """
+        with self.patt_table_lock:
+            if not self.patt_table_ready.is_set():
+                self.patt_table_ready_callbacks.append(ready_callback)
+                return
+
+        ready_callback()
+
+    def remove_ready_callback(self, ready_callback):
+        """
+        removes a ready_callback given to add_ready_callback that has
+        not run yet, does nothing if it has
+        """
+        with self.patt_table_lock:
+            if ready_callback in self.patt_table_ready_callbacks:
+                self.patt_table_ready_callbacks.remove(ready_callback)
+
+    def get_patt_table_snapshot(self):
+        """
+        returns the current PatternTableSnapshot
+        None if the pattern NTTable is down
+
+        snapshots are never changed once built, so a query should get the
+        snapshot once and only use that reference, then every answer
+        comes from a single version of the table
+        """
+        patt_table_snapshot = self.patt_table_snapshot
+        if not self.is_patt_table_available:
+            return None
+
+        return patt_table_snapshot
+
+    def get_patt_table_diff(self):
+        """
+        returns the PatternTableDiff between the last two pattern tables
+        with the added, removed and changed pattern names
+        None if only one table has been received
+        """
+        patt_table_snapshot = self.patt_table_snapshot
+        if patt_table_snapshot is None:
+            return None
+
+        return patt_table_snapshot.diff
+
+    def get_patt_rate_key(self, dest_data, is_verified):
+        """
+        returns the PatternTableSnapshot.rate_index key for completed dest_data
+
+        input
+        -------
+        dest_data
+            dictionary from assert_and_complete_dest_data
+        is_verified
+            verification status of pattern, True = verified, False = test pattern
+        """
+        dest_rates = tuple(
+            (dest_data[dest][0], dest_data[dest][1]) for dest in dest_data
+        )
+
+        if is_verified:
+            return (dest_rates, "True")
+        return (dest_rates, "False")
 
     def get_is_patt_table_available(self):
         """ """
         return self.is_patt_table_available
 
-    def load_pattern(self, pattern_name: str):
+    def get_patt_table_memory_footprint(self):
+        """
+        returns a dictionary of the bytes used by the pattern table,
+        see PatternTableSnapshot.get_memory_footprint
+        None if the table is not available
+        """
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
+            return None
+
+        return patt_table_snapshot.get_memory_footprint()
+
+    def get_is_patt_table_stale(self):
+        """
+        True while the pattern table is the cached copy and may not match
+        the TPG, patterns can not be loaded until the NTTable connects
+        """
+        return self.is_patt_table_stale
+
+    def load_pattern(self, pattern_name: str, timeout=None):
         """
         Loads the given pattern to the tpg
         This preps the given pattern to be started
@@ -59,30 +527,54 @@ class ScPatternSelect:
         -------
         pattern_name:
             string of the pattern name
+        timeout:
+            None: do not wait for the puts to complete
+            seconds to wait for both puts to complete, one deadline
+            shared by the path and the load put
 
         output
         -------
-        Success (int)
-            None: if pattern does not exist or unsuccessfull load
-            1: if pattern loaded successfully
+        True
+            the pattern was loaded, with a timeout both puts completed
+        False
+            the pattern does not exist, the table is stale, or a put
+            failed, with a timeout also when a put did not complete
+            before the deadline
         """
-        # check if pattern exists
-        if not self.pattern_exists(pattern_name):
-            return False
-
-        rel_patt_path = self.get_relative_pattern_path(pattern_name)
-
-        # this caput errors on non ints for some reason
-        path_caput = caput(self.globals.get_path_set_pv(), rel_patt_path)
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with tracer.span("load_pattern", pattern_name=pattern_name):
+            # the row numbers of a cached table might not match the TPG
+            if self.is_patt_table_stale:
+                print("The pattern table is stale, wait for the NTTable to connect")
+                return False
+
+            # check if pattern exists
+            with tracer.span("get_relative_pattern_path"):
+                rel_patt_path = self.get_relative_pattern_path(pattern_name)
+            if rel_patt_path is None:
+                return False
+
+            # this caput errors on non ints for some reason
+            path_caput = self.caput(
+                "caput_path",
+                self.globals.get_path_set_pv(),
+                rel_patt_path,
+                get_remaining(deadline),
+            )
 
-        load_caput = caput(self.globals.get_load_pv(), 1)
+            load_caput = self.caput(
+                "caput_load", self.globals.get_load_pv(), 1, get_remaining(deadline)
+            )
 
-        if path_caput == load_caput == 1:
-            return True
-        else:
-            return False
+            if path_caput == load_caput == 1:
+                return True
+            else:
+                return False
 
-    def apply_pattern(self, pattern_name: str):
+    def apply_pattern(self, pattern_name: str, timeout=None):
         """
         Apply the loaded pattern to the tpg
         For safty reasons the given pattern must match the
@@ -94,6 +586,9 @@ class ScPatternSelect:
         -------
         pattern_name:
             string of the pattern name
+        timeout:
+            None: do not wait for the put to complete
+            seconds to wait for the put to complete
 
         output
         -------
@@ -101,50 +596,125 @@ class ScPatternSelect:
             1: on successful apply
 
         """
+        with tracer.span("apply_pattern", pattern_name=pattern_name):
+            # check if pattern exists
+            with tracer.span("pattern_exists"):
+                pattern_exists = self.pattern_exists(pattern_name)
+            if not pattern_exists:
+                return False
+
+            # return if loaded pattern is not expected
+            with tracer.span("get_pattern_loaded"):
+                pattern_loaded = self.get_pattern_loaded()
+                # the monitor can lag a load put made just before,
+                # so a mismatch is checked again with a get
+                if pattern_name != pattern_loaded:
+                    pattern_loaded = self.caget_pattern_readback(
+                        self.globals.get_pattern_loaded_pv()
+                    )
+            if pattern_name != pattern_loaded:
+                return False
+
+            # trigger apply process
+            # run_pattern waits for the running readback to show the pattern
+            caput_val = self.caput(
+                "caput_apply", self.globals.get_apply_pv(), 1, timeout
+            )
+            # a put that timed out waiting for completion returns < 0
+            if caput_val is None or caput_val < 0:
+                return False
 
-        # check if pattern exists
-        if not self.pattern_exists(pattern_name):
-            return False
-
-        # return if loaded pattern is not expected
-        if pattern_name != self.get_pattern_loaded():
-            return False
-
-        # trigger apply process
-        # TODO: tripple check the runing pv to see the pattern running?
-        caput_val = caput(self.globals.get_apply_pv(), 1)
-        if caput_val is None:
-            return False
-
-        return True
+            return True
 
-    def run_pattern(self, pattern_name):
+    def run_pattern(self, pattern_name, timeouts=None):
         """
         Load and apply the given pattern to the tpg
         This runs the given pattern on the machiene
         Use this for most usecases of running a new pattern
 
+        runs in stages, each one starts as soon as the last one is done
+            load:    put the pattern path and load, waiting for both
+                     puts to complete
+            loaded:  wait for the loaded readback to show the pattern,
+                     with an update after the put if it showed another
+                     pattern before it
+            apply:   put apply, waiting for the put to complete
+            applied: wait for the running readback to show the pattern,
+                     the same way as loaded
+
         input
         -------
         pattern_name:
             name of the pattern you wish to run
+        timeouts:
+            stage -> seconds, overrides tools.run_result.RUN_STAGE_TIMEOUTS
 
         output
         -------
-        success
-            None: if pattern unsuccessfuly ran
-            1: if pattern successfully ran
+        RunPatternResult
+            truthy if the pattern is running, has the stage that failed
+            and the time each stage took
         """
+        stage_timeouts = get_stage_timeouts(timeouts)
+        result = RunPatternResult(pattern_name)
 
-        # load pattern, if load unsuccessfull return None
-        if self.load_pattern(pattern_name) == None:
-            return False
+        loaded = self.get_readback(self.globals.get_pattern_loaded_pv())
+        applied = self.get_readback(self.globals.get_pattern_running_pv())
 
-        # apply pattern, if apply unsuccessfull return None
-        if self.apply_pattern(pattern_name) == None:
-            return False
+        def shows_pattern(patt_path):
+            return patt_path is not None and (
+                os.path.split(patt_path)[-1] == pattern_name
+            )
 
-        return True
+        # a readback that showed another pattern before the put must get
+        # an update after it, one that already showed the pattern passes
+        # once the put completed, the IOC only posts changed values
+        num_updates = {}
+
+        def get_num_updates(readback):
+            with readback.changed:
+                if shows_pattern(readback.value):
+                    return None
+                return readback.num_updates
+
+        def load(timeout):
+            num_updates["loaded"] = get_num_updates(loaded)
+            return self.load_pattern(pattern_name, timeout)
+
+        def apply(timeout):
+            num_updates["applied"] = get_num_updates(applied)
+            return self.apply_pattern(pattern_name, timeout)
+
+        stages = {
+            "load": load,
+            "loaded": lambda timeout: loaded.wait_for(
+                shows_pattern, timeout, num_updates["loaded"]
+            ),
+            "apply": apply,
+            "applied": lambda timeout: applied.wait_for(
+                shows_pattern, timeout, num_updates["applied"]
+            ),
+        }
+        with tracer.span("run_pattern", pattern_name=pattern_name):
+            for stage, run_stage in stages.items():
+                start = time.perf_counter()
+                with tracer.span(f"run_pattern.{stage}"):
+                    is_done = run_stage(stage_timeouts[stage])
+                result.latencies[stage] = time.perf_counter() - start
+                # the puts record themselves, the readback waits are recorded here
+                if stage in ("loaded", "applied"):
+                    network_stats.record(
+                        self.globals.get_tpg_base_pv(),
+                        f"wait_{stage}",
+                        result.latencies[stage],
+                        "ok" if is_done else "timeout",
+                    )
+                if not is_done:
+                    result.failed_stage = stage
+                    return result
+
+        result.success = True
+        return result
 
     def pattern_exists(self, pattern_name: str):
         """
@@ -181,14 +751,11 @@ class ScPatternSelect:
         -1:
             pattern does not exist or pattern NTTable is down
         """
-        if not self.is_patt_table_available:
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return -1
 
-        for row_num, name in enumerate(self.patt_table["value"]["PATTERN_NAME"]):
-            if name == pattern_name:
-                return row_num
-
-        return -1
+        return patt_table_snapshot.name_index.get(pattern_name, -1)
 
     def is_pattern_verified(self, pattern_name: str):
         """
@@ -206,24 +773,23 @@ class ScPatternSelect:
             pattern is not verified, does not exist, or NTTable is down
         """
 
-        row_num = self.get_pattern_row_num(pattern_name)
-
-        if row_num == -1:
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return False
 
-        is_verified = self.patt_table["value"]["IS_VERIFIED"][row_num]
+        row_num = patt_table_snapshot.name_index.get(pattern_name, -1)
 
-        if is_verified == "True":
-            return True
+        if row_num == -1:
+            return False
 
-        return False
+        return bool(patt_table_snapshot.verified[row_num])
 
     def get_num_patterns(self):
         """
         Returns total number of rows in the raw_table
         This will always be the same between the raw_table and display_table
         """
-        return len(self.patt_table["value"][self.globals.PATTERN_KEYS[0]])
+        return self.patt_table_snapshot.num_rows
 
     def get_available_rates(
         self,
@@ -254,43 +820,24 @@ class ScPatternSelect:
         None
             Connection to the NTTable has not been established
         """
-        if not self.is_patt_table_available:
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return None
 
         self.assert_dest(dest)
         self.assert_time_source(time_source_req)
 
-        if type(dest) == int:
-            dest = self.globals.DEST_NAMES[dest]
-
-        rate_list = [0]
-        for row in range(0, self.get_num_patterns()):
-            rate = self.patt_table["value"][f"{dest}{self.globals.RATE_SFX}"][row]
-
-            timing_source = self.patt_table["value"][
-                f"{dest}{self.globals.TSOURCE_SFX}"
-            ][row]
-
-            if self.patt_table["value"]["IS_VERIFIED"][row] == "True":
-                patt_verified = True
-            else:
-                patt_verified = False
-
-            if (
-                rate not in rate_list
-                and timing_source == time_source_req
-                and patt_verified == is_verified
-            ):
-                rate_list.append(int(rate))
+        if type(dest) == str:
+            dest = self.globals.DEST_NAMES.index(dest)
 
-        rate_list.sort()
+        rate_list = patt_table_snapshot.get_available_rates(
+            dest, time_source_req, is_verified, as_string
+        )
 
         if as_string:
-            for index, rate in enumerate(rate_list):
-                rate = int(rate)
-                rate_list[index] = str(rate)
+            return list(rate_list)
 
-        return rate_list
+        return rate_list.tolist()
 
     def init_err_mesages(self):
         self.dest_name_err = f"dest must be a string in {self.globals.DEST_NAMES}"
@@ -399,7 +946,8 @@ class ScPatternSelect:
             returns None if the patter does not exist
             or connection to the NTTable is down
         """
-        if not self.is_patt_table_available:
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return None
 
         # TODO: make a nice error for when a rate=0 and ts!=FR
@@ -413,42 +961,147 @@ class ScPatternSelect:
 
         dest_data = self.assert_and_complete_dest_data(dest_data)
 
-        if is_verified:
-            is_verified = "True"
-        else:
-            is_verified = "False"
+        return patt_table_snapshot.rate_index.get(
+            self.get_patt_rate_key(dest_data, is_verified)
+        )
 
-        for pattern_row in range(0, self.get_num_patterns()):
-            pattern_match = True
-            for dest in dest_data:
+    def get_nearest_patterns(
+        self, dest_data, num_patterns=1, is_verified=True, metric="log"
+    ):
+        """
+        returns the patterns closest to the given rates,
+        for when get_pattern_name_by_rate has no exact match
 
-                dest_rate = int(
-                    self.patt_table["value"][
-                        f"{self.globals.DEST_NAMES[dest]}{self.globals.RATE_SFX}"
-                    ][pattern_row]
-                )
-                if dest_rate != dest_data[dest][0]:
-                    pattern_match = False
-                    break
+        input
+        -------
+        dest_data:
+            dictionary with dest numbers as keys and [dest_rate, dest_time_src] as values
+            i.e. {4: [100, 'FR']}, see get_pattern_name_by_rate
+        num_patterns:
+            number of patterns to return
+        is_verified:
+            verification status of pattern, True = verified, False = test pattern
+        metric:
+            how the distance between rates is measured, summed over the dests
+            "log": difference of log10(1 + rate), the default
+            "abs": difference in Hz
+            or a function taking the requested rates to dests 1-5 and an
+            array of pattern rates with one row per pattern, returning
+            the distance of every pattern
+            patterns with a different timing source on a dest where both
+            rates are non zero are never returned
+
+        output
+        -------
+        Patterns: list
+            [(pattern_name, distance), ...] nearest first,
+            an exact match has a distance of 0
+        None:
+            connection to the NTTable is down
+        """
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
+            return None
+
+        assert num_patterns > 0, f"num_patterns must be > 0, was {num_patterns}"
+
+        dest_data = self.assert_and_complete_dest_data(dict(dest_data))
 
-                dest_time_src = self.patt_table["value"][
-                    f"{self.globals.DEST_NAMES[dest]}{self.globals.TSOURCE_SFX}"
-                ][pattern_row]
+        rows, distances = patt_table_snapshot.find_nearest_rows(
+            [dest_data[dest][0] for dest in dest_data],
+            [dest_data[dest][1] for dest in dest_data],
+            is_verified,
+            num_patterns,
+            metric,
+        )
+
+        return list(zip(patt_table_snapshot.names[rows].tolist(), distances.tolist()))
+
+    def get_pattern_names_by_rate(
+        self, dest_data_list, time_srcs=None, is_verified=True
+    ):
+        """
+        returns the patterns for many destination configurations at once
+        each configuration is checked and completed the same way as
+        get_pattern_name_by_rate, including the bsyd keepalive
+
+        input
+        -------
+        dest_data_list:
+            list of dest_data dictionaries, see get_pattern_name_by_rate
+            i.e. [{4: [10, 'FR']}, {2: [10, 'FR'], 4: [1326, 'FR']}]
+            or an int array of rates with one row per configuration
+            and one column per dest number 1-5
+            i.e. [[0, 0, 0, 10, 0], [0, 10, 0, 1326, 0]]
+        time_srcs:
+            only used with an array of rates, array of timing sources
+            the same shape as the rates, all 'FR' if not given
+        is_verified:
+            verification status of pattern, True = verified, False = test pattern
 
-                if dest_time_src == "None":
-                    dest_time_src = "FR"
+        output
+        -------
+        Pattern Names: list
+            the pattern name for each configuration,
+            None for configurations with no pattern
+        None:
+            connection to the NTTable is down
+        """
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
+            return None
 
-                if dest_time_src != dest_data[dest][1]:
-                    pattern_match = False
-                    break
+        if len(dest_data_list) == 0:
+            return []
 
-            if self.patt_table["value"]["IS_VERIFIED"][pattern_row] != is_verified:
-                pattern_match = False
+        if isinstance(dest_data_list[0], dict):
+            patt_rate_keys = []
+            for dest_data in dest_data_list:
+                # copy so the callers dictionaries are not completed in place
+                dest_data = self.assert_and_complete_dest_data(dict(dest_data))
+                patt_rate_keys.append(self.get_patt_rate_key(dest_data, is_verified))
+        else:
+            patt_rate_keys = self.get_patt_rate_keys(
+                dest_data_list, time_srcs, is_verified
+            )
+
+        return [
+            patt_table_snapshot.rate_index.get(patt_rate_key)
+            for patt_rate_key in patt_rate_keys
+        ]
 
-            if pattern_match:
-                return self.patt_table["value"]["PATTERN_NAME"][pattern_row]
+    def get_patt_rate_keys(self, rates, time_srcs, is_verified):
+        """
+        returns the PatternTableSnapshot.rate_index keys for an array of rates
+        checks the rates and timing sources and applies the bsyd keepalive
+        to every row at once, matching assert_and_complete_dest_data
+        """
+        num_dests = len(self.globals.DEST_NAMES) - 1
 
-        return None
+        rates = np.array(rates).reshape(-1, num_dests)
+        assert rates.dtype.kind in "iu", f"rates must be ints, type {rates.dtype}"
+
+        if time_srcs is None:
+            time_srcs = np.full(rates.shape, "FR", dtype=object)
+        else:
+            time_srcs = np.array(time_srcs, dtype=object).reshape(rates.shape)
+        time_source_err = f"time_source must be in {self.globals.TIME_SRCS}"
+        assert np.isin(time_srcs, self.globals.TIME_SRCS).all(), time_source_err
+
+        # see check_bsyd_keepalive, dest 2 is column 1
+        keepalive = (rates[:, 2:].sum(axis=1) > 1020) & (rates[:, 1] < 10)
+        rates[keepalive, 1] = 10
+        time_srcs[keepalive, 1] = "FR"
+
+        if is_verified:
+            is_verified = "True"
+        else:
+            is_verified = "False"
+
+        return [
+            (tuple(zip(dest_rates, dest_time_srcs)), is_verified)
+            for dest_rates, dest_time_srcs in zip(rates.tolist(), time_srcs.tolist())
+        ]
 
     def check_bsyd_keepalive(self, dest_data):
         """
@@ -493,10 +1146,17 @@ class ScPatternSelect:
             None
         """
 
-        if not self.pattern_exists(pattern_name):
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return None
 
-        if self.is_pattern_verified(pattern_name):
+        row_num = patt_table_snapshot.name_index.get(pattern_name, -1)
+
+        # same check as pattern_exists
+        if row_num <= 0:
+            return None
+
+        if patt_table_snapshot.verified[row_num]:
             return os.path.join("verified", pattern_name)
         else:
             return os.path.join("test", pattern_name)
@@ -506,49 +1166,149 @@ class ScPatternSelect:
         Takes the given pattern name and returns a dictionary of it's information
         Mainly used for 'actual to search' button
         """
-        if not self.is_patt_table_available:
+        patt_table_snapshot = self.get_patt_table_snapshot()
+        if patt_table_snapshot is None:
             return None
 
-        pattern_data = {}
-
         if pattern_name.__contains__("/"):
             pattern_name = os.path.split(pattern_name)
             pattern_name = pattern_name[-1]
 
-        pattern_row = self.get_pattern_row_num(pattern_name)
+        pattern_row = patt_table_snapshot.name_index.get(pattern_name, -1)
 
         if pattern_row < 0:
             return None
 
-        for key in self.patt_table["value"]:
-            pattern_data[key] = self.patt_table["value"][key][pattern_row]
-
-        return pattern_data
+        return patt_table_snapshot.table.get_row(pattern_row)
 
     def get_pattern_running_data(self):
         """"""
         running_pattern = self.get_pattern_running()
+        if running_pattern is None:
+            return None
+
         return self.get_pattern_data(running_pattern)
 
     def get_pattern_rates():
         """"""
 
+    def get_readback(self, pvname: str):
+        """
+        returns the MonitoredReadback of pvname
+        the subscription is opened on first use and kept after that
+        """
+        with self.readbacks_lock:
+            readback = self.readbacks.get(pvname)
+            if readback is None:
+                # shared with other instances reading the same PV
+                readback = self.connection_pool.acquire_readback(pvname)
+                self.readbacks[pvname] = readback
+
+        return readback
+
     def get_pattern_running(self):
         """
         returns the name of the pattern name running on the TPG
+        read from a monitor of PATT_PATH_APPLIED, no CA traffic per call
+        the monitor update of a change lags it by about a round trip, so
+        a read right after a put can still give the value before it,
+        use run_pattern, or wait_for on get_readback, to wait for it
+        None if the readback is not available
+        """
+        return self.get_pattern_running_with_timestamp()[0]
+
+    def get_pattern_running_with_timestamp(self):
         """
-        patt_path = caget(self.globals.get_pattern_running_pv(), as_string=True)
-        pattern_name = os.path.split(patt_path)
-        return pattern_name[-1]
+        returns (pattern name, timestamp) of the pattern running on the TPG
+        the timestamp is when the IOC last updated PATT_PATH_APPLIED
+        (None, None) if the readback is not available
+        """
+        return self.get_pattern_readback(self.globals.get_pattern_running_pv())
 
     def get_pattern_loaded(self):
         """
         returns the pattern name loaded to the tpg
+        read from a monitor of PATT_PATH_LOADED, no CA traffic per call
+        like get_pattern_running, a read right after a put can still
+        give the value before it, apply_pattern checks a mismatch again
+        with caget_pattern_readback
+        None if the readback is not available
+        """
+        return self.get_pattern_loaded_with_timestamp()[0]
+
+    def get_pattern_loaded_with_timestamp(self):
+        """
+        returns (pattern name, timestamp) of the pattern loaded to the tpg
+        the timestamp is when the IOC last updated PATT_PATH_LOADED
+        (None, None) if the readback is not available
+        """
+        return self.get_pattern_readback(self.globals.get_pattern_loaded_pv())
+
+    def get_pattern_readback(self, pvname: str):
+        """
+        returns (pattern name, timestamp) from a pattern path readback PV
+        """
+        patt_path, timestamp = self.get_readback(pvname).get()
+        if patt_path is None:
+            return None, None
+
+        return os.path.split(patt_path)[-1], timestamp
+
+    def caget_pattern_readback(self, pvname: str):
+        """
+        returns the pattern name from a pattern path readback PV with a
+        get, for when the monitored value may not have caught up yet
+        None if the PV did not answer in time
+        """
+        start = time.perf_counter()
+        patt_path = self.transport.caget_many([pvname], [pvname], self.timeout)[pvname]
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            "caget_readback",
+            time.perf_counter() - start,
+            "timeout" if patt_path is None else "ok",
+        )
+        if patt_path is None:
+            return None
+
+        return os.path.split(patt_path)[-1]
+
+    def get_dest_timing_state(self, timeout: float = 1.0):
+        """
+        reads the timing source, offset, timeslot and timeslot mask
+        of every destination at once, see globals.get_dest_pvs
+        all the PVs are connected and read together in about one round trip
+
+        input
+        -------
+        timeout:
+            seconds to wait for all the PVs
+
+        output
+        -------
+        dictionary of dest name -> record
+            record is a dictionary of time_src, offset, timeslot and
+            timeslot_mask -> value, time_src is the state string
+            a value is None if its PV did not connect or answer in time
         """
-        patt_path = caget(self.globals.get_pattern_loaded_pv(), as_string=True)
-        patt_path = str(patt_path)
-        pattern_name = os.path.split(patt_path)
-        return pattern_name[-1]
+        dest_pvs = {
+            dest: self.globals.get_dest_pvs(dest) for dest in self.globals.DEST_NAMES
+        }
+        pvnames = [pvname for pvs in dest_pvs.values() for pvname in pvs.values()]
+        string_pvnames = {pvs["time_src"] for pvs in dest_pvs.values()}
+        start = time.perf_counter()
+        values = self.transport.caget_many(pvnames, string_pvnames, timeout)
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            "caget_dest_timing",
+            time.perf_counter() - start,
+            "timeout" if None in values.values() else "ok",
+        )
+
+        return {
+            dest: {field: values[pvname] for field, pvname in pvs.items()}
+            for dest, pvs in dest_pvs.items()
+        }
 
     def stop_beam(self):
         """
@@ -560,8 +1320,7 @@ class ScPatternSelect:
         None
             if caput is unsuccessful
         """
-        beam_stop = f"{self.globals.get_beam_stop_pv()}.PROC"
-        return caput(beam_stop, 1)
+        return self.caput("caput_beam_stop", self.globals.get_beam_stop_proc_pv(), 1)
 
     def tpg_beam_class_reset(self):
         """
@@ -575,5 +1334,30 @@ class ScPatternSelect:
         None
             if caput is unsuccessful
         """
-        tpg_bc_reset = f"{self.globals.get_tpg_bc_reset_pv()}.PROC"
-        return caput(tpg_bc_reset, 1)
+        return self.caput(
+            "caput_tpg_bc_reset", self.globals.get_tpg_bc_reset_proc_pv(), 1
+        )
+
+    def caput(self, operation: str, pvname: str, value, timeout=None):
+        """
+        transport.caput, the latency and outcome are recorded in
+        tools.stats.network_stats as operation, and traced as a span
+        """
+        start = time.perf_counter()
+        with tracer.span(operation, pvname=pvname):
+            caput_val = self.transport.caput(pvname, value, timeout)
+        network_stats.record(
+            self.globals.get_tpg_base_pv(),
+            operation,
+            time.perf_counter() - start,
+            get_caput_outcome(caput_val),
+        )
+        return caput_val
+
+    def stats(self):
+        """
+        returns the network stats of this TPG, operation -> stats
+        see tools.stats.NetworkStats.get_stats
+        """
+        tpg = self.globals.get_tpg_base_pv()
+        return network_stats.get_stats(tpg).get(tpg, {})
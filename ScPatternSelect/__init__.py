@@ -1 +1,16 @@
 from .ScPatternSelect import ScPatternSelect
+
+
+def __getattr__(name):
+    # asyncio and concurrent.futures are only imported by users of
+    # the async client and of the multi TPG client
+    if name == "AsyncScPatternSelect":
+        from .AsyncScPatternSelect import AsyncScPatternSelect as client
+    elif name == "MultiScPatternSelect":
+        from .MultiScPatternSelect import MultiScPatternSelect as client
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # importing the submodule set the package attribute to the module
+    globals()[name] = client
+    return client
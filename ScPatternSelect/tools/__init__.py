@@ -1 +1,15 @@
 from .globals import globals
+from .compact_table import CompactPatternTable
+from .pattern_table import PatternTableSnapshot
+from .table_diff import PatternTableDiff
+from .table_cache import PatternTableCache, PatternTableCacheWriter
+from .run_result import RunPatternResult, FanOutResult
+from .connection_pool import (
+    ConnectionPool,
+    PatternTableMonitor,
+    connection_pool,
+    get_connection_pool,
+)
+from .transport import EpicsTransport, LocalTransport
+from .stats import NetworkStats, StatsServer, network_stats, stats
+from .tracing import Tracer, tracer
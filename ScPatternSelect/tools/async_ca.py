@@ -0,0 +1,271 @@
+"""
+async_ca.py
+
+Contains AsyncCA, awaitable channel access get and put
+built on pyepics callbacks so the event loop never waits on the network
+the PVs are opened through a transport, see transport.py
+"""
+
+import asyncio
+import threading
+from .transport import EpicsTransport
+
+
+class AsyncCA:
+    def __init__(self, timeout: float = 1.0, transport=None):
+        """
+        keeps one monitored epics.PV per PV name,
+        gets are answered from the monitor once the first value arrives
+
+        input
+        -------
+        timeout:
+            default seconds to wait for a connection, a value or a put
+        transport:
+            opens the PVs, see transport.py,
+            None: an EpicsTransport
+        """
+        self.timeout = timeout
+        if transport is None:
+            transport = EpicsTransport()
+        self.transport = transport
+        self.pvs = {}
+        # pvname -> (value, char_value, timestamp) of the last monitor update
+        self.values = {}
+        # pvname -> monitor updates so far, see wait_for_value
+        self.num_updates = {}
+        # pvname -> (loop, future) of coroutines waiting for a change
+        self.waiters = {}
+        self.waiters_lock = threading.Lock()
+
+    def get_pv(self, pvname: str):
+        """
+        returns the epics.PV for pvname, it is created and starts
+        connecting in the background the first time
+        """
+        pv = self.pvs.get(pvname)
+        if pv is None:
+            pv = self.pvs[pvname] = self.transport.open_pv(
+                pvname, self.on_value, self.on_connection
+            )
+
+        return pv
+
+    def on_value(
+        self, pvname=None, value=None, char_value=None, timestamp=None, **kwargs
+    ):
+        """
+        pyepics monitor callback, runs on a CA thread
+        """
+        self.values[pvname] = (value, char_value, timestamp)
+        self.num_updates[pvname] = self.num_updates.get(pvname, 0) + 1
+        self.notify(pvname)
+
+    def on_connection(self, pvname=None, conn=None, **kwargs):
+        """
+        pyepics connection callback, runs on a CA thread
+        """
+        if not conn:
+            # wait for a new value after reconnecting
+            self.values.pop(pvname, None)
+        self.notify(pvname)
+
+    def notify(self, pvname):
+        """
+        wakes every coroutine waiting on pvname
+        """
+        with self.waiters_lock:
+            waiters = list(self.waiters.get(pvname, ()))
+
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(set_result, future, True)
+
+    async def wait_for(self, pvname: str, is_done, timeout=None):
+        """
+        waits until is_done() is True, rechecking on every
+        connection change and monitor update of pvname
+        returns False on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.get_timeout(timeout)
+        while not is_done():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+
+            waiter = (loop, loop.create_future())
+            with self.waiters_lock:
+                self.waiters.setdefault(pvname, set()).add(waiter)
+            try:
+                # the change may have come in before the waiter was added
+                if is_done():
+                    return True
+
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                with self.waiters_lock:
+                    self.waiters[pvname].discard(waiter)
+
+        return True
+
+    async def connect(self, pvname: str, timeout=None):
+        """
+        returns the connected epics.PV for pvname, or None on timeout
+        """
+        pv = self.get_pv(pvname)
+        if not await self.wait_for(pvname, lambda: pv.connected, timeout):
+            print(f"cannot connect to {pvname}")
+            return None
+
+        return pv
+
+    async def caget(self, pvname: str, as_string: bool = False, timeout=None):
+        """
+        awaitable epics.caget, answered from the monitored value
+
+        output
+        -------
+        the value of the PV
+        None
+            if the PV did not connect or send a value in time
+        """
+        pv = await self.connect(pvname, timeout)
+        if pv is None:
+            return None
+
+        # the monitor sends the first value right after the connection
+        if not await self.wait_for(pvname, lambda: pvname in self.values, timeout):
+            print(f"no value from {pvname}")
+            return None
+
+        value, char_value, _ = self.values[pvname]
+        if as_string:
+            return char_value
+
+        return value
+
+    async def wait_for_value(
+        self, pvname: str, predicate, as_string: bool = False, timeout=None, after=None
+    ):
+        """
+        waits until predicate(value) is True for the monitored value of pvname
+
+        input
+        -------
+        after:
+            get_num_updates(pvname) read before a put, only a value from
+            a later update counts
+            None: the current value counts
+
+        output
+        -------
+        True
+            predicate was met
+        False
+            the PV did not connect or the predicate was not met in time
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        if await self.connect(pvname, timeout) is None:
+            return False
+
+        if after is None:
+            after = -1
+
+        def is_done():
+            value = self.values.get(pvname)
+            if value is None or self.get_num_updates(pvname) <= after:
+                return False
+
+            return predicate(value[1] if as_string else value[0])
+
+        # the connection time counts against the timeout
+        remaining = self.get_timeout(timeout) - (loop.time() - start)
+        return await self.wait_for(pvname, is_done, max(remaining, 0))
+
+    def get_num_updates(self, pvname: str):
+        """
+        returns the number of monitor updates of pvname so far
+        """
+        return self.num_updates.get(pvname, 0)
+
+    def get_value(self, pvname: str, as_string: bool = False):
+        """
+        returns the last monitored value of pvname, without waiting
+        None if there is no value
+        """
+        value = self.values.get(pvname)
+        if value is None:
+            return None
+
+        return value[1] if as_string else value[0]
+
+    def get_timestamp(self, pvname: str):
+        """
+        returns the IOC timestamp of the last value of pvname
+        None if there is no value
+        """
+        value = self.values.get(pvname)
+        if value is None:
+            return None
+
+        return value[2]
+
+    async def caput(self, pvname: str, value, timeout=None):
+        """
+        awaitable epics.caput, waits for the put to complete
+
+        output
+        -------
+        1
+            if the put completed
+        None
+            if the PV did not connect or the put did not complete in time
+        """
+        pv = await self.connect(pvname, timeout)
+        if pv is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+
+        def on_put_complete(**kwargs):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(set_result, done, 1)
+
+        pv.put(value, wait=False, callback=on_put_complete)
+        try:
+            return await asyncio.wait_for(done, self.get_timeout(timeout))
+        except asyncio.TimeoutError:
+            print(f"put to {pvname} did not complete")
+            return None
+
+    def get_timeout(self, timeout):
+        """
+        returns timeout, or the default timeout if it is None
+        """
+        if timeout is None:
+            return self.timeout
+
+        return timeout
+
+    def close(self):
+        """
+        disconnects every PV
+        """
+        for pv in self.pvs.values():
+            pv.disconnect()
+
+        self.pvs = {}
+        self.values = {}
+
+
+def set_result(future, result):
+    """
+    sets the result of future unless it is already done
+    """
+    if not future.done():
+        future.set_result(result)
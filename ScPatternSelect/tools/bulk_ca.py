@@ -0,0 +1,119 @@
+"""
+bulk_ca.py
+
+Contains caget_many, channel access gets of many PVs in one round trip,
+and connect_many, which starts connecting many PVs at once
+"""
+
+import time
+
+# seconds of channel access events one poll waits for at most
+POLL_INTERVAL = 0.001
+
+
+def poll(ca, deadline: float):
+    """
+    processes channel access events, waiting no longer than the time
+    left to deadline, ca.poll alone can wait up to a second in pend_io
+
+    output
+    -------
+    False once deadline has passed, nothing is processed then
+    """
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+
+    ca.poll(evt=min(POLL_INTERVAL, remaining), iot=remaining)
+    return True
+
+
+def caget_many(pvnames, string_pvnames=(), timeout: float = 1.0):
+    """
+    gets many PVs at once, all the channels connect at the same time and
+    each get goes out as soon as its channel connects, so it takes about
+    one round trip instead of one per PV
+    the waits are bound by the timeout, a PV still connecting or
+    answering then is left None
+    the channels are kept by pyepics, later calls do not reconnect
+
+    input
+    -------
+    pvnames:
+        list of PV names
+    string_pvnames:
+        PV names to get as strings, the IOC does the conversion so
+        enum PVs come back as their state string
+    timeout:
+        seconds to wait for all the connections and gets
+
+    output
+    -------
+    dictionary of pvname -> value
+        the value is None if the PV did not connect or answer in time
+    """
+    from epics import ca, dbr
+
+    deadline = time.monotonic() + timeout
+    chids = {
+        pvname: ca.create_channel(pvname, connect=False, auto_cb=False)
+        for pvname in pvnames
+    }
+    # the get of a PV goes out as soon as it connects, so the ones that
+    # connect answer while the others are still connecting
+    unconnected = list(pvnames)
+    ftypes = {}
+    while True:
+        for pvname in unconnected:
+            chid = chids[pvname]
+            if not ca.isConnected(chid):
+                continue
+            ftypes[pvname] = dbr.STRING
+            if pvname not in string_pvnames:
+                ftypes[pvname] = ca.field_type(chid)
+            ca.get(chid, ftype=ftypes[pvname], wait=False)
+        unconnected = [pvname for pvname in unconnected if pvname not in ftypes]
+        if not unconnected or not poll(ca, deadline):
+            break
+
+    # get_complete returns an answered get right away, a pending one
+    # gets the time left, past the deadline it polls once and gives up
+    # its polls do not wait in pend_io, the gets and connections of
+    # pyepics all use callbacks
+    values = dict.fromkeys(pvnames)
+    for pvname, ftype in ftypes.items():
+        values[pvname] = ca.get_complete(
+            chids[pvname], ftype=ftype, timeout=deadline - time.monotonic()
+        )
+    for pvname in pvnames:
+        if values[pvname] is None:
+            print(f"no value from {pvname}")
+
+    return values
+
+
+def connect_many(pvnames, timeout: float = 0):
+    """
+    creates the epics.PV of every pvname in the pyepics PV cache that
+    epics.caput uses, so all the searches go out at once and later
+    puts find their PV connected
+
+    input
+    -------
+    pvnames:
+        list of PV names
+    timeout:
+        seconds to wait for all the connections, 0: do not wait
+
+    output
+    -------
+    list of the PV names that are not connected yet
+    """
+    from epics import ca, get_pv
+
+    deadline = time.monotonic() + timeout
+    pvs = {pvname: get_pv(pvname, connect=False) for pvname in pvnames}
+    while True:
+        unconnected = [pvname for pvname, pv in pvs.items() if not pv.connected]
+        if not unconnected or not poll(ca, deadline):
+            return unconnected
@@ -0,0 +1,379 @@
+"""
+compact_table.py
+
+Contains CompactPatternTable, the columns of the pattern NTTable in compact
+arrays so the p4p Value does not have to be kept around
+"""
+
+import sys
+import numpy as np
+from .globals import globals
+
+# string columns that go in the string pool even when empty
+POOLED_KEYS = ("PATTERN_NAME", "TAGS")
+INT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+RATE_DTYPES = (np.int32, np.int64)
+
+
+class CompactPatternTable:
+    def __init__(self, table, previous=None):
+        """
+        copies a pattern table into compact arrays
+
+        table
+            the "value" structure of the pattern NTTable,
+            or any mapping of column name -> column values
+        previous
+            the CompactPatternTable of the last table, columns that did
+            not change are compared against it and shared instead of
+            encoded again, so an update that changes little is cheap
+
+        rates
+            the *_RATE_Hz columns as one int array, int32 unless a rate
+            does not fit, one column per globals.DEST_NAMES entry
+            the rates are truncated like int(), as the queries compare them
+        time_src_codes, time_srcs
+            the *_TIMING_SOURCE columns as indexes into time_srcs,
+            laid out like rates
+        columns
+            column name -> array, categorical columns (IS_VERIFIED and the
+            timing sources) are indexes into their categories, integer
+            columns use the smallest int type that fits, other numeric
+            columns keep their type and string columns are int32 indexes
+            into one pool of interned strings shared by all of them
+            integer rate columns and the timing source columns are views
+            into the arrays above, other rate columns keep their values
+            category indexes are int8, or wider when there are more
+            categories than int8 holds
+            categories start as the ones of previous, so the codes of a
+            shared column stay valid
+
+        reads like a mapping of column name -> column values,
+        string columns come back as object arrays of str
+        """
+        self.keys = list(table)
+        self.num_rows = len(table["PATTERN_NAME"])
+        self.columns = {}
+        self.pooled = set()
+        # size of the string pool when it was last built from scratch
+        self.pool_base_size = None
+
+        rate_keys = [f"{dest}{globals.RATE_SFX}" for dest in globals.DEST_NAMES]
+        time_src_keys = [f"{dest}{globals.TSOURCE_SFX}" for dest in globals.DEST_NAMES]
+        if previous is None:
+            self.time_srcs = globals.TIME_SRCS + ["None"]
+            self.categories = {"IS_VERIFIED": ["True", "False"]}
+            unchanged = set()
+        else:
+            self.time_srcs = list(previous.time_srcs)
+            self.categories = {"IS_VERIFIED": list(previous.categories["IS_VERIFIED"])}
+            unchanged = {
+                key for key in self.keys if previous.is_unchanged(key, table[key])
+            }
+        for time_src_key in time_src_keys:
+            self.categories[time_src_key] = self.time_srcs
+
+        # the string pool is shared while no string column changes and
+        # extended when one does, new strings are added at the end
+        # it is built again once stale strings could make up half of it
+        pool_index = None
+        to_pool = [
+            key
+            for key in self.keys
+            if key not in unchanged and self.is_pooled_column(key, table[key])
+        ]
+        if previous is None:
+            pool_index = {}
+        elif to_pool:
+            if previous.pooled.isdisjoint(unchanged) or (
+                len(previous.strings) >= 2 * previous.pool_base_size
+            ):
+                pool_index = {}
+                unchanged.difference_update(previous.pooled)
+            else:
+                pool_index = dict(
+                    zip(previous.strings.tolist(), range(len(previous.strings)))
+                )
+                self.pool_base_size = previous.pool_base_size
+
+        if previous is not None and unchanged.issuperset(rate_keys + time_src_keys):
+            self.rates = previous.rates
+            self.time_src_codes = previous.time_src_codes
+        else:
+            self.build_rates(table, rate_keys, time_src_keys)
+
+        for key in self.keys:
+            if key in self.columns:
+                continue
+
+            if key in unchanged:
+                self.columns[key] = previous.columns[key]
+                if key in previous.pooled:
+                    self.pooled.add(key)
+            else:
+                self.add_column(key, table[key], pool_index)
+
+        if pool_index is None:
+            self.strings = previous.strings
+            self.pool_base_size = previous.pool_base_size
+        else:
+            self.strings = np.empty(len(pool_index), dtype=object)
+            self.strings[:] = list(pool_index)
+            if self.pool_base_size is None:
+                self.pool_base_size = len(self.strings)
+
+        for array in (self.rates, self.time_src_codes, self.strings):
+            array.flags.writeable = False
+        for array in self.columns.values():
+            array.flags.writeable = False
+
+    def build_rates(self, table, rate_keys, time_src_keys):
+        """
+        builds rates and time_src_codes, column major as the queries
+        work one dest column at a time
+        float, bool and string rate columns are left to add_column so
+        they read back as they were sent
+        """
+        rates = [int_column(table[key]) for key in rate_keys]
+        time_src_codes = [
+            encode_column(table[key], self.time_srcs) for key in time_src_keys
+        ]
+        self.rates = np.empty(
+            (self.num_rows, len(globals.DEST_NAMES)),
+            np.result_type(*rates),
+            order="F",
+        )
+        self.time_src_codes = np.empty(
+            self.rates.shape, get_code_dtype(self.time_srcs), order="F"
+        )
+        for dest_num, (rate_key, time_src_key) in enumerate(
+            zip(rate_keys, time_src_keys)
+        ):
+            self.rates[:, dest_num] = rates[dest_num]
+            self.time_src_codes[:, dest_num] = time_src_codes[dest_num]
+            self.columns[time_src_key] = self.time_src_codes[:, dest_num]
+            if is_int_column(table[rate_key]):
+                self.columns[rate_key] = self.rates[:, dest_num]
+
+    def is_pooled_column(self, key: str, values):
+        """
+        returns True if the column goes in the string pool
+        """
+        if key in self.categories:
+            return False
+
+        return key in POOLED_KEYS or not is_numeric_column(values)
+
+    def add_column(self, key: str, values, pool_index):
+        """
+        stores one column in its compact form, see __init__
+        """
+        if key in self.categories:
+            self.columns[key] = encode_column(values, self.categories[key])
+        elif self.is_pooled_column(key, values):
+            self.columns[key] = pool_column(values, pool_index)
+            self.pooled.add(key)
+        else:
+            self.columns[key] = compact_int_column(values)
+
+    def is_unchanged(self, key: str, values):
+        """
+        returns True if the raw column values hold the same values, of the
+        same kind, as the column key of this table
+        compares in one pass without encoding values
+        """
+        column = self.columns.get(key)
+        if column is None:
+            return False
+        if values is None:
+            # p4p gives None for empty numeric columns
+            return len(column) == 0 and key not in self.pooled
+        if len(values) != len(column):
+            return False
+
+        if key in self.pooled:
+            return self.strings[column].tolist() == list(values)
+        if key in self.categories:
+            categories = np.array(self.categories[key], dtype=object)
+            return categories[column].tolist() == list(values)
+
+        values = np.asarray(values)
+        if get_kind(values) != get_kind(column):
+            return False
+
+        return np.array_equal(values, column)
+
+    def __getitem__(self, key):
+        """
+        returns the column with strings decoded
+        """
+        column = self.columns[key]
+        if key in self.pooled:
+            return self.strings[column]
+        if key in self.categories:
+            return np.array(self.categories[key], dtype=object)[column]
+
+        return column
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_row(self, row_num: int):
+        """
+        returns a column name -> value dictionary of one row
+        """
+        row = {}
+        for key in self.keys:
+            value = self.columns[key][row_num]
+            if key in self.pooled:
+                row[key] = self.strings[value]
+            elif key in self.categories:
+                row[key] = self.categories[key][value]
+            else:
+                row[key] = value.item()
+
+        return row
+
+    def get_memory_footprint(self):
+        """
+        returns a dictionary of the bytes used by each column,
+        by the string pool ("string_pool", the str objects included)
+        and by all of it ("total")
+        """
+        footprint = {key: self.columns[key].nbytes for key in self.keys}
+        footprint["string_pool"] = self.strings.nbytes + sum(
+            sys.getsizeof(string) for string in self.strings.tolist()
+        )
+        footprint["total"] = sum(footprint.values())
+        return footprint
+
+
+def is_numeric_column(values):
+    """
+    returns True if the column holds numbers
+    """
+    if values is None:
+        # p4p gives None for empty numeric columns
+        return True
+
+    return np.asarray(values).dtype.kind in "biuf"
+
+
+def get_kind(values):
+    """
+    returns the kind of a numeric array, "i" for any integer
+    """
+    kind = values.dtype.kind
+    if kind == "u":
+        return "i"
+
+    return kind
+
+
+def is_int_column(values):
+    """
+    returns True if the column holds integers, bool is not one
+    """
+    if values is None:
+        return True
+
+    return np.asarray(values).dtype.kind in "iu"
+
+
+def int_column(values):
+    """
+    returns the column as an int array, truncating like int()
+    int32 unless a value does not fit
+    """
+    if values is None:
+        # p4p gives None for empty numeric columns
+        return np.empty(0, dtype=np.int32)
+
+    values = np.asarray(values)
+    if values.dtype.kind not in "biuf":
+        values = np.array([int(value) for value in values.tolist()])
+    if values.dtype.kind == "f":
+        values = np.trunc(values)
+
+    return narrow_int_column(values, RATE_DTYPES)
+
+
+def narrow_int_column(values, dtypes):
+    """
+    returns the values as the first of dtypes that holds all of them
+    """
+    low, high = (values.min(), values.max()) if len(values) else (0, 0)
+    for dtype in dtypes:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+
+    raise OverflowError(f"values {low} to {high} do not fit in {dtypes[-1]}")
+
+
+def compact_int_column(values):
+    """
+    returns an integer column as the smallest int array that holds it,
+    other numeric columns, bool included, are returned as they are
+    """
+    if values is None:
+        return np.empty(0, dtype=np.int8)
+
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int8)
+    if values.dtype.kind not in "iu":
+        return values.copy()
+    if values.dtype.kind == "u" and values.max() > np.iinfo(np.int64).max:
+        return values.copy()
+
+    return narrow_int_column(values, INT_DTYPES)
+
+
+def get_code_dtype(categories):
+    """
+    returns the smallest int type that indexes every category
+    """
+    for dtype in INT_DTYPES:
+        if len(categories) <= np.iinfo(dtype).max + 1:
+            return dtype
+
+
+def encode_column(values, categories):
+    """
+    returns the column as an array of indexes into categories
+    values not already in categories are appended to it
+    the indexes are int8, or wider when there are too many categories
+    """
+    if values is None or len(values) == 0:
+        return np.empty(0, dtype=get_code_dtype(categories))
+
+    values = list(values)
+    categories.extend(sorted(set(values).difference(categories), key=str))
+    codes = {value: code for code, value in enumerate(categories)}
+
+    return np.fromiter(
+        map(codes.__getitem__, values), get_code_dtype(categories), count=len(values)
+    )
+
+
+def pool_column(values, pool_index):
+    """
+    returns a string column as int32 indexes into the string pool
+    pool_index is string -> index, new strings are interned and added to it
+    """
+    if values is None:
+        return np.empty(0, dtype=np.int32)
+
+    values = list(map(str, values))
+    # new strings are added in the order they first show up
+    for value in dict.fromkeys(values):
+        if value not in pool_index:
+            pool_index[sys.intern(value)] = len(pool_index)
+
+    return np.fromiter(map(pool_index.__getitem__, values), np.int32, count=len(values))
@@ -0,0 +1,446 @@
+"""
+connection_pool.py
+
+Contains ConnectionPool, the process wide pool of the PVA context, the
+pattern NTTable monitors and the CA readbacks, and PatternTableMonitor,
+the one monitor and snapshot of a pattern NTTable shared by every
+ScPatternSelect on the same TPG
+there is one pool per transport, see get_connection_pool
+"""
+
+import time
+import weakref
+import threading
+from .pattern_table import PatternTableSnapshot
+from .table_cache import PatternTableCacheWriter
+from .stats import network_stats
+from .transport import EpicsTransport
+
+
+class PatternTableMonitor:
+    def __init__(self, patt_table_name: str, pva):
+        """
+        monitors one pattern NTTable and builds its snapshot once for
+        every subscribed ScPatternSelect, get one from ConnectionPool
+
+        input
+        -------
+        patt_table_name:
+            globals.get_patt_table_name() of the TPG
+        pva:
+            the p4p.client.thread.Context to monitor on,
+            or the context of another transport
+        """
+        self.patt_table_name = patt_table_name
+        # TPG:{system}:{unit}, what network_stats records it under
+        self.tpg = patt_table_name.rsplit(":", 1)[0]
+        self.pva = pva
+        self.patt_table_version = 0
+        self.patt_table_snapshot = None
+        # timeStamp of the table the snapshot was built from
+        self.patt_table_timestamp = None
+        self.is_patt_table_live = False
+        # the subscribers were told the table is unavailable
+        self.is_patt_table_down = False
+        # reentrant, a garbage collected subscriber can be released by
+        # gc on a thread already holding it
+        self.lock = threading.RLock()
+        # weak, an instance that is never closed is still freed
+        self.subscribers = weakref.WeakSet()
+        # cache file path -> PatternTableCacheWriter, one writer per file
+        # however many subscribers use it
+        self.cache_writers = {}
+        self.patt_table_sub = self.pva.monitor(
+            patt_table_name, self.patt_table_callback, notify_disconnect=True
+        )
+
+    def add_subscriber(self, patt_sel):
+        """
+        adds a ScPatternSelect to pass new snapshots to
+        it gets the current snapshot right away if there is one
+        """
+        with self.lock:
+            self.subscribers.add(patt_sel)
+            patt_table_snapshot = self.patt_table_snapshot
+            if not self.is_patt_table_live:
+                return
+
+        patt_sel.install_patt_table_snapshot(patt_table_snapshot)
+
+    def add_cache(self, patt_table_cache, timestamp=None):
+        """
+        writes each new table to patt_table_cache from now on
+        subscribers with the same cache file share its writer
+
+        input
+        -------
+        patt_table_cache:
+            the PatternTableCache of a subscriber
+        timestamp:
+            timestamp of the table already in the file
+        """
+        with self.lock:
+            if patt_table_cache.path not in self.cache_writers:
+                self.cache_writers[patt_table_cache.path] = PatternTableCacheWriter(
+                    patt_table_cache, timestamp
+                )
+
+    def remove_subscriber(self, patt_sel=None):
+        """
+        stops passing snapshots to patt_sel
+        returns the number of subscribers left
+
+        input
+        -------
+        patt_sel:
+            None: only count, garbage collected subscribers are
+            already gone
+        """
+        with self.lock:
+            if patt_sel is not None:
+                self.subscribers.discard(patt_sel)
+            return self.get_num_subscribers()
+
+    def get_num_subscribers(self):
+        # only the live ones, a dying subscriber can still be in the set
+        # while its finalizer runs
+        return len(list(self.subscribers))
+
+    def patt_table_callback(self, value):
+        """
+        monitor callback for the pattern NTTable
+        uses the table delivered by the monitor,
+        only falls back to a get on disconnect or error
+        an update that did not change the table is dropped before its
+        columns are read, see is_table_changed
+        """
+        if isinstance(value, Exception):
+            from p4p.client.thread import Cancelled
+
+            if isinstance(value, Cancelled):
+                return
+
+            # the monitor reports a disconnect before the first connection
+            # ScPatternSelect.__init__ does its own get for that case
+            if self.is_patt_table_live:
+                network_stats.record(self.tpg, "pva_monitor", outcome="error")
+                print(f"Pattern NTTable monitor: {value!r}")
+                self.get_pattern_table()
+            return
+
+        if not self.is_table_changed(value):
+            return
+
+        self.set_pattern_table(value)
+
+    def is_table_changed(self, patt_table):
+        """
+        returns False if patt_table holds the same table as the snapshot,
+        see is_table_changed
+        always True while the subscribers think the table is unavailable
+        """
+        with self.lock:
+            if self.patt_table_snapshot is None or self.is_patt_table_down:
+                return True
+            patt_table_timestamp = self.patt_table_timestamp
+
+        return is_table_changed(patt_table, patt_table_timestamp)
+
+    def get_pattern_table(self, timeout: float = 0.5):
+        """
+        gets the pattern NTTable with a blocking get
+        the monitor keeps it up to date after this
+
+        output
+        -------
+        True
+            the table was received
+        False
+            timed out, the subscribers are told the table is unavailable
+        """
+        start = time.perf_counter()
+        try:
+            patt_table = self.pva.get(self.patt_table_name, timeout=timeout)
+        except TimeoutError as err:
+            network_stats.record(
+                self.tpg, "pva_get_table", time.perf_counter() - start, "timeout"
+            )
+            with self.lock:
+                self.is_patt_table_down = True
+                subscribers = list(self.subscribers)
+            for patt_sel in subscribers:
+                patt_sel.set_patt_table_unavailable()
+            print(str(err))
+            print(
+                "The pattern NTTable is not available right not.  Will connect when it is available"
+            )
+            return False
+
+        network_stats.record(self.tpg, "pva_get_table", time.perf_counter() - start)
+        print("Pattern Connected")
+        self.set_pattern_table(patt_table)
+        return True
+
+    def set_pattern_table(self, patt_table):
+        """
+        builds the snapshot of a new pattern NTTable value and passes
+        the same snapshot to every subscriber
+        the table is written to the caches on the writers' threads
+        """
+        start = time.perf_counter()
+        with self.lock:
+            patt_table_version = self.patt_table_version + 1
+            patt_table_snapshot = PatternTableSnapshot(
+                patt_table["value"],
+                patt_table_version,
+                previous=self.patt_table_snapshot,
+            )
+            network_stats.record_table_update(self.tpg, time.perf_counter() - start)
+
+            self.is_patt_table_live = True
+            self.is_patt_table_down = False
+            self.patt_table_version = patt_table_version
+            self.patt_table_snapshot = patt_table_snapshot
+            patt_table_timestamp = get_patt_table_timestamp(patt_table)
+            self.patt_table_timestamp = patt_table_timestamp
+            subscribers = list(self.subscribers)
+            cache_writers = list(self.cache_writers.values())
+
+        for patt_sel in subscribers:
+            patt_sel.install_patt_table_snapshot(patt_table_snapshot)
+
+        for cache_writer in cache_writers:
+            cache_writer.write(patt_table["value"], patt_table_timestamp)
+
+    def close(self):
+        """
+        closes the monitor
+        """
+        self.patt_table_sub.close()
+
+
+class ConnectionPool:
+    def __init__(self, transport=None):
+        """
+        reference counted connections shared by every ScPatternSelect
+        in the process, use the module level connection_pool or
+        get_connection_pool
+
+        transport
+            opens the connections, see transport.py,
+            None: EpicsTransport
+        pva
+            one context of the transport, open while anything uses it
+        patt_table_monitors
+            patt table name -> PatternTableMonitor
+        readbacks
+            PV name -> MonitoredReadback
+
+        every acquire is paired with a release, the connection is closed
+        when the last user releases it
+        """
+        if transport is None:
+            transport = EpicsTransport()
+        self.transport = transport
+        # reentrant, see release_connections
+        self.lock = threading.RLock()
+        self.pva = None
+        self.pva_refs = 0
+        self.patt_table_monitors = {}
+        self.readbacks = {}
+        # name -> number of users, for the monitors and readbacks
+        self.refs = {}
+
+    def acquire_context(self):
+        """
+        returns the shared context of the transport
+        """
+        with self.lock:
+            return self._acquire_context()
+
+    def _acquire_context(self):
+        if self.pva is None:
+            self.pva = self.transport.open_context()
+
+        self.pva_refs += 1
+        return self.pva
+
+    def release_context(self):
+        """
+        closes the shared context once nothing uses it
+        """
+        with self.lock:
+            self._release_context()
+
+    def _release_context(self):
+        self.pva_refs -= 1
+        if self.pva_refs == 0:
+            self.pva.close()
+            self.pva = None
+
+    def acquire_patt_table_monitor(
+        self, patt_table_name: str, patt_sel, patt_table_cache=None
+    ):
+        """
+        returns the PatternTableMonitor of patt_table_name with
+        patt_sel subscribed to it, the monitor is opened on first use
+        patt_table_cache: the PatternTableCache of patt_sel, or None,
+        see PatternTableMonitor.add_cache
+        """
+        with self.lock:
+            monitor = self.patt_table_monitors.get(patt_table_name)
+            if monitor is None:
+                monitor = PatternTableMonitor(patt_table_name, self._acquire_context())
+                self.patt_table_monitors[patt_table_name] = monitor
+            if patt_table_cache is not None:
+                monitor.add_cache(patt_table_cache, patt_sel.patt_table_cache_timestamp)
+
+        # outside the pool lock, this can install a snapshot
+        monitor.add_subscriber(patt_sel)
+        return monitor
+
+    def release_patt_table_monitor(self, patt_table_name: str, patt_sel=None):
+        """
+        unsubscribes patt_sel, the monitor is closed once nothing uses it
+        patt_sel None: the subscriber was garbage collected
+        """
+        with self.lock:
+            monitor = self.patt_table_monitors.get(patt_table_name)
+            if monitor is None:
+                return
+
+            if monitor.remove_subscriber(patt_sel) > 0:
+                return
+
+            del self.patt_table_monitors[patt_table_name]
+            monitor.close()
+            self._release_context()
+
+    def acquire_readback(self, pvname: str):
+        """
+        returns the MonitoredReadback of pvname, subscribed on first use
+        """
+        with self.lock:
+            readback = self.readbacks.get(pvname)
+            if readback is None:
+                readback = self.transport.open_readback(pvname)
+                self.readbacks[pvname] = readback
+            self.refs[pvname] = self.refs.get(pvname, 0) + 1
+
+        return readback
+
+    def release_readback(self, pvname: str):
+        """
+        closes the readback of pvname once nothing uses it
+        """
+        with self.lock:
+            if pvname not in self.readbacks:
+                return
+
+            self.refs[pvname] -= 1
+            if self.refs[pvname] > 0:
+                return
+
+            del self.refs[pvname]
+            self.readbacks.pop(pvname).close()
+
+    def get_ref_counts(self):
+        """
+        returns a dictionary of the number of users of the context,
+        each pattern table monitor and each readback
+        """
+        with self.lock:
+            ref_counts = {"pva": self.pva_refs}
+            for patt_table_name, monitor in self.patt_table_monitors.items():
+                ref_counts[patt_table_name] = monitor.get_num_subscribers()
+            ref_counts.update(self.refs)
+
+        return ref_counts
+
+
+def is_table_changed(patt_table, patt_table_timestamp):
+    """
+    returns False if patt_table holds the table with patt_table_timestamp,
+    checked without reading the columns
+        the monitor update changed no field of "value", pvAccess only
+        sends the fields that changed, p4p marks them in changedSet
+        or the timeStamp is patt_table_timestamp
+    a table without a timeStamp is always changed
+    """
+    changed_set = getattr(patt_table, "changedSet", None)
+    if changed_set is not None and not any(
+        field == "value" or field.startswith("value.") for field in changed_set()
+    ):
+        return False
+
+    timestamp = get_patt_table_timestamp(patt_table)
+    return timestamp is None or timestamp != patt_table_timestamp
+
+
+def get_patt_table_timestamp(patt_table):
+    """
+    returns (secondsPastEpoch, nanoseconds, userTag) of a pattern NTTable
+    value, or None if the server does not set the timeStamp
+    """
+    if "timeStamp" not in patt_table:
+        return None
+
+    time_stamp = patt_table["timeStamp"]
+    if time_stamp["secondsPastEpoch"] == 0:
+        return None
+
+    return (
+        time_stamp["secondsPastEpoch"],
+        time_stamp["nanoseconds"],
+        time_stamp["userTag"],
+    )
+
+
+def release_connections(pool, patt_table_name, readbacks, readbacks_lock):
+    """
+    releases what one ScPatternSelect acquired from pool, run by its
+    close or, if it is never closed, when it is garbage collected
+    holds no reference to the instance so it can still be collected
+
+    input
+    -------
+    patt_table_name:
+        the pattern table monitor to release, None: no monitor
+    readbacks:
+        PV name -> MonitoredReadback of the instance, emptied here
+    """
+    if patt_table_name is not None:
+        pool.release_patt_table_monitor(patt_table_name)
+
+    with readbacks_lock:
+        pvnames = list(readbacks)
+        readbacks.clear()
+    for pvname in pvnames:
+        pool.release_readback(pvname)
+
+
+connection_pool = ConnectionPool()
+# transport -> ConnectionPool, for the transports passed to ScPatternSelect
+# the instances hold their pool, an entry goes away with the last one
+# so a transport that is no longer used is freed, weak keys would not
+# do that since the pool holds its transport
+connection_pools = weakref.WeakValueDictionary()
+connection_pools_lock = threading.Lock()
+
+
+def get_connection_pool(transport=None):
+    """
+    returns the process wide ConnectionPool of transport,
+    None: connection_pool, the EPICS one
+    the pool is shared while anything holds it, keep the returned pool
+    """
+    if transport is None:
+        return connection_pool
+
+    with connection_pools_lock:
+        pool = connection_pools.get(transport)
+        if pool is None:
+            pool = ConnectionPool(transport)
+            connection_pools[transport] = pool
+
+    return pool
@@ -5,6 +5,10 @@ Contains globals class with references to constants, pvs, and paths used in mult
 """
 
 import os
+import re
+
+# characters allowed in an EPICS record name, and the .FIELD after it
+PV_NAME_PATTERN = re.compile(r"[A-Za-z0-9_\-:;<>\[\]]+(\.[A-Z0-9]+)?")
 
 # Available destination names
 # (should check against PVs when loading to confirm up-to-date)
@@ -15,12 +19,20 @@ class globals:
         self.system = system
         self.unit = unit
         self.ioc = ioc
+        # every pv name is built and checked once here, the get_*_pv
+        # functions look them up
+        self.pvs = self.build_pvs()
+        self.dest_pvs = [
+            self.build_dest_pvs(dest_num) for dest_num in self.DEST_NUMS.values()
+        ]
 
     """
     returns list of dest names, most have SC_ as a prefix
     """
     DEST_NAMES = ["LASER", "SC_DIAG0", "SC_BSYD", "SC_HXR", "SC_SXR", "SC_DASEL"]
 
+    DEST_NUMS = {dest: dest_num for dest_num, dest in enumerate(DEST_NAMES)}
+
     TYPE_DICT = {"AC": "AC", "fixed_rate": "FR", "burst": "B", "AC_burst": "ACB"}
 
     TIME_SRCS = ["AC", "FR", "B", "ACB"]
@@ -111,69 +123,140 @@ class globals:
         "SC19",
     ]
 
+    def build_pvs(self):
+        """
+        returns a dictionary of every per TPG pv name
+        """
+        tpg_base = f"TPG:{self.system.upper()}:{self.unit}"
+        pvs = {
+            "tpg_base": tpg_base,
+            "patt_table": f"{tpg_base}:PATTERNS",
+            "patt_table_heartbeat": f"{tpg_base}:PATTERNS_HEARTBEAT",
+            "mode_table": f"{tpg_base}:MODE_FREQ_MAX",
+            "tag_table": f"{tpg_base}:TAGS",
+            "mode": f"{tpg_base}:MODE",
+            "path_set": f"{tpg_base}:MANUAL_PATH",
+            "load": f"{tpg_base}:MANUAL_LOAD",
+            "apply": f"{tpg_base}:APPLY",
+            "pattern_loaded": f"{tpg_base}:PATT_PATH_LOADED",
+            "pattern_running": f"{tpg_base}:PATT_PATH_APPLIED",
+            "beam_stop": f"{tpg_base}:TPG_BEAM_OFF",
+            "tpg_bc_reset": f"{tpg_base}:TPG_BC_RESET",
+        }
+        pvs["beam_stop_proc"] = f"{pvs['beam_stop']}.PROC"
+        pvs["tpg_bc_reset_proc"] = f"{pvs['tpg_bc_reset']}.PROC"
+        for pv in pvs.values():
+            assert_pv_name(pv)
+
+        return pvs
+
+    def build_dest_pvs(self, dest_num: int):
+        """
+        returns a dictionary of the timing readback pv names of a destination
+        """
+        dest_base = f"TPG:{self.system}:{self.unit}:DST0{dest_num}"
+        dest_pvs = {
+            "time_src": f"{dest_base}:TIME_SRC",
+            "offset": f"{dest_base}:OFFSET_RBV",
+            "timeslot": f"{dest_base}:TS",
+            "timeslot_mask": f"{dest_base}:TSMASK",
+        }
+        for pv in dest_pvs.values():
+            assert_pv_name(pv)
+
+        return dest_pvs
+
+    def get_dest_num(self, dest):
+        """
+        returns the number of a destination given by name or number
+        """
+        if type(dest) is str:
+            if dest not in self.DEST_NUMS:
+                raise ValueError(f"dest must be in {self.DEST_NAMES}, was {dest}")
+            return self.DEST_NUMS[dest]
+
+        if dest not in range(len(self.DEST_NAMES)):
+            raise ValueError(
+                f"dest must be in range 0-{len(self.DEST_NAMES) - 1}, was {dest}"
+            )
+        return dest
+
+    def get_ca_pvs(self):
+        """
+        returns the channel access pvs that are put to or read when
+        loading and applying patterns and stopping the beam
+        """
+        return [
+            self.pvs[name]
+            for name in (
+                "path_set",
+                "load",
+                "apply",
+                "pattern_loaded",
+                "pattern_running",
+                "beam_stop_proc",
+                "tpg_bc_reset_proc",
+            )
+        ]
+
     def get_tpg_base_pv(self):
         """
         returs based tpg pv with system and unit generalized
         TPG:{system}:{unit}
         """
-        return f"TPG:{self.system.upper()}:{self.unit}"
+        return self.pvs["tpg_base"]
 
     def get_patt_table_name(self):
         """
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:PATTERNS
         """
-        return f"{self.get_tpg_base_pv()}:PATTERNS"
+        return self.pvs["patt_table"]
 
     def get_patt_table_heartbeat_pv(self):
         """
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:HEARTBEAT
         """
-        return f"{self.get_tpg_base_pv()}:PATTERNS_HEARTBEAT"
+        return self.pvs["patt_table_heartbeat"]
 
     def get_mode_table_name(self):
         """
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:MODE_FREQ_MAX
         """
-        return f"{self.get_tpg_base_pv()}:MODE_FREQ_MAX"
+        return self.pvs["mode_table"]
 
     def get_tag_table_name(self):
         """
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:MODE_FREQ_MAX
         """
-        return f"{self.get_tpg_base_pv()}:TAGS"
+        return self.pvs["tag_table"]
 
     # TODO: move assert dest into here so it can be used :)
     def get_timeing_source_pv(self, dest):
         """"""
-        if type(dest) is str:
-            dest = self.DEST_NAMES.index(dest)
-        pv = f"TPG:{self.system}:{self.unit}:DST0{dest}:TIME_SRC"
-        return pv
+        return self.dest_pvs[self.get_dest_num(dest)]["time_src"]
 
     def get_offset_pv(self, dest):
         """"""
-        if type(dest) is str:
-            dest = self.DEST_NAMES.index(dest)
-        pv = f"TPG:{self.system}:{self.unit}:DST0{dest}:OFFSET_RBV"
-        return pv
+        return self.dest_pvs[self.get_dest_num(dest)]["offset"]
 
     def get_dest_timeslot_pv(self, dest):
         """"""
-        if type(dest) is str:
-            dest = self.DEST_NAMES.index(dest)
-        pv = f"TPG:{self.system}:{self.unit}:DST0{dest}:TS"
-        return pv
+        return self.dest_pvs[self.get_dest_num(dest)]["timeslot"]
 
     def get_dest_timeslot_mask_pv(self, dest):
         """"""
-        if type(dest) is str:
-            dest = self.DEST_NAMES.index(dest)
-        pv = f"TPG:{self.system}:{self.unit}:DST0{dest}:TSMASK"
-        return pv
+        return self.dest_pvs[self.get_dest_num(dest)]["timeslot_mask"]
+
+    def get_dest_pvs(self, dest):
+        """
+        returns a dictionary of the timing readback pvs of a destination
+        time_src, offset, timeslot, timeslot_mask -> pv
+        """
+        return dict(self.dest_pvs[self.get_dest_num(dest)])
 
     def get_timing_sources(self, contains_any_timing_source=False):
         """
@@ -190,7 +273,7 @@ class globals:
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:MODE
         """
-        return f"{self.get_tpg_base_pv()}:MODE"
+        return self.pvs["mode"]
 
     def get_path_set_pv(self):
         """
@@ -198,7 +281,7 @@ class globals:
         TPG:{system}:{unit}:PATT_PATH
         """
         # return f"{self.get_tpg_base_pv()}:PATT_PATH_SET"
-        return f"{self.get_tpg_base_pv()}:MANUAL_PATH"
+        return self.pvs["path_set"]
 
     def get_load_pv(self):
         """
@@ -206,28 +289,28 @@ class globals:
         TPG:{system}:{unit}:PATT_LOAD_SET
         """
         # return f"{self.get_tpg_base_pv()}:PATT_LOAD"
-        return f"{self.get_tpg_base_pv()}:MANUAL_LOAD"
+        return self.pvs["load"]
 
     def get_apply_pv(self):
         """
         returns the pattern table name with system and unit generalized
         TPG:{system}:{unit}:APPLY
         """
-        return f"{self.get_tpg_base_pv()}:APPLY"
+        return self.pvs["apply"]
 
     def get_pattern_loaded_pv(self):
         """
         returns the pv with the pattern loaded to the TPG
         Only Read from this PV
         """
-        return f"{self.get_tpg_base_pv()}:PATT_PATH_LOADED"
+        return self.pvs["pattern_loaded"]
 
     def get_pattern_running_pv(self):
         """
         returns the pv with the readback of the running pattern relitive path
         Only Read from this PV
         """
-        return f"{self.get_tpg_base_pv()}:PATT_PATH_APPLIED"
+        return self.pvs["pattern_running"]
 
     def get_TpgPatternSetup_top(self):
         """
@@ -287,8 +370,27 @@ class globals:
 
     def get_beam_stop_pv(self):
         """"""
-        return f"{self.get_tpg_base_pv}:TPG_BEAM_OFF"
+        return self.pvs["beam_stop"]
 
     def get_tpg_bc_reset_pv(self):
         """"""
-        return f"{self.get_tpg_base_pv}:TPG_BC_RESET"
+        return self.pvs["tpg_bc_reset"]
+
+    def get_beam_stop_proc_pv(self):
+        """
+        returns the pv that is put to to stop the beam
+        """
+        return self.pvs["beam_stop_proc"]
+
+    def get_tpg_bc_reset_proc_pv(self):
+        """
+        returns the pv that is put to to reset the tpg beam classes
+        """
+        return self.pvs["tpg_bc_reset_proc"]
+
+
+def assert_pv_name(pv: str):
+    """
+    asserts that pv is a valid pv name
+    """
+    assert PV_NAME_PATTERN.fullmatch(pv), f"invalid pv name {pv!r}"
@@ -0,0 +1,655 @@
+"""
+pattern_table.py
+
+Contains PatternTableSnapshot, a read only columnar copy of the pattern NTTable
+built once per table update so queries do not touch the p4p Value cell by cell
+"""
+
+import sys
+import numpy as np
+from .globals import globals
+from .compact_table import CompactPatternTable
+from .table_diff import PatternTableDiff, first_rows
+
+# changed rate keys looked up one table scan each, past this many
+# one sort of the whole table is faster
+RATE_KEY_SCAN_LIMIT = 64
+# tables up to this many rows are scanned by the nearest pattern search,
+# visiting the rows one rate at a time costs more than it saves
+NEAREST_SCAN_ROWS = 16384
+
+
+class PatternTableSnapshot:
+    def __init__(self, table, version: int = 0, previous=None):
+        """
+        table
+            the "value" structure of the pattern NTTable,
+            or any mapping of column name -> column values
+        version
+            table version counter of the owner, bumped for every new table
+        previous
+            the snapshot of the last table, if given the tables are diffed
+            and the indexes are updated for only the rows that changed
+            when no rows were removed or moved
+        """
+        # the table is copied, nothing holds on to the p4p Value
+        # columns that did not change are shared with the previous table
+        previous_table = previous.table if previous is not None else None
+        self.table = CompactPatternTable(table, previous_table)
+        self.version = version
+        self.rate_spaces = {}
+        self.rate_groups = None
+
+        columns = self.table.columns
+        self.num_rows = self.table.num_rows
+        self.time_srcs = self.table.time_srcs
+        # one column per globals.DEST_NAMES entry
+        self.rates = self.table.rates
+        self.time_src_codes = self.table.time_src_codes
+
+        # interned strings from the string pool
+        if previous is not None and (
+            columns["PATTERN_NAME"] is previous_table.columns["PATTERN_NAME"]
+        ):
+            self.names = previous.names
+        else:
+            self.names = self.table["PATTERN_NAME"]
+
+        if previous is not None and (
+            columns["IS_VERIFIED"] is previous_table.columns["IS_VERIFIED"]
+        ):
+            self.verified = previous.verified
+            self.unverified = previous.unverified
+        else:
+            is_verified = columns["IS_VERIFIED"]
+            verified_categories = self.table.categories["IS_VERIFIED"]
+            self.verified = is_verified == verified_categories.index("True")
+            self.unverified = is_verified == verified_categories.index("False")
+
+        if previous is not None and self.time_src_codes is previous.time_src_codes:
+            self.rate_time_src_codes = previous.rate_time_src_codes
+        else:
+            # get_pattern_name_by_rate treats a timing source of 'None' as 'FR'
+            self.rate_time_src_codes = np.asfortranarray(
+                np.where(
+                    self.time_src_codes == self.time_srcs.index("None"),
+                    self.time_srcs.index("FR"),
+                    self.time_src_codes,
+                ),
+                dtype=self.time_src_codes.dtype,
+            )
+        if previous is not None and self.rates is previous.rates:
+            self.rate_spaces = dict(previous.rate_spaces)
+            self.rate_groups = previous.rate_groups
+
+        for array in (
+            self.names,
+            self.verified,
+            self.unverified,
+            self.rate_time_src_codes,
+        ):
+            array.flags.writeable = False
+
+        self.diff = None
+        if previous is not None:
+            self.diff = PatternTableDiff(previous, self)
+
+        if self.diff is not None and self.diff.is_append_only:
+            self.name_index = self.update_name_index(previous)
+            self.rate_index = self.update_rate_index(previous)
+            self.available_rates, self.available_rate_strs = (
+                self.update_available_rates(previous)
+            )
+        else:
+            self.name_index = self.build_name_index()
+            self.rate_index = self.build_rate_index()
+            self.available_rates, self.available_rate_strs = (
+                self.build_available_rates()
+            )
+
+    def get_memory_footprint(self):
+        """
+        returns a dictionary of the bytes used by the snapshot
+        "table" is the total of CompactPatternTable.get_memory_footprint,
+        the query arrays are counted on their own and the indexes shallow,
+        their keys and names are shared with the table
+        """
+        footprint = {"table": self.table.get_memory_footprint()["total"]}
+        footprint["query_arrays"] = sum(
+            array.nbytes
+            for array in (
+                self.names,
+                self.verified,
+                self.unverified,
+                self.rate_time_src_codes,
+                *self.rate_spaces.values(),
+                *(
+                    array
+                    for rate_group in self.rate_groups or ()
+                    for array in rate_group
+                ),
+            )
+        )
+        footprint["indexes"] = sum(
+            sys.getsizeof(index)
+            for index in (
+                self.name_index,
+                self.rate_index,
+                self.available_rates,
+                self.available_rate_strs,
+            )
+        )
+        footprint["total"] = sum(footprint.values())
+        return footprint
+
+    def build_name_index(self):
+        """
+        returns a pattern name -> row number dictionary
+        if a name shows up more than once the first row wins
+        """
+        return first_rows(self.names.tolist())
+
+    def update_name_index(self, previous):
+        """
+        returns the name index of the previous snapshot with the appended rows
+        only valid when self.diff.is_append_only
+        """
+        if len(self.diff.appended_rows) == 0:
+            return previous.name_index
+
+        name_index = dict(previous.name_index)
+        for row_num in self.diff.appended_rows.tolist():
+            name_index.setdefault(self.names[row_num], row_num)
+
+        return name_index
+
+    def build_rate_index(self):
+        """
+        returns a rate key -> pattern name dictionary
+
+        keys are of the form made by ScPatternSelect.get_patt_rate_key
+        (((diag0_rate, diag0_time_src), ..., (dasel_rate, dasel_time_src)), "True")
+        if more than one pattern has the same key the first row wins
+        rows with an IS_VERIFIED other than "True" or "False" are left out
+        """
+        rows, patt_rate_keys = self.get_rate_keys(np.arange(self.num_rows))
+        names = self.names[rows].tolist()
+
+        # reversed so the first row with a key wins
+        return dict(zip(reversed(patt_rate_keys), reversed(names)))
+
+    def update_rate_index(self, previous):
+        """
+        returns the rate index of the previous snapshot with the
+        appended and changed rows applied
+        only valid when self.diff.is_append_only
+        """
+        rate_changed_rows = self.diff.rate_changed_rows.tolist()
+        appended_rows = self.diff.appended_rows.tolist()
+        if not (rate_changed_rows or appended_rows):
+            return previous.rate_index
+        if 2 * len(rate_changed_rows) > self.num_rows:
+            # the keys of the old and new rows cost more than a rebuild
+            return self.build_rate_index()
+
+        rate_index = dict(previous.rate_index)
+
+        # the first row with a key wins, so recheck every key a changed row
+        # had or has against the whole table
+        old_rows, old_keys = previous.get_rate_keys(rate_changed_rows)
+        new_rows, new_keys = self.get_rate_keys(rate_changed_rows)
+        rate_keys = old_keys + new_keys
+        if len(rate_keys) <= RATE_KEY_SCAN_LIMIT:
+            row_nums = [self.find_rate_key_row(key) for key in rate_keys]
+        else:
+            # too many keys to scan for one by one, find them all in one pass
+            key_codes = np.concatenate(
+                (
+                    previous.get_rate_key_codes(old_rows),
+                    self.get_rate_key_codes(new_rows),
+                )
+            )
+            row_nums = [
+                None if row_num < 0 else row_num
+                for row_num in self.find_rate_key_rows(key_codes).tolist()
+            ]
+
+        for patt_rate_key, row_num in zip(rate_keys, row_nums):
+            if row_num is None:
+                rate_index.pop(patt_rate_key, None)
+            else:
+                rate_index[patt_rate_key] = self.names[row_num]
+
+        # appended rows come after every old row
+        for row_num, patt_rate_key in zip(*self.get_rate_keys(appended_rows)):
+            rate_index.setdefault(patt_rate_key, self.names[row_num])
+
+        return rate_index
+
+    def get_rate_keys(self, rows):
+        """
+        returns the row numbers and rate keys of the given rows
+        rows with an IS_VERIFIED other than "True" or "False" are skipped
+        """
+        rows = np.asarray(rows, dtype=int)
+        rows = rows[self.verified[rows] | self.unverified[rows]]
+
+        time_srcs = np.array(self.time_srcs, dtype=object)
+        dest_rates = self.rates[rows, 1:].tolist()
+        dest_time_srcs = time_srcs[self.rate_time_src_codes[rows, 1:]].tolist()
+        is_verified = np.where(self.verified[rows], "True", "False").tolist()
+
+        patt_rate_keys = [
+            (tuple(zip(row_rates, row_time_srcs)), row_is_verified)
+            for row_rates, row_time_srcs, row_is_verified in zip(
+                dest_rates, dest_time_srcs, is_verified
+            )
+        ]
+
+        return rows.tolist(), patt_rate_keys
+
+    def get_rate_key_codes(self, rows):
+        """
+        returns the rate keys of the given rows as one array of equal
+        sized byte strings, equal keys have equal codes
+        the rows must have an IS_VERIFIED of "True" or "False"
+        """
+        key_columns = np.column_stack(
+            (
+                self.verified[rows],
+                self.rates[rows, 1:],
+                self.rate_time_src_codes[rows, 1:],
+            )
+        ).astype(np.int64)
+
+        return key_columns.view(
+            np.dtype((np.void, key_columns.itemsize * key_columns.shape[1]))
+        ).ravel()
+
+    def find_rate_key_rows(self, key_codes):
+        """
+        returns the first row number matching each of the rate key codes,
+        -1 where none does, in one pass over the table
+        """
+        rows = np.flatnonzero(self.verified | self.unverified)
+        # the index of the first row with each code
+        codes, first = np.unique(self.get_rate_key_codes(rows), return_index=True)
+        if len(codes) == 0:
+            return np.full(len(key_codes), -1)
+
+        positions = np.searchsorted(codes, key_codes).clip(max=len(codes) - 1)
+        return np.where(codes[positions] == key_codes, rows[first[positions]], -1)
+
+    def find_rate_key_row(self, patt_rate_key):
+        """
+        returns the first row number matching the rate key, or None
+        """
+        dest_rates, is_verified = patt_rate_key
+        if is_verified == "True":
+            mask = self.verified.copy()
+        else:
+            mask = self.unverified.copy()
+
+        for dest_num, (rate, time_source) in enumerate(dest_rates, start=1):
+            mask &= self.rates[:, dest_num] == rate
+            mask &= self.rate_time_src_codes[:, dest_num] == self.time_srcs.index(
+                time_source
+            )
+
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            return None
+
+        return int(rows[0])
+
+    def get_rate_space(self, metric):
+        """
+        returns the rates to dests 1-5 as a float array in the space
+        the nearest pattern search measures distance in
+        built the first time each metric is used, then kept with the snapshot
+
+        metric
+            "log": log10(1 + rate), so 10 -> 20 Hz is as far as 100 -> 200 Hz
+            "abs": the rate in Hz
+        """
+        rate_space = self.rate_spaces.get(metric)
+        if rate_space is None:
+            rate_space = np.asfortranarray(rate_to_space(self.rates[:, 1:], metric))
+            rate_space.flags.writeable = False
+            self.rate_spaces[metric] = rate_space
+
+        return rate_space
+
+    def get_rate_groups(self):
+        """
+        returns the rows of dests 1-5 grouped by rate, one
+        (rates, order, starts) per dest, for the nearest pattern search
+        built the first time it is used, then kept with the snapshot
+
+        rates
+            the sorted distinct rates of the dest
+        order
+            the row numbers sorted by their rate to the dest
+        starts
+            where the rows of each rate start in order, and the end
+        """
+        if self.rate_groups is None:
+            row_dtype = np.int32 if self.num_rows < 2**31 else np.int64
+            rate_groups = []
+            for dest_num in range(1, len(globals.DEST_NAMES)):
+                column = self.rates[:, dest_num]
+                order = np.argsort(column, kind="stable").astype(row_dtype)
+                sorted_rates = column[order]
+                starts = np.flatnonzero(
+                    np.concatenate(([True], sorted_rates[1:] != sorted_rates[:-1]))
+                )
+                rates = sorted_rates[starts]
+                starts = np.append(starts, len(order))
+                for array in (rates, order, starts):
+                    array.flags.writeable = False
+                rate_groups.append((rates, order, starts))
+            self.rate_groups = rate_groups
+
+        return self.rate_groups
+
+    def find_nearest_rows(
+        self, dest_rates, dest_time_srcs, is_verified, num_rows=1, metric="log"
+    ):
+        """
+        returns (row numbers, distances) of the num_rows patterns closest to
+        the rates to dests 1-5, nearest first, ties go to the lower row
+
+        the distance is the sum over dests of the rate differences in the
+        rate space of the metric, or metric can be a function taking the
+        requested rates and the (rows, dests) rate array and returning the
+        distance of every row
+        patterns with a different timing source on a dest where both the
+        requested and the pattern rate are non zero are left out
+
+        with "log" or "abs" the rows are visited from the requested rate
+        outward, one rate of one dest at a time, see get_rate_groups
+        a row not visited yet is at least as far as the sum over dests of
+        the distance to the next rate to visit, so the search stops once
+        that is more than the num_rows-th nearest row found
+        a function metric, or a table of up to NEAREST_SCAN_ROWS rows,
+        scans every row
+        """
+        dest_rates = np.asarray(dest_rates)
+        dest_time_src_codes = np.array(
+            [self.time_srcs.index(time_src) for time_src in dest_time_srcs]
+        )
+
+        if callable(metric):
+            rows = self.filter_nearest_rows(
+                np.arange(self.num_rows), dest_rates, dest_time_src_codes, is_verified
+            )
+            distances = np.asarray(metric(dest_rates, self.rates[:, 1:]), dtype=float)
+            return get_nearest(rows, distances[rows], num_rows)
+
+        rate_space = self.get_rate_space(metric)
+        dest_rate_space = rate_to_space(dest_rates, metric)
+        if self.num_rows <= NEAREST_SCAN_ROWS:
+            rows = self.filter_nearest_rows(
+                np.arange(self.num_rows), dest_rates, dest_time_src_codes, is_verified
+            )
+            return get_nearest(
+                rows,
+                get_distances(rate_space, rows, dest_rate_space),
+                num_rows,
+            )
+
+        # per dest: the distance of each rate to the requested one and the
+        # bounds, the next rate below and above it still to visit
+        rate_distances = []
+        bounds = []
+        for index, (rates, _, _) in enumerate(self.get_rate_groups()):
+            rate_distances.append(
+                np.abs(rate_to_space(rates, metric) - dest_rate_space[index])
+            )
+            above = int(np.searchsorted(rates, dest_rates[index]))
+            bounds.append((above - 1, above))
+
+        def get_next(index, below, above):
+            # (group, distance, bounds after it) of the next group of a dest
+            distances = rate_distances[index]
+            if below < 0 and above >= len(distances):
+                return None, np.inf, (below, above)
+            if above >= len(distances) or (
+                below >= 0 and distances[below] <= distances[above]
+            ):
+                return below, distances[below], (below - 1, above)
+
+            return above, distances[above], (below, above + 1)
+
+        seen = np.zeros(self.num_rows, dtype=bool)
+        found_rows = np.empty(0, dtype=int)
+        found_distances = np.empty(0)
+        max_distance = np.inf
+        while True:
+            nexts = [get_next(index, *bounds[index]) for index in range(len(bounds))]
+            threshold = sum(distance for _, distance, _ in nexts)
+            # the sum is not rounded, leave room so ties are kept
+            if threshold == np.inf or threshold - 1e-9 > max_distance:
+                break
+
+            # visit the group that raises the threshold most per row,
+            # the last group of a dest only when nothing else is left
+            best = None
+            for index, (group, distance, next_bounds) in enumerate(nexts):
+                if group is None:
+                    continue
+
+                starts = self.rate_groups[index][2]
+                gain = get_next(index, *next_bounds)[1] - distance
+                key = (gain == np.inf, -gain / (starts[group + 1] - starts[group]))
+                if best is None or key < best[0]:
+                    best = (key, index)
+
+            dest_index = best[1]
+            group, _, bounds[dest_index] = nexts[dest_index]
+            _, order, starts = self.rate_groups[dest_index]
+            rows = order[starts[group] : starts[group + 1]]
+            rows = rows[~seen[rows]]
+            seen[rows] = True
+            rows = self.filter_nearest_rows(
+                rows, dest_rates, dest_time_src_codes, is_verified
+            )
+
+            found_rows = np.concatenate((found_rows, rows))
+            found_distances = np.concatenate(
+                (found_distances, get_distances(rate_space, rows, dest_rate_space))
+            )
+            if len(found_rows) >= num_rows:
+                max_distance = np.partition(found_distances, num_rows - 1)[num_rows - 1]
+                nearest = found_distances <= max_distance
+                found_rows = found_rows[nearest]
+                found_distances = found_distances[nearest]
+
+        return get_nearest(found_rows, found_distances, num_rows)
+
+    def filter_nearest_rows(self, rows, dest_rates, dest_time_src_codes, is_verified):
+        """
+        returns the rows the nearest pattern search can return, the ones
+        with the verification status and, on every dest with a non zero
+        requested rate, the timing source or a rate of 0
+        """
+        if is_verified:
+            rows = rows[self.verified[rows]]
+        else:
+            rows = rows[self.unverified[rows]]
+
+        for index, dest_num in enumerate(range(1, len(globals.DEST_NAMES))):
+            if dest_rates[index] != 0:
+                rows = rows[
+                    (
+                        self.rate_time_src_codes[rows, dest_num]
+                        == dest_time_src_codes[index]
+                    )
+                    | (self.rates[rows, dest_num] == 0)
+                ]
+
+        return rows
+
+    def build_available_rates(self):
+        """
+        returns the available rate lists for every
+        (dest_num, time_source, is_verified) combination in one pass
+        as a dictionary of sorted arrays and a dictionary of string tuples
+        every list includes 0
+        """
+        available_rates = {}
+        for dest_num in range(len(globals.DEST_NAMES)):
+            for time_source in globals.TIME_SRCS:
+                available_rates[(dest_num, time_source, True)] = [0]
+                available_rates[(dest_num, time_source, False)] = [0]
+
+            for time_src_code, is_verified, rate in zip(
+                *self.get_rate_combos(dest_num)
+            ):
+                time_source = self.time_srcs[time_src_code]
+                if time_source in globals.TIME_SRCS:
+                    available_rates[(dest_num, time_source, bool(is_verified))].append(
+                        rate
+                    )
+
+        available_rate_strs = {}
+        for key, rate_list in available_rates.items():
+            available_rates[key], available_rate_strs[key] = freeze_rates(rate_list)
+
+        return available_rates, available_rate_strs
+
+    def get_rate_combos(self, dest_num: int):
+        """
+        returns the unique (time_src_code, is_verified, rate) of a dest
+        as three lists, sorted
+        """
+        time_src_codes = self.time_src_codes[:, dest_num].astype(np.int64)
+        if self.rates.dtype == np.int32:
+            # pack them into one int64 so a single 1d unique finds them all
+            rate_combos = np.unique(
+                (time_src_codes << 33)
+                | (self.verified.astype(np.int64) << 32)
+                | self.rates[:, dest_num].view(np.uint32)
+            )
+            return (
+                (rate_combos >> 33).tolist(),
+                ((rate_combos >> 32) & 1).tolist(),
+                (rate_combos & 0xFFFFFFFF).astype(np.uint32).view(np.int32).tolist(),
+            )
+
+        rate_combos = np.unique(
+            np.column_stack(
+                (time_src_codes, self.verified, self.rates[:, dest_num])
+            ).astype(np.int64),
+            axis=0,
+        ).reshape(-1, 3)
+        return tuple(rate_combos.T.tolist())
+
+    def update_available_rates(self, previous):
+        """
+        returns the available rate lists of the previous snapshot
+        with the lists touched by appended and changed rows recomputed
+        only valid when self.diff.is_append_only
+        """
+        rows = np.concatenate((self.diff.rate_changed_rows, self.diff.appended_rows))
+        if len(rows) == 0:
+            return previous.available_rates, previous.available_rate_strs
+
+        available_rates = dict(previous.available_rates)
+        available_rate_strs = dict(previous.available_rate_strs)
+
+        keys = set()
+        for snapshot in (previous, self):
+            snapshot_rows = rows[rows < snapshot.num_rows]
+            verified = snapshot.verified[snapshot_rows].astype(np.int64)
+            for dest_num in range(len(globals.DEST_NAMES)):
+                # (time_src_code, is_verified) packed, unique per dest
+                time_src_codes = snapshot.time_src_codes[snapshot_rows, dest_num]
+                combos = np.unique(time_src_codes.astype(np.int64) * 2 + verified)
+                for time_src_code, is_verified in zip(
+                    (combos >> 1).tolist(), (combos & 1).tolist()
+                ):
+                    keys.add(
+                        (dest_num, snapshot.time_srcs[time_src_code], bool(is_verified))
+                    )
+
+        for dest_num, time_source, is_verified in keys:
+            if time_source not in globals.TIME_SRCS:
+                continue
+
+            mask = self.time_src_codes[:, dest_num] == self.time_srcs.index(time_source)
+            if is_verified:
+                mask &= self.verified
+            else:
+                mask &= ~self.verified
+
+            key = (dest_num, time_source, is_verified)
+            available_rates[key], available_rate_strs[key] = freeze_rates(
+                np.union1d([0], self.rates[mask, dest_num])
+            )
+
+        return available_rates, available_rate_strs
+
+    def get_available_rates(
+        self, dest_num: int, time_source: str, is_verified, as_string=False
+    ):
+        """
+        returns the cached sorted array of the unique rates to the destination
+        with the given timing source and verification status, always includes 0
+        if as_string a tuple of the rates as strings is returned instead
+        """
+        key = (dest_num, time_source, bool(is_verified))
+        if as_string:
+            return self.available_rate_strs[key]
+
+        return self.available_rates[key]
+
+
+def get_distances(rate_space, rows, dest_rate_space):
+    """
+    returns the distance of each row to the requested rates,
+    both in the rate space of the metric
+    """
+    distances = np.zeros(len(rows))
+    for index in range(len(dest_rate_space)):
+        distances += np.abs(rate_space[rows, index] - dest_rate_space[index])
+
+    # so float noise from the sum does not break ties
+    return distances.round(9)
+
+
+def get_nearest(rows, distances, num_rows):
+    """
+    returns (rows, distances) of the num_rows smallest distances,
+    nearest first, ties go to the lower row
+    """
+    if num_rows < len(rows):
+        # keep every row tied with the last one so ties sort by row
+        max_distance = np.partition(distances, num_rows - 1)[num_rows - 1]
+        nearest = distances <= max_distance
+        rows, distances = rows[nearest], distances[nearest]
+
+    order = np.lexsort((rows, distances))[:num_rows]
+    return rows[order], distances[order]
+
+
+def rate_to_space(rates, metric):
+    """
+    returns rates as floats in the space of the nearest pattern metric
+    """
+    if metric == "log":
+        return np.log10(1 + np.asarray(rates, dtype=float))
+    if metric == "abs":
+        return np.asarray(rates, dtype=float)
+
+    raise ValueError(f"metric must be 'log', 'abs' or a function, was {metric}")
+
+
+def freeze_rates(rate_list):
+    """
+    returns a rate list as a read only sorted unique array
+    and as a tuple of strings
+    """
+    rate_list = np.unique(rate_list)
+    rate_list.flags.writeable = False
+    return rate_list, tuple(str(rate) for rate in rate_list.tolist())
@@ -0,0 +1,125 @@
+"""
+readback.py
+
+Contains MonitoredReadback, the latest value of a string readback PV
+kept from a channel access monitor so reading it is a memory read
+"""
+
+import threading
+
+# same as the default epics.caget timeout
+READBACK_TIMEOUT = 5.0
+
+
+class MonitoredReadback:
+    def __init__(self, pvname: str, timeout: float = READBACK_TIMEOUT):
+        """
+        subscribes to pvname, the subscription stays open until close
+
+        input
+        -------
+        pvname:
+            the readback PV, read as a string
+        timeout:
+            default seconds to wait for the first value
+        """
+        self.pvname = pvname
+        self.timeout = timeout
+        self.value = None
+        self.timestamp = None
+        # monitor updates so far, see wait_for
+        self.num_updates = 0
+        self.changed = threading.Condition()
+        self.pv = None
+        self.subscribe()
+
+    def subscribe(self):
+        """
+        opens the pyepics monitor, on_value gets every update
+        """
+        from epics import PV
+
+        self.pv = PV(
+            self.pvname,
+            auto_monitor=True,
+            callback=self.on_value,
+            connection_callback=self.on_connection,
+        )
+
+    def on_value(self, char_value=None, timestamp=None, **kwargs):
+        """
+        pyepics monitor callback, runs on a CA thread
+        """
+        with self.changed:
+            self.value = char_value
+            self.timestamp = timestamp
+            self.num_updates += 1
+            self.changed.notify_all()
+
+    def on_connection(self, conn=None, **kwargs):
+        """
+        pyepics connection callback, runs on a CA thread
+        the value is dropped on disconnect so it is never read stale
+        """
+        if conn:
+            return
+
+        with self.changed:
+            self.value = None
+            self.timestamp = None
+            self.changed.notify_all()
+
+    def get(self, timeout=None):
+        """
+        returns (value, timestamp) of the last monitor update
+        the timestamp is the one the IOC gave the value, in seconds
+        only waits if no value has arrived yet
+
+        output
+        -------
+        (value, timestamp)
+        (None, None)
+            if the PV is not connected or sent no value in time
+        """
+        if self.value is not None:
+            return self.value, self.timestamp
+
+        self.wait_for(lambda value: value is not None, timeout)
+        with self.changed:
+            return self.value, self.timestamp
+
+    def wait_for(self, predicate, timeout=None, after=None):
+        """
+        waits until predicate(value) is True, rechecking on every update
+
+        input
+        -------
+        after:
+            num_updates read before a put, only a value from a later
+            update counts, so a value that already met predicate before
+            the put is not taken as its result
+            None: the current value counts
+
+        output
+        -------
+        True
+            predicate was met
+        False
+            timed out
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        if after is None:
+            after = -1
+
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.num_updates > after and predicate(self.value), timeout
+            )
+
+    def close(self):
+        """
+        closes the subscription
+        """
+        self.pv.disconnect()
@@ -0,0 +1,133 @@
+"""
+run_result.py
+
+Contains RunPatternResult, the outcome of a staged run_pattern,
+and FanOutResult, the per unit outcome of a MultiScPatternSelect call
+"""
+
+import time
+
+# the run_pattern stages in order and their default timeouts in seconds
+#   load:    put the pattern path and the load, both within the timeout
+#   loaded:  wait for PATT_PATH_LOADED to show the pattern
+#   apply:   put the apply
+#   applied: wait for PATT_PATH_APPLIED to show the pattern
+RUN_STAGE_TIMEOUTS = {
+    "load": 1.0,
+    "loaded": 5.0,
+    "apply": 1.0,
+    "applied": 5.0,
+}
+
+
+class RunPatternResult:
+    def __init__(self, pattern_name: str):
+        """
+        pattern_name
+            the pattern that was run
+        success
+            True if every stage finished
+        failed_stage
+            the stage that failed or timed out, None on success
+        latencies
+            stage -> seconds it took, for the stages that ran, in order
+
+        truthy on success so `if patt_sel.run_pattern(...)` still works
+        """
+        self.pattern_name = pattern_name
+        self.success = False
+        self.failed_stage = None
+        self.latencies = {}
+
+    def __bool__(self):
+        return self.success
+
+    def get_total_latency(self):
+        """
+        returns the seconds taken by all the stages that ran
+        """
+        return sum(self.latencies.values())
+
+    def __repr__(self):
+        latencies = ", ".join(
+            f"{stage}={latency * 1e3:.1f} ms"
+            for stage, latency in self.latencies.items()
+        )
+        status = "ok" if self.success else f"failed at {self.failed_stage}"
+        return f"RunPatternResult({self.pattern_name}, {status}, {latencies})"
+
+
+def get_stage_timeouts(timeouts=None):
+    """
+    returns RUN_STAGE_TIMEOUTS updated with the given stage -> timeout dictionary
+    """
+    stage_timeouts = dict(RUN_STAGE_TIMEOUTS)
+    if timeouts:
+        unknown = set(timeouts) - set(RUN_STAGE_TIMEOUTS)
+        assert not unknown, f"run_pattern stages are {list(RUN_STAGE_TIMEOUTS)}"
+        stage_timeouts.update(timeouts)
+
+    return stage_timeouts
+
+
+def get_remaining(deadline):
+    """
+    returns the seconds left to a time.monotonic deadline, at least 0
+    None if deadline is None
+    """
+    if deadline is None:
+        return None
+
+    return max(deadline - time.monotonic(), 0.0)
+
+
+class FanOutResult:
+    def __init__(self, method_name: str):
+        """
+        method_name
+            the ScPatternSelect method that was called on every unit
+        results
+            (system, unit) -> what the method returned,
+            None for units where it raised
+        errors
+            (system, unit) -> the exception, for units where it raised
+        latencies
+            (system, unit) -> seconds the call took on that unit
+        elapsed
+            seconds the whole fan out took, bounded by the slowest unit
+
+        reads like the results dictionary
+        """
+        self.method_name = method_name
+        self.results = {}
+        self.errors = {}
+        self.latencies = {}
+        self.elapsed = 0.0
+
+    def __getitem__(self, unit_key):
+        return self.results[unit_key]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def items(self):
+        return self.results.items()
+
+    def get_slowest_unit(self):
+        """
+        returns the (system, unit) that took the longest, None if empty
+        """
+        if not self.latencies:
+            return None
+
+        return max(self.latencies, key=self.latencies.get)
+
+    def __repr__(self):
+        units = ", ".join(
+            f"{system}:{unit}={latency * 1e3:.1f} ms"
+            for (system, unit), latency in self.latencies.items()
+        )
+        return f"FanOutResult({self.method_name}, {self.elapsed * 1e3:.1f} ms, {units})"
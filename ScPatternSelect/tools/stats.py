@@ -0,0 +1,368 @@
+"""
+stats.py
+
+Contains NetworkStats, the latency histograms and the timeout and error
+counts of the network operations of every TPG and the pattern table
+update rates, and StatsServer, which serves them as text on a local port
+everything in the process records to the module level network_stats,
+stats() returns it as a dictionary
+"""
+
+import time
+import bisect
+import threading
+from collections import deque
+
+# histogram bucket upper bounds in seconds, there is a last +Inf bucket
+LATENCY_BUCKETS = [
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+]
+# ok: completed, timeout: no answer in time, error: failed or not connected
+OUTCOMES = ["ok", "timeout", "error"]
+# seconds the table update rate is averaged over
+TABLE_UPDATE_WINDOW = 60.0
+
+
+def get_caput_outcome(caput_val):
+    """
+    returns the outcome of a caput from its return value,
+    None: the PV did not connect, < 0: the put did not complete in time
+    """
+    if caput_val is None:
+        return "error"
+    if caput_val < 0:
+        return "timeout"
+
+    return "ok"
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        counts latencies into buckets, see LATENCY_BUCKETS
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, latency: float):
+        # a latency equal to a bound goes in that bucket, le is inclusive
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.count += 1
+        self.sum += latency
+        self.max = max(self.max, latency)
+
+    def get_quantile(self, quantile: float):
+        """
+        returns the upper bound of the bucket the quantile falls in,
+        the max if it is the +Inf bucket, None if nothing was added
+        """
+        if self.count == 0:
+            return None
+
+        rank = quantile * self.count
+        seen = 0
+        for bucket_num, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if bucket_num == len(self.buckets):
+                    return self.max
+                return min(self.buckets[bucket_num], self.max)
+
+        return self.max
+
+    def get_cumulative_counts(self):
+        """
+        returns [(upper bound, count of latencies <= it)], the last
+        upper bound is "+Inf"
+        """
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        cumulative_counts = []
+        seen = 0
+        for bound, count in zip(bounds, self.counts):
+            seen += count
+            cumulative_counts.append((bound, seen))
+
+        return cumulative_counts
+
+
+class OperationStats:
+    def __init__(self):
+        """
+        the latency histogram and outcome counts of one operation on one TPG
+        """
+        self.histogram = LatencyHistogram()
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+
+    def get_stats(self):
+        histogram = self.histogram
+        mean = None
+        if histogram.count:
+            mean = histogram.sum / histogram.count
+
+        return {
+            "count": sum(self.outcomes.values()),
+            "timeouts": self.outcomes["timeout"],
+            "errors": self.outcomes["error"],
+            "mean": mean,
+            "p50": histogram.get_quantile(0.5),
+            "p99": histogram.get_quantile(0.99),
+            "max": histogram.max if histogram.count else None,
+        }
+
+
+class NetworkStats:
+    def __init__(self):
+        """
+        latency and outcomes of the network operations of every TPG
+        keyed by the TPG base PV and the operation name
+            caput_path, caput_load, caput_apply, caput_beam_stop,
+            caput_tpg_bc_reset, caget_dest_timing, caget_readback,
+            pva_get_table, pva_get_timestamp, pva_monitor, wait_loaded,
+            wait_applied, table_update
+        table_update is the time to build the snapshot of a new table,
+        its count gives the update rate
+        """
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.table_update_times = {}
+
+    def record(self, tpg: str, operation: str, latency=None, outcome: str = "ok"):
+        """
+        records one operation
+
+        input
+        -------
+        tpg:
+            globals.get_tpg_base_pv() of the TPG
+        operation:
+            name of the operation, see __init__
+        latency:
+            seconds it took, None: only count the outcome
+        outcome:
+            "ok", "timeout" or "error"
+        """
+        with self.lock:
+            operation_stats = self.operations.get((tpg, operation))
+            if operation_stats is None:
+                operation_stats = self.operations[(tpg, operation)] = OperationStats()
+            if latency is not None:
+                operation_stats.histogram.add(latency)
+            operation_stats.outcomes[outcome] += 1
+
+    def record_table_update(self, tpg: str, latency: float):
+        """
+        records a new pattern table taking latency seconds to ingest
+        """
+        self.record(tpg, "table_update", latency)
+        now = time.monotonic()
+        with self.lock:
+            update_times = self.table_update_times.setdefault(tpg, deque())
+            update_times.append(now)
+            while update_times[0] < now - TABLE_UPDATE_WINDOW:
+                update_times.popleft()
+
+    def get_table_update_rate(self, tpg: str):
+        """
+        returns the table updates per second over the last
+        TABLE_UPDATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        with self.lock:
+            update_times = self.table_update_times.get(tpg, ())
+            num_updates = sum(
+                update_time >= now - TABLE_UPDATE_WINDOW for update_time in update_times
+            )
+
+        return num_updates / TABLE_UPDATE_WINDOW
+
+    def get_stats(self, tpg=None):
+        """
+        returns a dictionary of TPG -> operation -> stats
+        stats is a dictionary of count, timeouts, errors and the mean,
+        p50, p99 and max latency in seconds, the quantiles are bucket
+        upper bounds, the TPG also has a table_update_rate in Hz
+
+        input
+        -------
+        tpg:
+            only this TPG, None: every TPG
+        """
+        with self.lock:
+            operations = {
+                key: operation_stats.get_stats()
+                for key, operation_stats in self.operations.items()
+                if tpg is None or key[0] == tpg
+            }
+
+        tpg_stats = {}
+        for (operation_tpg, operation), stats in sorted(operations.items()):
+            tpg_stats.setdefault(operation_tpg, {})[operation] = stats
+        for operation_tpg in tpg_stats:
+            tpg_stats[operation_tpg]["table_update_rate"] = self.get_table_update_rate(
+                operation_tpg
+            )
+
+        return tpg_stats
+
+    def get_text(self):
+        """
+        returns the stats in the Prometheus text exposition format
+        """
+        with self.lock:
+            operations = sorted(self.operations.items())
+            lines = [
+                "# HELP scpatternselect_operation_seconds latency of network operations",
+                "# TYPE scpatternselect_operation_seconds histogram",
+            ]
+            for (tpg, operation), operation_stats in operations:
+                labels = f'tpg="{tpg}",operation="{operation}"'
+                histogram = operation_stats.histogram
+                for bound, count in histogram.get_cumulative_counts():
+                    lines.append(
+                        f"scpatternselect_operation_seconds_bucket"
+                        f'{{{labels},le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f"scpatternselect_operation_seconds_sum{{{labels}}} {histogram.sum}"
+                )
+                lines.append(
+                    f"scpatternselect_operation_seconds_count{{{labels}}} "
+                    f"{histogram.count}"
+                )
+
+            lines += [
+                "# HELP scpatternselect_operations_total network operations by outcome",
+                "# TYPE scpatternselect_operations_total counter",
+            ]
+            for (tpg, operation), operation_stats in operations:
+                for outcome, count in operation_stats.outcomes.items():
+                    lines.append(
+                        f'scpatternselect_operations_total{{tpg="{tpg}",'
+                        f'operation="{operation}",outcome="{outcome}"}} {count}'
+                    )
+            tpgs = sorted(self.table_update_times)
+
+        lines += [
+            "# HELP scpatternselect_table_update_rate_hz pattern table updates per second",
+            "# TYPE scpatternselect_table_update_rate_hz gauge",
+        ]
+        for tpg in tpgs:
+            lines.append(
+                f'scpatternselect_table_update_rate_hz{{tpg="{tpg}"}} '
+                f"{self.get_table_update_rate(tpg)}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        drops everything recorded so far
+        """
+        with self.lock:
+            self.operations = {}
+            self.table_update_times = {}
+
+
+network_stats = NetworkStats()
+
+
+def stats(tpg=None):
+    """
+    returns the stats of every network operation in the process,
+    see NetworkStats.get_stats
+    """
+    return network_stats.get_stats(tpg)
+
+
+class StatsServer:
+    def __init__(self, port: int = 0, host: str = "127.0.0.1", network_stats_=None):
+        """
+        serves NetworkStats.get_text over HTTP on GET /metrics,
+        use start and stop or with
+
+        input
+        -------
+        port:
+            port to listen on, 0: any free port, see get_url
+        host:
+            address to listen on, the loopback by default
+        network_stats_:
+            the NetworkStats to serve, None: network_stats
+        """
+        self.port = port
+        self.host = host
+        self.network_stats = network_stats_ or network_stats
+        self.http_server = None
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        starts serving on a daemon thread
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        network_stats_ = self.network_stats
+
+        class StatsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                body = network_stats_.get_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer((self.host, self.port), StatsHandler)
+        self.thread = threading.Thread(
+            target=self.http_server.serve_forever, name="StatsServer", daemon=True
+        )
+        self.thread.start()
+
+    def get_url(self):
+        """
+        returns the URL the stats are served on
+        """
+        host, port = self.http_server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def stop(self):
+        """
+        stops serving
+        """
+        if self.http_server is None:
+            return
+
+        self.http_server.shutdown()
+        self.http_server.server_close()
+        self.thread.join()
+        self.http_server = None
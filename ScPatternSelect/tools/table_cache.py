@@ -0,0 +1,236 @@
+"""
+table_cache.py
+
+Contains PatternTableCache, a file copy of the last pattern table
+so queries can be answered before the pattern NTTable connects, and
+PatternTableCacheWriter, which writes it off the caller's thread
+
+file layout, all sections start on a CACHE_ALIGN byte boundary
+    CACHE_MAGIC, format number (uint32), header length (uint32)
+    json header: timestamp, num_rows and each column's name, dtype and offset
+    one raw array per column, strings are stored as fixed width utf-8
+the columns are memory mapped on read, nothing is copied until used
+"""
+
+import os
+import json
+import struct
+import tempfile
+import threading
+import numpy as np
+
+CACHE_MAGIC = b"SCPATTBL"
+CACHE_FORMAT = 1
+CACHE_ALIGN = 64
+PREAMBLE = struct.Struct("<8sII")
+
+
+class PatternTableCache:
+    def __init__(self, path: str):
+        """
+        input
+        -------
+        path:
+            the cache file, it is created on the first write
+        """
+        self.path = path
+
+    def write(self, table, timestamp=None):
+        """
+        writes the table to the cache file
+        the file is replaced in one step so readers never see half a table
+
+        input
+        -------
+        table:
+            column name -> column values, the pattern NTTable "value"
+        timestamp:
+            (secondsPastEpoch, nanoseconds, userTag) of the table, or None
+
+        output
+        -------
+        True
+            the table was written
+        False
+            the file could not be written
+        """
+        columns = [(key, to_array(table[key])) for key in table]
+        num_rows = len(columns[0][1]) if columns else 0
+
+        header = {
+            "timestamp": None if timestamp is None else list(timestamp),
+            "num_rows": num_rows,
+            "columns": [],
+        }
+        offset = 0
+        for key, column in columns:
+            header["columns"].append([key, column.dtype.str, len(column), offset])
+            offset = align(offset + column.nbytes)
+
+        header_bytes = json.dumps(header).encode()
+        data_start = align(PREAMBLE.size + len(header_bytes))
+
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        tmp_path = None
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            # mkstemp makes the file private, other consoles read it too
+            os.chmod(tmp_path, 0o644)
+            with os.fdopen(fd, "wb") as cache_file:
+                cache_file.write(
+                    PREAMBLE.pack(CACHE_MAGIC, CACHE_FORMAT, len(header_bytes))
+                )
+                cache_file.write(header_bytes)
+                for (key, column), (_, _, _, column_offset) in zip(
+                    columns, header["columns"]
+                ):
+                    cache_file.seek(data_start + column_offset)
+                    cache_file.write(column.tobytes())
+                # trailing empty columns still need their offset in the file
+                cache_file.truncate(data_start + offset)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"Unable to write the pattern table cache {self.path}: {err}")
+            return False
+
+        return True
+
+    def read(self):
+        """
+        memory maps the cache file
+
+        output
+        -------
+        (table, timestamp)
+            table is column name -> column values like the pattern NTTable
+            "value", numeric columns are read only arrays into the file
+            timestamp is the one given to write
+        None
+            there is no cache file or it can not be read
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            data = np.memmap(self.path, dtype=np.uint8, mode="r")
+            magic, cache_format, header_len = PREAMBLE.unpack_from(data)
+            if magic != CACHE_MAGIC or cache_format != CACHE_FORMAT:
+                raise ValueError("not a pattern table cache of this version")
+
+            header_end = PREAMBLE.size + header_len
+            header = json.loads(bytes(data[PREAMBLE.size : header_end]))
+            data_start = align(header_end)
+
+            table = {}
+            for key, dtype, length, offset in header["columns"]:
+                column = np.ndarray(
+                    length, dtype=dtype, buffer=data, offset=data_start + offset
+                )
+                if column.dtype.kind == "S":
+                    column = [value.decode() for value in column.tolist()]
+                table[key] = column
+        except (OSError, ValueError, KeyError, TypeError, struct.error) as err:
+            print(f"Unable to read the pattern table cache {self.path}: {err}")
+            return None
+
+        timestamp = header["timestamp"]
+        if timestamp is not None:
+            timestamp = tuple(timestamp)
+
+        return table, timestamp
+
+
+class PatternTableCacheWriter:
+    def __init__(self, patt_table_cache: PatternTableCache, timestamp=None):
+        """
+        writes tables to a PatternTableCache on a worker thread so the
+        monitor callback never waits on the disk
+        only the newest table waiting is written, a burst of updates
+        ends in one write
+
+        input
+        -------
+        patt_table_cache:
+            the PatternTableCache to write
+        timestamp:
+            timestamp of the table already in the file, a table with the
+            same timestamp is not written again
+        """
+        self.patt_table_cache = patt_table_cache
+        self.timestamp = timestamp
+        # (table, timestamp) waiting to be written
+        self.pending = None
+        self.is_writing = False
+        self.idle = threading.Condition()
+
+    def write(self, table, timestamp=None):
+        """
+        queues the table to be written and returns right away
+        replaces a table that is still waiting
+        """
+        with self.idle:
+            self.pending = (table, timestamp)
+            if self.is_writing:
+                return
+            self.is_writing = True
+
+        threading.Thread(
+            target=self.run, name="PatternTableCacheWriter", daemon=True
+        ).start()
+
+    def run(self):
+        """
+        writes the pending tables until there are none left
+        """
+        while True:
+            with self.idle:
+                if self.pending is None:
+                    self.is_writing = False
+                    self.idle.notify_all()
+                    return
+                table, timestamp = self.pending
+                self.pending = None
+
+            if timestamp is not None and timestamp == self.timestamp:
+                continue
+            if self.patt_table_cache.write(table, timestamp):
+                self.timestamp = timestamp
+
+    def flush(self, timeout=None):
+        """
+        waits for the queued tables to be written
+
+        output
+        -------
+        True
+            nothing is left to write
+        False
+            timed out
+        """
+        with self.idle:
+            return self.idle.wait_for(lambda: not self.is_writing, timeout)
+
+
+def to_array(values):
+    """
+    returns a table column as a fixed width array that can be written as is
+    """
+    if values is None:
+        # p4p gives None for empty numeric columns
+        return np.empty(0, dtype=np.int32)
+
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return np.ascontiguousarray(values)
+
+    return np.array([str(value).encode() for value in values.tolist()], dtype=bytes)
+
+
+def align(offset):
+    """
+    rounds offset up to the next CACHE_ALIGN boundary
+    """
+    return -(-offset // CACHE_ALIGN) * CACHE_ALIGN
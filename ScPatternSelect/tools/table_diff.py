@@ -0,0 +1,159 @@
+"""
+table_diff.py
+
+Contains PatternTableDiff, the rows that changed between two pattern table snapshots
+"""
+
+import numpy as np
+
+
+class PatternTableDiff:
+    def __init__(self, old, new):
+        """
+        compares two PatternTableSnapshots by PATTERN_NAME
+
+        added
+            names of patterns only in the new table
+        removed
+            names of patterns only in the old table
+        changed
+            names of patterns in both tables with different row data
+
+        is_append_only
+            True if every old row kept its row number and any new rows
+            were added at the end, so the new snapshot can update the old
+            indexes instead of rebuilding them
+        added_rows, changed_rows
+            new table row numbers of the added and changed patterns
+        appended_rows, rate_changed_rows
+            new table row numbers of every row after the old table and
+            of old rows where a rate, timing source or IS_VERIFIED changed
+            only set when is_append_only
+        """
+        self.old_version = old.version
+        self.new_version = new.version
+
+        self.is_append_only = (
+            new.num_rows >= old.num_rows
+            # new timing sources are added after the old ones
+            and new.time_srcs[: len(old.time_srcs)] == old.time_srcs
+            and list(old.table) == list(new.table)
+            and (
+                new.names is old.names
+                or np.array_equal(new.names[: old.num_rows], old.names)
+            )
+        )
+
+        old_rows = new_rows = None
+        if self.is_append_only:
+            self.appended_rows = np.arange(old.num_rows, new.num_rows)
+            appended_names = first_rows(
+                new.names[old.num_rows :].tolist(), old.num_rows
+            )
+            self.added_rows = np.array(
+                sorted(
+                    row
+                    for name, row in appended_names.items()
+                    if name not in old.name_index
+                ),
+                dtype=int,
+            )
+            self.removed = []
+        else:
+            new_name_index = first_rows(new.names.tolist())
+            common = [name for name in new_name_index if name in old.name_index]
+            old_rows = np.array([old.name_index[name] for name in common], dtype=int)
+            new_rows = np.array([new_name_index[name] for name in common], dtype=int)
+            self.added_rows = np.array(
+                sorted(
+                    row
+                    for name, row in new_name_index.items()
+                    if name not in old.name_index
+                ),
+                dtype=int,
+            )
+            self.removed = [
+                name for name in old.name_index if name not in new_name_index
+            ]
+            self.appended_rows = np.empty(0, dtype=int)
+
+        self.added = new.names[self.added_rows].tolist()
+
+        # columns the new table shares with the old one did not change
+        changed_keys = [
+            key
+            for key in new.table
+            if new.table.columns[key] is not old.table.columns.get(key)
+        ]
+        self.changed_rows = np.empty(0, dtype=int)
+        if changed_keys:
+            if old_rows is None:
+                # the first row of each name is at the same row number in both
+                old_rows = np.array(sorted(old.name_index.values()), dtype=int)
+                new_rows = old_rows
+
+            changed = np.zeros(len(new_rows), dtype=bool)
+            for key in changed_keys:
+                if key not in old.table:
+                    changed[:] = True
+                    break
+
+                old_column = column_array(old.table[key])[old_rows]
+                new_column = column_array(new.table[key])[new_rows]
+                if old_column.dtype.kind != new_column.dtype.kind:
+                    changed[:] = True
+                    break
+
+                changed |= old_column != new_column
+
+            self.changed_rows = new_rows[changed]
+        self.changed = new.names[self.changed_rows].tolist()
+
+        self.rate_changed_rows = np.empty(0, dtype=int)
+        if self.is_append_only:
+            old_num_rows = old.num_rows
+            rate_changed = np.zeros(old_num_rows, dtype=bool)
+            if new.rates is not old.rates:
+                rate_changed |= (old.rates != new.rates[:old_num_rows]).any(axis=1)
+            if new.time_src_codes is not old.time_src_codes:
+                rate_changed |= (
+                    old.time_src_codes != new.time_src_codes[:old_num_rows]
+                ).any(axis=1)
+            if new.verified is not old.verified:
+                rate_changed |= (old.verified != new.verified[:old_num_rows]) | (
+                    old.unverified != new.unverified[:old_num_rows]
+                )
+            self.rate_changed_rows = np.flatnonzero(rate_changed)
+
+    def is_empty(self):
+        """
+        returns True if no patterns were added, removed or changed
+        """
+        return not (self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return (
+            f"PatternTableDiff(version {self.old_version} -> {self.new_version}, "
+            f"added={len(self.added)}, removed={len(self.removed)}, "
+            f"changed={len(self.changed)})"
+        )
+
+
+def column_array(values):
+    """
+    returns a raw table column as an array that can be compared element wise
+    """
+    if values is None:
+        # p4p gives None for empty numeric columns
+        return np.empty(0)
+
+    return np.asarray(values)
+
+
+def first_rows(names, start=0):
+    """
+    returns a name -> row number dictionary, row numbers count up from start
+    if a name shows up more than once the first row wins
+    """
+    stop = start + len(names)
+    return dict(zip(reversed(names), range(stop - 1, start - 1, -1)))
@@ -0,0 +1,165 @@
+"""
+tracing.py
+
+Contains Tracer, optional timing spans around the steps of switching
+patterns, written as a Chrome trace JSON file that chrome://tracing
+and https://ui.perfetto.dev open
+spans on one thread nest by time, so a span opened inside another
+shows up under it
+use the module level tracer, it is off until start is called
+"""
+
+import os
+import json
+import time
+import threading
+
+
+class NullSpan:
+    """
+    the span of a stopped tracer, records nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name: str, args):
+        """
+        one timed step, records a complete event when it exits
+        """
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, end, self.args)
+        return False
+
+
+class Tracer:
+    def __init__(self, max_events: int = 1000000):
+        """
+        records spans while started
+
+        input
+        -------
+        max_events:
+            spans kept at most, later ones are dropped and counted
+        """
+        self.max_events = max_events
+        self.is_enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.num_dropped = 0
+        self.thread_names = {}
+        self.start_ns = time.perf_counter_ns()
+
+    def start(self):
+        """
+        starts recording spans, the ones already recorded are kept
+        """
+        self.is_enabled = True
+
+    def stop(self):
+        """
+        stops recording spans
+        """
+        self.is_enabled = False
+
+    def clear(self):
+        """
+        drops the recorded spans
+        """
+        with self.lock:
+            self.events = []
+            self.num_dropped = 0
+            self.thread_names = {}
+
+    def span(self, name: str, **args):
+        """
+        returns a context manager that times the code in it as name,
+        args are shown with the span
+        does nothing while the tracer is stopped
+
+        i.e.
+            with tracer.span("caput_load", pvname=pvname):
+                ...
+        """
+        if not self.is_enabled:
+            return NULL_SPAN
+
+        return Span(self, name, args)
+
+    def add_span(self, name: str, start: int, end: int, args):
+        """
+        records a span of perf_counter_ns start to end on this thread
+        """
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.start_ns) / 1e3,
+            "dur": (end - start) / 1e3,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args,
+        }
+        with self.lock:
+            if len(self.events) >= self.max_events:
+                self.num_dropped += 1
+                return
+            self.events.append(event)
+            self.thread_names[thread.ident] = thread.name
+
+    def get_trace(self):
+        """
+        returns the recorded spans in the Chrome trace event format,
+        times are in microseconds
+        """
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+            num_dropped = self.num_dropped
+
+        pid = os.getpid()
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": thread_name},
+            }
+            for tid, thread_name in thread_names.items()
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_spans": num_dropped},
+        }
+
+    def write(self, path: str):
+        """
+        writes the recorded spans to path as Chrome trace JSON
+        """
+        with open(path, "w") as trace_file:
+            json.dump(self.get_trace(), trace_file)
+
+
+tracer = Tracer()
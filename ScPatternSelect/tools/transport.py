@@ -0,0 +1,505 @@
+"""
+transport.py
+
+Contains the transports ScPatternSelect does its network operations
+through, the channel access puts, gets and readback monitors and the
+pvAccess context the pattern NTTable is read and monitored on
+    EpicsTransport: pyepics and p4p, the default
+    LocalTransport: an in process stand in with no network, every
+        operation completes right away, for tests and profiling
+a transport has open_context, open_readback, caput, caget_many and
+connect_many, pass one to ScPatternSelect to swap it in
+open_async_context and open_pv are what AsyncScPatternSelect and
+AsyncCA use, asyncio is only imported by them
+"""
+
+import time
+import threading
+from .readback import MonitoredReadback
+from .bulk_ca import caget_many, connect_many
+
+
+class EpicsTransport:
+    """
+    channel access with pyepics and pvAccess with p4p
+    both are imported on first use
+    """
+
+    def open_context(self):
+        """
+        returns a new p4p.client.thread.Context, the owner closes it
+        """
+        from p4p.client.thread import Context
+
+        return Context("pva", nt=False)
+
+    def open_async_context(self):
+        """
+        returns a new p4p.client.asyncio.Context, the owner closes it
+        """
+        from p4p.client.asyncio import Context
+
+        return Context("pva", nt=False)
+
+    def open_readback(self, pvname: str):
+        """
+        returns a new MonitoredReadback of pvname, the owner closes it
+        """
+        return MonitoredReadback(pvname)
+
+    def open_pv(self, pvname: str, callback, connection_callback):
+        """
+        returns a new monitored epics.PV of pvname, the owner disconnects it
+        callback gets every value and connection_callback every
+        connection change, both run on a CA thread
+        """
+        from epics import PV
+
+        return PV(
+            pvname,
+            auto_monitor=True,
+            callback=callback,
+            connection_callback=connection_callback,
+        )
+
+    def caput(self, pvname: str, value, timeout=None):
+        """
+        epics.caput
+
+        input
+        -------
+        timeout:
+            None: do not wait for the put to complete
+            seconds to wait for the put to complete
+
+        output
+        -------
+        1
+            the put was sent, or completed when waiting
+        None or < 0
+            the PV did not connect, or the put did not complete in time
+        """
+        from epics import caput
+
+        if timeout is None:
+            return caput(pvname, value)
+
+        return caput(pvname, value, wait=True, timeout=timeout)
+
+    def caget_many(self, pvnames, string_pvnames=(), timeout: float = 1.0):
+        """
+        see bulk_ca.caget_many
+        """
+        return caget_many(pvnames, string_pvnames, timeout)
+
+    def connect_many(self, pvnames, timeout: float = 0):
+        """
+        see bulk_ca.connect_many
+        """
+        return connect_many(pvnames, timeout)
+
+
+class LocalReadback(MonitoredReadback):
+    def __init__(self, transport, pvname: str, timeout: float = 0.0):
+        """
+        MonitoredReadback of a PV served by a LocalTransport
+        an unserved PV never gets a value, so reads do not wait by default
+        """
+        self.transport = transport
+        super().__init__(pvname, timeout)
+
+    def subscribe(self):
+        """
+        registers with the transport, it calls on_value on every update
+        """
+        self.transport.add_readback(self)
+
+    def close(self):
+        """
+        unregisters from the transport
+        """
+        self.transport.remove_readback(self)
+
+
+class LocalPV:
+    def __init__(self, transport, pvname: str, callback, connection_callback):
+        """
+        stands in for a monitored epics.PV of a PV served by a
+        LocalTransport, the callbacks get the same keywords as pyepics
+        an unserved PV never connects and its puts never complete
+        """
+        self.transport = transport
+        self.pvname = pvname
+        self.callback = callback
+        self.connection_callback = connection_callback
+        self.connection_callback(pvname=pvname, conn=self.connected)
+        self.transport.add_readback(self)
+
+    @property
+    def connected(self):
+        return self.pvname in self.transport.values
+
+    def on_value(self, **kwargs):
+        self.callback(pvname=self.pvname, **kwargs)
+
+    def put(self, value, wait: bool = False, callback=None):
+        """
+        puts value, callback(pvname=pvname) runs once the put completed
+        """
+        if self.transport.caput(self.pvname, value) == 1 and callback is not None:
+            callback(pvname=self.pvname)
+
+    def disconnect(self):
+        """
+        unregisters from the transport
+        """
+        self.transport.remove_readback(self)
+
+
+class LocalSubscription:
+    def __init__(self, context, name: str, callback):
+        """
+        a pattern table monitor of a LocalContext, close it to stop it
+        """
+        self.context = context
+        self.name = name
+        self.callback = callback
+
+    def close(self):
+        self.context.transport.remove_monitor(self)
+        if self in self.context.subscriptions:
+            self.context.subscriptions.remove(self)
+
+
+class LocalContext:
+    def __init__(self, transport):
+        """
+        stands in for p4p.client.thread.Context on a LocalTransport
+        """
+        self.transport = transport
+        self.subscriptions = []
+
+    def get(self, name: str, request=None, timeout: float = 5.0):
+        """
+        returns the table posted to name
+        raises TimeoutError like p4p if nothing was posted
+        """
+        patt_table = self.transport.tables.get(name)
+        if patt_table is None:
+            raise TimeoutError(f"Timeout getting {name}")
+
+        return patt_table
+
+    def monitor(self, name: str, callback, notify_disconnect: bool = False):
+        """
+        calls callback with the current table of name, if there is one,
+        and with every table posted to it after that
+        """
+        subscription = LocalSubscription(self, name, callback)
+        self.subscriptions.append(subscription)
+        self.transport.add_monitor(subscription)
+        return subscription
+
+    def close(self):
+        """
+        closes every monitor opened on the context
+        """
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+
+class LocalAsyncSubscription(LocalSubscription):
+    def __init__(self, context, name: str, callback):
+        """
+        a pattern table monitor of a LocalAsyncContext, the tables are
+        awaited with callback in the order they are posted, on the event
+        loop that opened the monitor, like a p4p asyncio monitor
+        """
+        import asyncio
+
+        super().__init__(context, name, self.post)
+        self.async_callback = callback
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self.run())
+
+    def post(self, patt_table):
+        """
+        queues a table for the callback, from any thread
+        """
+        import asyncio
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        # on the loop it is queued right away, so wait_posted sees it
+        if loop is self.loop:
+            self.queue.put_nowait(patt_table)
+        else:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, patt_table)
+
+    async def run(self):
+        while True:
+            patt_table = await self.queue.get()
+            try:
+                await self.async_callback(patt_table)
+            finally:
+                self.queue.task_done()
+
+    async def wait_posted(self):
+        """
+        waits until the callback is done with every table posted so far
+        """
+        await self.queue.join()
+
+    def close(self):
+        super().close()
+        self.task.cancel()
+
+    async def wait_closed(self):
+        import asyncio
+
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class LocalAsyncContext(LocalContext):
+    """
+    stands in for p4p.client.asyncio.Context on a LocalTransport
+    """
+
+    async def get(self, name: str, request=None):
+        """
+        returns the table posted to name
+        never returns if nothing was posted, like a PV that does not
+        connect, wrap it in asyncio.wait_for
+        """
+        import asyncio
+
+        patt_table = self.transport.tables.get(name)
+        if patt_table is None:
+            await asyncio.get_running_loop().create_future()
+
+        return patt_table
+
+    def monitor(self, name: str, callback, notify_disconnect: bool = False):
+        """
+        awaits callback with the current table of name, if there is one,
+        and with every table posted to it after that
+        """
+        subscription = LocalAsyncSubscription(self, name, callback)
+        self.subscriptions.append(subscription)
+        self.transport.add_monitor(subscription)
+        return subscription
+
+
+class LocalTransport:
+    def __init__(self):
+        """
+        serves PVs and pattern tables from memory, every put, get and
+        update is delivered right away on the calling thread
+        a PV must be added with add_pv, or all of a TPG with add_tpg,
+        puts to any other PV fail like a PV that does not connect
+
+        values
+            PV name -> value
+        tables
+            pattern table name -> pattern NTTable value
+        """
+        self.lock = threading.Lock()
+        self.values = {}
+        self.put_callbacks = {}
+        self.readbacks = {}
+        self.tables = {}
+        self.monitors = {}
+
+    def add_pv(self, pvname: str, value, put_callback=None):
+        """
+        serves pvname with value
+        put_callback(value) runs after every put, like the IOC processing
+        """
+        with self.lock:
+            self.values[pvname] = value
+            if put_callback is not None:
+                self.put_callbacks[pvname] = put_callback
+
+        self.notify_readbacks(pvname, value)
+
+    def add_tpg(self, globals_, table=None):
+        """
+        serves the PVs of a TPG, loading and applying show up on the
+        readbacks as soon as MANUAL_LOAD and APPLY are put to
+
+        input
+        -------
+        globals_:
+            globals of the TPG
+        table:
+            column name -> column values of the pattern table to post,
+            None: do not post a table
+        """
+        loaded_pv = globals_.get_pattern_loaded_pv()
+        running_pv = globals_.get_pattern_running_pv()
+        path_set_pv = globals_.get_path_set_pv()
+
+        self.add_pv(path_set_pv, "")
+        self.add_pv(loaded_pv, "")
+        self.add_pv(running_pv, "")
+        self.add_pv(
+            globals_.get_load_pv(),
+            0,
+            lambda value: self.set_value(loaded_pv, self.get_value(path_set_pv)),
+        )
+        self.add_pv(
+            globals_.get_apply_pv(),
+            0,
+            lambda value: self.set_value(running_pv, self.get_value(loaded_pv)),
+        )
+        self.add_pv(globals_.get_beam_stop_proc_pv(), 0)
+        self.add_pv(globals_.get_tpg_bc_reset_proc_pv(), 0)
+        for dest in globals_.DEST_NAMES:
+            dest_pvs = globals_.get_dest_pvs(dest)
+            self.add_pv(dest_pvs["time_src"], "FR")
+            self.add_pv(dest_pvs["offset"], 0)
+            self.add_pv(dest_pvs["timeslot"], 1)
+            self.add_pv(dest_pvs["timeslot_mask"], 0x3F)
+
+        if table is not None:
+            self.post_table(globals_.get_patt_table_name(), {"value": table})
+
+    def get_value(self, pvname: str):
+        """
+        returns the value of pvname, None if it is not served
+        """
+        return self.values.get(pvname)
+
+    def set_value(self, pvname: str, value):
+        """
+        updates a served PV without a put, like the IOC does
+        """
+        with self.lock:
+            self.values[pvname] = value
+
+        self.notify_readbacks(pvname, value)
+
+    def notify_readbacks(self, pvname: str, value):
+        with self.lock:
+            readbacks = list(self.readbacks.get(pvname, ()))
+
+        timestamp = time.time()
+        for readback in readbacks:
+            readback.on_value(value=value, char_value=str(value), timestamp=timestamp)
+
+    def post_table(self, name: str, patt_table):
+        """
+        serves a new pattern NTTable value, i.e. {"value": table},
+        every monitor of name gets it before this returns
+        """
+        with self.lock:
+            self.tables[name] = patt_table
+            subscriptions = list(self.monitors.get(name, ()))
+
+        for subscription in subscriptions:
+            subscription.callback(patt_table)
+
+    def add_readback(self, readback):
+        with self.lock:
+            self.readbacks.setdefault(readback.pvname, []).append(readback)
+            value = self.values.get(readback.pvname)
+
+        if value is not None:
+            readback.on_value(value=value, char_value=str(value), timestamp=time.time())
+
+    def remove_readback(self, readback):
+        with self.lock:
+            readbacks = self.readbacks.get(readback.pvname, [])
+            if readback in readbacks:
+                readbacks.remove(readback)
+
+    def add_monitor(self, subscription):
+        with self.lock:
+            self.monitors.setdefault(subscription.name, []).append(subscription)
+            patt_table = self.tables.get(subscription.name)
+
+        # a p4p monitor also starts with the current value
+        if patt_table is not None:
+            subscription.callback(patt_table)
+
+    def remove_monitor(self, subscription):
+        with self.lock:
+            subscriptions = self.monitors.get(subscription.name, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+
+    def open_context(self):
+        """
+        returns a new LocalContext
+        """
+        return LocalContext(self)
+
+    def open_async_context(self):
+        """
+        returns a new LocalAsyncContext, open it from a coroutine
+        """
+        return LocalAsyncContext(self)
+
+    def open_readback(self, pvname: str):
+        """
+        returns a new LocalReadback of pvname
+        """
+        return LocalReadback(self, pvname)
+
+    def open_pv(self, pvname: str, callback, connection_callback):
+        """
+        returns a new LocalPV of pvname, the callbacks run on the thread
+        that puts or sets the value
+        """
+        return LocalPV(self, pvname, callback, connection_callback)
+
+    def caput(self, pvname: str, value, timeout=None):
+        """
+        sets the value and runs the put callback of pvname
+
+        output
+        -------
+        1
+            the put completed
+        None
+            pvname is not served
+        """
+        with self.lock:
+            if pvname not in self.values:
+                return None
+            self.values[pvname] = value
+            put_callback = self.put_callbacks.get(pvname)
+
+        self.notify_readbacks(pvname, value)
+        if put_callback is not None:
+            put_callback(value)
+
+        return 1
+
+    def caget_many(self, pvnames, string_pvnames=(), timeout: float = 1.0):
+        """
+        returns a dictionary of pvname -> value, None if it is not served
+        string_pvnames are returned as str
+        """
+        with self.lock:
+            values = {pvname: self.values.get(pvname) for pvname in pvnames}
+
+        for pvname in string_pvnames:
+            if values.get(pvname) is not None:
+                values[pvname] = str(values[pvname])
+
+        return values
+
+    def connect_many(self, pvnames, timeout: float = 0):
+        """
+        returns the PV names that are not served
+        """
+        with self.lock:
+            return [pvname for pvname in pvnames if pvname not in self.values]
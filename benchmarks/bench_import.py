@@ -0,0 +1,88 @@
+"""
+bench_import.py
+
+Times `import ScPatternSelect` in a fresh interpreter and checks that
+epics and p4p are not imported until they are used
+
+usage: python benchmarks/bench_import.py [--repeat N] [--budget MS]
+exits 1 if a transport module was imported or the median is over budget
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# modules that load native EPICS libraries
+TRANSPORT_MODULES = ["epics", "p4p"]
+
+IMPORT_CODE = """
+import sys, time, json
+start = time.perf_counter()
+import ScPatternSelect
+import_ms = (time.perf_counter() - start) * 1e3
+modules = [m for m in {modules} if m in sys.modules]
+print(json.dumps({{"import_ms": import_ms, "modules": modules}}))
+"""
+
+
+def time_import():
+    """
+    returns the import time in ms and the transport modules imported
+    by `import ScPatternSelect` in a new interpreter
+    """
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [repo, env.get("PYTHONPATH", "")]))
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_CODE.format(modules=TRANSPORT_MODULES)],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(out.splitlines()[-1])
+    return result["import_ms"], result["modules"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=200.0, help="median ms")
+    args = parser.parse_args()
+
+    times = []
+    modules = set()
+    for _ in range(args.repeat):
+        import_ms, imported = time_import()
+        times.append(import_ms)
+        modules.update(imported)
+
+    median = statistics.median(times)
+    print(
+        json.dumps(
+            {
+                "benchmark": "import ScPatternSelect",
+                "repeat": args.repeat,
+                "median_ms": round(median, 2),
+                "min_ms": round(min(times), 2),
+                "max_ms": round(max(times), 2),
+                "budget_ms": args.budget,
+                "transport_modules_imported": sorted(modules),
+            }
+        )
+    )
+
+    if modules:
+        print(f"transport modules imported eagerly: {sorted(modules)}")
+        return 1
+    if median > args.budget:
+        print(f"import took {median:.1f} ms, over the {args.budget} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+bench_lookup.py
+
+Times snapshot ingestion and the pattern table queries of ScPatternSelect
+on synthetic tables, see synthetic_table.py, no TPG is needed
+
+usage: python benchmarks/bench_lookup.py [--rows N ...] [--calls N]
+                                         [--output FILE] [--baseline FILE]
+prints one JSON object per line, one per benchmark and table size
+with --baseline, exits 1 if a benchmark got slower than --tolerance
+times its time in the baseline file, an --output of an earlier run
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_table import make_pattern_table, wrap_nttable
+from ScPatternSelect import ScPatternSelect
+from ScPatternSelect.tools import PatternTableSnapshot
+
+ROWS = [100, 1000, 10000, 100000, 1000000]
+
+
+def time_calls(call, args_list, repeat):
+    """
+    returns the mean time per call in seconds of each of repeat passes
+    of calling call(*args) for every args in args_list
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            call(*args)
+        times.append((time.perf_counter() - start) / len(args_list))
+
+    return times
+
+
+def get_result(benchmark, num_rows, times, calls):
+    """
+    returns the JSON record of one benchmark
+    """
+    return {
+        "benchmark": benchmark,
+        "rows": num_rows,
+        "calls": calls,
+        "repeat": len(times),
+        "median_us": round(statistics.median(times) * 1e6, 3),
+        "min_us": round(min(times) * 1e6, 3),
+        "max_us": round(max(times) * 1e6, 3),
+    }
+
+
+def run_benchmarks(num_rows, calls, repeat, seed):
+    """
+    yields the JSON records of every benchmark on a table of num_rows
+    """
+    table = make_pattern_table(num_rows, seed)
+    value = wrap_nttable(table)["value"]
+
+    # a full get of the table after an update, so fewer passes on big tables
+    ingest_repeat = max(1, min(repeat, 100000 // num_rows))
+    times = time_calls(lambda: PatternTableSnapshot(value), [()], ingest_repeat)
+    yield get_result("snapshot_ingestion", num_rows, times, 1)
+
+    patt_sel = ScPatternSelect("SYS0", "1", "", connect=False)
+    patt_sel.install_patt_table_snapshot(PatternTableSnapshot(value, 1))
+
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, num_rows, calls).tolist()
+    names = [table["PATTERN_NAME"][row_num] for row_num in rows]
+
+    times = time_calls(
+        patt_sel.get_pattern_row_num, [(name,) for name in names], repeat
+    )
+    yield get_result("get_pattern_row_num", num_rows, times, calls)
+
+    times = time_calls(patt_sel.get_pattern_data, [(name,) for name in names], repeat)
+    yield get_result("get_pattern_data", num_rows, times, calls)
+
+    dest_data_list = []
+    for row_num in rows:
+        dest_data = {}
+        for dest_num, dest in enumerate(patt_sel.globals.DEST_NAMES[1:], start=1):
+            time_src = table[f"{dest}{patt_sel.globals.TSOURCE_SFX}"][row_num]
+            dest_data[dest_num] = [
+                int(table[f"{dest}{patt_sel.globals.RATE_SFX}"][row_num]),
+                "FR" if time_src == "None" else time_src,
+            ]
+        dest_data_list.append(dest_data)
+
+    def get_pattern_name_by_rate(dest_data):
+        patt_sel.get_pattern_name_by_rate(dest_data=dict(dest_data))
+
+    times = time_calls(
+        get_pattern_name_by_rate, [(dest_data,) for dest_data in dest_data_list], repeat
+    )
+    yield get_result("get_pattern_name_by_rate", num_rows, times, calls)
+
+    rate_args = [
+        (dest, time_src)
+        for dest in patt_sel.globals.DEST_NAMES
+        for time_src in patt_sel.globals.TIME_SRCS
+    ]
+    times = time_calls(patt_sel.get_available_rates, rate_args, repeat)
+    yield get_result("get_available_rates", num_rows, times, len(rate_args))
+
+
+def check_baseline(results, baseline_path, tolerance):
+    """
+    returns the results whose fastest pass is more than tolerance times
+    slower than the same benchmark and table size in the baseline file
+    """
+    baseline = {}
+    with open(baseline_path) as baseline_file:
+        for line in baseline_file:
+            result = json.loads(line)
+            baseline[(result["benchmark"], result["rows"])] = result
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result["benchmark"], result["rows"]))
+        # the fastest pass is the least noisy
+        if base is not None and result["min_us"] > tolerance * base["min_us"]:
+            regressions.append(result)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--calls", type=int, default=1000, help="queries per pass")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=2.0)
+    args = parser.parse_args()
+
+    results = []
+    for num_rows in args.rows:
+        for result in run_benchmarks(num_rows, args.calls, args.repeat, args.seed):
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + "\n")
+
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.tolerance)
+        for result in regressions:
+            print(
+                f"{result['benchmark']} on {result['rows']} rows is over "
+                f"{args.tolerance} times slower than {args.baseline}"
+            )
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+bench_run_pattern.py
+
+Times ScPatternSelect end to end against the local TPG simulator,
+see tpg_sim.py, over real CA and PVA connections on the loopback,
+or with --local on a LocalTransport, no network, to profile the client
+with --trace, the spans of every run_pattern are written as Chrome trace JSON
+    connect:         ScPatternSelect() until the table is received
+    table_update:    a new table is posted until the monitor delivers it
+    get_pattern_running, get_dest_timing_state
+    run_pattern and each of its stages
+
+usage: python benchmarks/bench_run_pattern.py [--cycles N] [--rows N]
+                                              [--local] [--trace FILE]
+                                              [--load-delay S] ...
+prints one JSON object per line, one per benchmark
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_table import make_pattern_table
+from tpg_sim import TpgSimulator
+from ScPatternSelect.tools import LocalTransport, globals, tracer
+
+
+def get_result(benchmark, times, **extra):
+    """
+    returns the JSON record of one benchmark, times in seconds
+    """
+    result = {
+        "benchmark": benchmark,
+        "count": len(times),
+        "median_ms": round(statistics.median(times) * 1e3, 3),
+        "min_ms": round(min(times) * 1e3, 3),
+        "max_ms": round(max(times) * 1e3, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def run_benchmarks(globals_, table, post_table, cycles, transport=None):
+    """
+    yields the JSON records of every benchmark
+
+    input
+    -------
+    globals_:
+        globals of the TPG
+    table:
+        the pattern table it serves
+    post_table:
+        function that serves a new table
+    transport:
+        passed to ScPatternSelect
+    """
+    from ScPatternSelect import ScPatternSelect
+
+    start = time.perf_counter()
+    patt_sel = ScPatternSelect(globals_.system, globals_.unit, "", transport=transport)
+    yield get_result("connect", [time.perf_counter() - start])
+
+    times = []
+    for cycle in range(cycles):
+        version = patt_sel.patt_table_version
+        start = time.perf_counter()
+        table = make_pattern_table(len(table["PATTERN_NAME"]), cycle)
+        post_table(table)
+        while patt_sel.patt_table_version == version:
+            time.sleep(0.0001)
+        times.append(time.perf_counter() - start)
+    yield get_result("table_update", times)
+
+    names = [
+        name for name in table["PATTERN_NAME"][1:] if patt_sel.pattern_exists(name)
+    ]
+    stage_times = {}
+    run_times = []
+    for cycle in range(cycles):
+        result = patt_sel.run_pattern(names[cycle % len(names)])
+        if not result:
+            print(f"run_pattern failed: {result}")
+            continue
+        run_times.append(result.get_total_latency())
+        for stage, latency in result.latencies.items():
+            stage_times.setdefault(stage, []).append(latency)
+    yield get_result("run_pattern", run_times, failures=cycles - len(run_times))
+    for stage, times in stage_times.items():
+        yield get_result(f"run_pattern.{stage}", times)
+
+    times = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        patt_sel.get_pattern_running()
+        times.append(time.perf_counter() - start)
+    yield get_result("get_pattern_running", times)
+
+    times = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        patt_sel.get_dest_timing_state()
+        times.append(time.perf_counter() - start)
+    yield get_result("get_dest_timing_state", times)
+
+    patt_sel.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--local", action="store_true", help="use LocalTransport")
+    parser.add_argument("--load-delay", type=float, default=0.01)
+    parser.add_argument("--apply-delay", type=float, default=0.01)
+    parser.add_argument("--put-delay", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--trace", help="write the run_pattern spans to this file")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracer.start()
+
+    results = []
+    table = make_pattern_table(args.rows)
+    if args.local:
+        transport = LocalTransport()
+        globals_ = globals("SYS0", "1", "")
+        transport.add_tpg(globals_, table)
+
+        def post_table(table):
+            transport.post_table(globals_.get_patt_table_name(), {"value": table})
+
+        for result in run_benchmarks(
+            globals_, table, post_table, args.cycles, transport
+        ):
+            print(json.dumps(result), flush=True)
+            results.append(result)
+    else:
+        with TpgSimulator(
+            table=table,
+            load_delay=args.load_delay,
+            apply_delay=args.apply_delay,
+            put_delay=args.put_delay,
+        ) as tpg_sim:
+            # before the first connection, epics and p4p read it then
+            os.environ.update(tpg_sim.get_client_env())
+            for result in run_benchmarks(
+                tpg_sim.globals, table, tpg_sim.post_table, args.cycles
+            ):
+                print(json.dumps(result), flush=True)
+                results.append(result)
+
+    if args.trace:
+        tracer.stop()
+        tracer.write(args.trace)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            for result in results:
+                output_file.write(json.dumps(result) + "\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+synthetic_table.py
+
+Makes synthetic pattern tables with the globals.PATTERN_KEYS columns,
+for benchmarks and sizing, at any number of rows
+
+usage: python benchmarks/synthetic_table.py ROWS
+prints the column types and a few rows
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ScPatternSelect.tools.globals import globals
+
+# rates to the SC dests, 0 most often like the real table
+SC_RATES = [0, 0, 0, 0, 1, 10, 50, 100, 120, 500, 1000, 1020, 10000, 100000, 929000]
+LASER_RATES = [0, 1000, 10000, 100000, 929000]
+# only columns of these suffixes hold numbers, like the pattern NTTable
+INT_KEYS = ["RUN_COUNT"] + [
+    key
+    for key in globals.PATTERN_KEYS
+    if key.endswith(
+        (globals.RATE_SFX, globals.BUNCHES_PER_TRAIN_SFX, globals.BUNCH_SPACING_SFX)
+    )
+]
+# columns -> p4p Type of the NTTable, see wrap_nttable
+NTTABLE_TYPES = {}
+
+
+def make_pattern_table(num_rows: int, seed: int = 0, verified_fraction=0.8):
+    """
+    returns a column name -> column values dictionary shaped like the
+    "value" of the pattern NTTable from p4p, numeric columns are int32
+    arrays and string columns are lists of str
+
+    every pattern name is unique, rates and timing sources are random
+    so most rows have a different rate key
+    """
+    rng = np.random.default_rng(seed)
+    table = {}
+    for dest in globals.DEST_NAMES:
+        rates = SC_RATES
+        if dest == "LASER":
+            rates = LASER_RATES
+        dest_rates = rng.choice(rates, num_rows).astype(np.int32)
+        time_srcs = np.array(globals.TIME_SRCS, dtype=object)[
+            rng.choice(len(globals.TIME_SRCS), num_rows, p=[0.2, 0.7, 0.05, 0.05])
+        ]
+        time_srcs[dest_rates == 0] = "None"
+
+        table[f"{dest}{globals.RATE_SFX}"] = dest_rates
+        table[f"{dest}{globals.TSOURCE_SFX}"] = time_srcs.tolist()
+        table[f"{dest}{globals.BUNCHES_PER_TRAIN_SFX}"] = rng.integers(
+            0, 4, num_rows, dtype=np.int32
+        )
+        table[f"{dest}{globals.BUNCH_SPACING_SFX}"] = rng.integers(
+            0, 20, num_rows, dtype=np.int32
+        )
+
+    sxr_rates = table[f"SC_SXR{globals.RATE_SFX}"].tolist()
+    hxr_rates = table[f"SC_HXR{globals.RATE_SFX}"].tolist()
+    table["PATTERN_NAME"] = [
+        f"SC_{hxr}_{sxr}_Hz_{row_num}"
+        for row_num, (hxr, sxr) in enumerate(zip(hxr_rates, sxr_rates))
+    ]
+    table["RUN_COUNT"] = rng.integers(0, 1000, num_rows, dtype=np.int32)
+    table["LAST_RUN"] = [
+        f"2024-{month:02d}-01" for month in rng.integers(1, 13, num_rows).tolist()
+    ]
+    table["IS_VERIFIED"] = np.where(
+        rng.random(num_rows) < verified_fraction, "True", "False"
+    ).tolist()
+    table["TAGS"] = [""] * num_rows
+
+    return {key: table[key] for key in globals.PATTERN_KEYS}
+
+
+def wrap_nttable(table):
+    """
+    returns the table as a p4p NTTable Value, like the one the TPG serves
+    """
+    from p4p import Value
+    from p4p.nt import NTTable
+
+    columns = tuple((key, "i" if key in INT_KEYS else "s") for key in table)
+    # one type per set of columns, a p4p server only posts values of its type
+    if columns not in NTTABLE_TYPES:
+        NTTABLE_TYPES[columns] = NTTable(list(columns)).type
+
+    return Value(NTTABLE_TYPES[columns], {"labels": list(table), "value": table})
+
+
+def main():
+    num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    table = make_pattern_table(num_rows)
+    for key, values in table.items():
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        print(f"{key:30} {type(values).__name__:8} {list(values[:3])}")
+
+
+if __name__ == "__main__":
+    main()
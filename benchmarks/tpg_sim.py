@@ -0,0 +1,308 @@
+"""
+tpg_sim.py
+
+Contains TpgSimulator, a local stand in for the TPG IOC
+serves the pattern NTTable with a p4p server and the CA PVs ScPatternSelect
+uses with a caproto server, both on 127.0.0.1 only
+    MANUAL_PATH, MANUAL_LOAD, APPLY, PATT_PATH_LOADED, PATT_PATH_APPLIED,
+    TPG_BEAM_OFF, TPG_BC_RESET and the DST0x timing readbacks
+loading and applying show up on the readbacks after configurable delays
+needs caproto, which ScPatternSelect itself does not use
+
+usage: python benchmarks/tpg_sim.py [--rows N] [--load-delay S] ...
+prints the environment a client needs, then serves until ctrl-c
+"""
+
+import os
+import sys
+import time
+import types
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_table import make_pattern_table, wrap_nttable
+from ScPatternSelect.tools.globals import globals
+
+# channel access clients only look for the simulator on the loopback
+CA_CLIENT_ENV = {
+    "EPICS_CA_ADDR_LIST": "127.0.0.1",
+    "EPICS_CA_AUTO_ADDR_LIST": "NO",
+}
+
+
+def make_tpg_group(globals_, load_delay, apply_delay, put_delay):
+    """
+    returns a caproto PVGroup instance with the TPG CA PVs
+
+    input
+    -------
+    globals_:
+        globals of the TPG, gives the PV names
+    load_delay, apply_delay:
+        seconds from the MANUAL_LOAD and APPLY puts to the
+        PATT_PATH_LOADED and PATT_PATH_APPLIED updates
+    put_delay:
+        seconds every put takes to complete
+    """
+    from caproto import ChannelType
+    from caproto.server import PVGroup, pvproperty
+
+    def path_pvproperty(pvname, read_only):
+        return pvproperty(
+            value="",
+            dtype=ChannelType.CHAR,
+            max_length=256,
+            string_encoding="utf-8",
+            name=pvname,
+            read_only=read_only,
+        )
+
+    tpg_base = globals_.get_tpg_base_pv()
+
+    def pvname(full_pvname):
+        return full_pvname[len(tpg_base) + 1 :]
+
+    async def wait_put(group, instance, value):
+        await asyncio.sleep(put_delay)
+        return value
+
+    async def load(group, instance, value):
+        async def loaded():
+            await asyncio.sleep(load_delay)
+            await group.patt_path_loaded.write(group.manual_path.value)
+
+        asyncio.get_running_loop().create_task(loaded())
+        return await wait_put(group, instance, value)
+
+    async def apply(group, instance, value):
+        async def applied():
+            await asyncio.sleep(apply_delay)
+            await group.patt_path_applied.write(group.patt_path_loaded.value)
+
+        asyncio.get_running_loop().create_task(applied())
+        return await wait_put(group, instance, value)
+
+    pvproperties = {
+        "manual_path": path_pvproperty(pvname(globals_.get_path_set_pv()), False),
+        "patt_path_loaded": path_pvproperty(
+            pvname(globals_.get_pattern_loaded_pv()), True
+        ),
+        "patt_path_applied": path_pvproperty(
+            pvname(globals_.get_pattern_running_pv()), True
+        ),
+        "manual_load": pvproperty(value=0, name=pvname(globals_.get_load_pv())),
+        "apply": pvproperty(value=0, name=pvname(globals_.get_apply_pv())),
+        "beam_stop": pvproperty(
+            value=0, name=pvname(globals_.get_beam_stop_pv()), record="bo"
+        ),
+        "tpg_bc_reset": pvproperty(
+            value=0, name=pvname(globals_.get_tpg_bc_reset_pv()), record="bo"
+        ),
+    }
+    for dest_num in range(len(globals_.DEST_NAMES)):
+        dest_pvs = globals_.get_dest_pvs(dest_num)
+        pvproperties[f"dst{dest_num}_time_src"] = pvproperty(
+            value="FR",
+            dtype=ChannelType.ENUM,
+            enum_strings=globals_.TIME_SRCS,
+            name=pvname(dest_pvs["time_src"]),
+        )
+        pvproperties[f"dst{dest_num}_offset"] = pvproperty(
+            value=0, name=pvname(dest_pvs["offset"]), read_only=True
+        )
+        pvproperties[f"dst{dest_num}_timeslot"] = pvproperty(
+            value=1, name=pvname(dest_pvs["timeslot"])
+        )
+        pvproperties[f"dst{dest_num}_timeslot_mask"] = pvproperty(
+            value=0x3F, name=pvname(dest_pvs["timeslot_mask"])
+        )
+
+    for name in ("manual_path", "beam_stop", "tpg_bc_reset"):
+        pvproperties[name] = pvproperties[name].putter(wait_put)
+    pvproperties["manual_load"] = pvproperties["manual_load"].putter(load)
+    pvproperties["apply"] = pvproperties["apply"].putter(apply)
+
+    TpgGroup = types.new_class(
+        "TpgGroup", (PVGroup,), exec_body=lambda ns: ns.update(pvproperties)
+    )
+    return TpgGroup(f"{tpg_base}:")
+
+
+class TpgSimulator:
+    def __init__(
+        self,
+        system: str = "SYS0",
+        unit: str = "1",
+        table=None,
+        load_delay: float = 0.01,
+        apply_delay: float = 0.01,
+        put_delay: float = 0.0,
+    ):
+        """
+        local stand in for the TPG IOC, use start and stop or with
+
+        input
+        -------
+        system, unit:
+            the TPG to stand in for
+        table:
+            column name -> column values of the pattern NTTable,
+            None: a synthetic table of 100 rows
+        load_delay, apply_delay:
+            seconds from the load and apply puts to the readback updates
+        put_delay:
+            seconds every CA put takes to complete
+        """
+        self.globals = globals(system, unit, "")
+        self.load_delay = load_delay
+        self.apply_delay = apply_delay
+        self.put_delay = put_delay
+        if table is None:
+            table = make_pattern_table(100)
+        self.table = table
+        self.patt_table_pv = None
+        self.pva_server = None
+        self.ca_loop = None
+        self.ca_task = None
+        self.ca_thread = None
+        self.ca_ready = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self, timeout: float = 5.0):
+        """
+        starts both servers, returns once they are serving
+        """
+        from p4p.server import Server
+        from p4p.server.thread import SharedPV
+
+        self.patt_table_pv = SharedPV(initial=self.get_patt_table_value(self.table))
+        # isolate picks free ports on the loopback, see get_client_env
+        self.pva_server = Server(
+            providers=[{self.globals.get_patt_table_name(): self.patt_table_pv}],
+            isolate=True,
+        )
+
+        self.ca_thread = threading.Thread(
+            target=self.run_ca_server, name="TpgSimulator", daemon=True
+        )
+        self.ca_thread.start()
+        if not self.ca_ready.wait(timeout):
+            raise TimeoutError("the CA server did not start")
+
+    def run_ca_server(self):
+        """
+        runs the caproto server on its own event loop, on ca_thread
+        """
+        from caproto.asyncio.server import Context
+
+        group = make_tpg_group(
+            self.globals, self.load_delay, self.apply_delay, self.put_delay
+        )
+
+        async def on_startup(async_lib):
+            self.ca_ready.set()
+
+        async def serve():
+            # caproto makes its queues on the running loop
+            context = Context(group.pvdb, interfaces=["127.0.0.1"])
+            await context.run(startup_hook=on_startup)
+
+        self.ca_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.ca_loop)
+        self.ca_task = self.ca_loop.create_task(serve())
+        try:
+            self.ca_loop.run_until_complete(self.ca_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # let the server tasks finish cancelling before closing the loop
+            tasks = asyncio.all_tasks(self.ca_loop)
+            for task in tasks:
+                task.cancel()
+            self.ca_loop.run_until_complete(
+                asyncio.gather(*tasks, return_exceptions=True)
+            )
+            self.ca_loop.close()
+
+    def stop(self):
+        """
+        stops both servers
+        """
+        if self.pva_server is not None:
+            self.pva_server.stop()
+            self.pva_server = None
+
+        if self.ca_thread is not None:
+            self.ca_loop.call_soon_threadsafe(self.ca_task.cancel)
+            self.ca_thread.join()
+            self.ca_thread = None
+
+    def get_client_env(self):
+        """
+        returns the environment variables a client needs to find the
+        simulator, set them before the client makes its first connection
+        """
+        client_env = dict(CA_CLIENT_ENV)
+        for key, value in self.pva_server.conf().items():
+            if key.startswith("EPICS_PVA_"):
+                client_env[key] = value
+
+        return client_env
+
+    def get_patt_table_value(self, table):
+        """
+        returns table as a pattern NTTable value stamped with the time now
+        """
+        value = wrap_nttable(table)
+        now = time.time()
+        value["timeStamp.secondsPastEpoch"] = int(now)
+        value["timeStamp.nanoseconds"] = int(now % 1 * 1e9)
+        return value
+
+    def post_table(self, table):
+        """
+        serves a new pattern table, monitors get it as an update
+        """
+        self.table = table
+        self.patt_table_pv.post(self.get_patt_table_value(table))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--system", default="SYS0")
+    parser.add_argument("--unit", default="1")
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--load-delay", type=float, default=0.01)
+    parser.add_argument("--apply-delay", type=float, default=0.01)
+    parser.add_argument("--put-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with TpgSimulator(
+        args.system,
+        args.unit,
+        make_pattern_table(args.rows),
+        args.load_delay,
+        args.apply_delay,
+        args.put_delay,
+    ) as tpg_sim:
+        for key, value in tpg_sim.get_client_env().items():
+            print(f"export {key}={value}")
+        print(f"serving {tpg_sim.globals.get_tpg_base_pv()}, ctrl-c to stop")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -102,6 +102,20 @@ print(
     f"The same pattern as before, with bsyd automatically accounted for: {pattern_name}\n"
 )
 
+# when looking up many destination configurations at once use
+# get_pattern_names_by_rate, it takes a list of dest_data dictionaries
+# or an array of rates with one column per dest number 1-5
+# and returns a list of pattern names, None where there is no pattern
+pattern_names = patt_sel.get_pattern_names_by_rate(
+    [{4: [10, "FR"]}, {4: [1326, "FR"]}, {1: [10, "FR"], 4: [10, "AC"]}]
+)
+print(f"Patterns for several configurations: {pattern_names}\n")
+
+# if there is no pattern with the exact rates get_nearest_patterns
+# returns the closest patterns and their distance from the request
+nearest_patterns = patt_sel.get_nearest_patterns({4: [120, "FR"]}, num_patterns=3)
+print(f"Patterns closest to 120Hz FR to SXR: {nearest_patterns}\n")
+
 
 # Once you have a pattern name you can use the run_pattern function to
 # Load and apply the pattern to the machiene
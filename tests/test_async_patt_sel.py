@@ -0,0 +1,67 @@
+"""
+unit tests for the AsyncScPatternSelect class
+This will test load and apply patterns to the TPG, only run on dev
+"""
+
+import asyncio
+import unittest
+import ScPatternSelect
+from epics import caput
+
+
+class TestAsyncPattSel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.patt_sel = ScPatternSelect.AsyncScPatternSelect(
+            "SYS0", "1", "sioc-sys0-ts01"
+        )
+        await self.patt_sel.connect()
+        # test_transport.py runs the same on a LocalTransport offline
+        if not await self.patt_sel.get_is_patt_table_available():
+            await self.patt_sel.close()
+            self.skipTest("the TPG is not available, only run on dev")
+
+    async def asyncTearDown(self) -> None:
+        await self.patt_sel.close()
+
+    async def test_table_queries(self):
+        self.assertTrue(await self.patt_sel.get_is_patt_table_available())
+        self.assertTrue(await self.patt_sel.pattern_exists("SC_SXR_STD_FR_1_Hz_off_7"))
+        self.assertEqual(
+            await self.patt_sel.get_pattern_row_num("name_that_will_never_exist"), -1
+        )
+        self.assertEqual(
+            await self.patt_sel.get_relative_pattern_path("SC_BSYD_EXP_AC_B_110_Hz"),
+            "test/SC_BSYD_EXP_AC_B_110_Hz",
+        )
+
+    async def test_run_pattern(self):
+        """
+        test running a pattern, the readbacks are set by hand
+        when there is no pattern programmer
+        """
+        self.assertFalse(await self.patt_sel.run_pattern("name_that_will_never_exist"))
+
+        rel_patt_path = await self.patt_sel.get_relative_pattern_path(
+            "SC_SXR_STD_FR_10_Hz_off_7"
+        )
+        self.assertEqual(
+            caput(self.patt_sel.globals.get_pattern_loaded_pv(), rel_patt_path), 1
+        )
+        self.assertEqual(
+            caput(self.patt_sel.globals.get_pattern_running_pv(), rel_patt_path), 1
+        )
+
+        self.assertTrue(await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz_off_7"))
+        self.assertEqual(
+            await self.patt_sel.get_pattern_running(), "SC_SXR_STD_FR_10_Hz_off_7"
+        )
+
+    async def test_concurrent_readbacks(self):
+        pattern_names = await asyncio.gather(
+            *(self.patt_sel.get_pattern_running() for _ in range(10))
+        )
+        self.assertEqual(len(set(pattern_names)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
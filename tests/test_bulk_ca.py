@@ -0,0 +1,122 @@
+"""
+unit tests for caget_many and connect_many
+epics.ca is replaced by a local stand in, these do not need an IOC
+"""
+
+import time
+import types
+import unittest
+from collections import defaultdict
+from unittest import mock
+import epics
+from ScPatternSelect.tools.bulk_ca import caget_many, connect_many
+
+DOUBLE = 6
+
+
+class LocalCA:
+    """
+    stands in for epics.ca, the connected channels answer gets with
+    their value on the next poll, the others never answer
+    get_complete polls until the answer or the timeout, like pyepics
+    """
+
+    def __init__(self, connected=(), values=None):
+        self.connected = set(connected)
+        self.values = values or {}
+        self.get_results = {}
+        self.polls = []
+        self.completed = []
+
+    def create_channel(self, pvname, connect=False, auto_cb=True):
+        return pvname
+
+    def isConnected(self, chid):
+        return chid in self.connected
+
+    def field_type(self, chid):
+        return DOUBLE
+
+    def get(self, chid, ftype=None, wait=True):
+        self.get_results[(chid, ftype)] = None
+
+    def poll(self, evt=1.0e-5, iot=1.0):
+        self.polls.append((evt, iot))
+        self.process_events(evt)
+
+    def process_events(self, evt):
+        for (pvname, ftype), value in self.get_results.items():
+            if value is None and pvname in self.values:
+                self.get_results[(pvname, ftype)] = self.values[pvname]
+        time.sleep(evt)
+
+    def get_complete(self, chid, ftype=None, timeout=None):
+        # its polls do not wait in pend_io, nothing is outstanding there
+        self.completed.append(chid)
+        start = time.time()
+        while self.get_results[(chid, ftype)] is None:
+            self.process_events(1.0e-5)
+            if time.time() - start > timeout:
+                return None
+
+        return self.get_results[(chid, ftype)]
+
+
+class TestBulkCA(unittest.TestCase):
+    def caget_many(self, ca, *args):
+        with mock.patch.object(epics, "ca", ca):
+            start = time.monotonic()
+            values = caget_many(*args)
+            return values, time.monotonic() - start
+
+    def assert_polls_bounded(self, ca, timeout):
+        self.assertTrue(ca.polls)
+        for evt, iot in ca.polls:
+            self.assertLessEqual(evt, timeout)
+            self.assertLessEqual(iot, timeout)
+
+    def test_timeout(self):
+        ca = LocalCA()
+        values, elapsed = self.caget_many(ca, ["A", "B"], (), 0.05)
+        self.assertEqual(values, {"A": None, "B": None})
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 0.5)
+        self.assert_polls_bounded(ca, 0.05)
+        # nothing connected, so no get went out
+        self.assertEqual(ca.completed, [])
+
+    def test_partial_connect(self):
+        ca = LocalCA(connected=["A", "B"], values={"A": 1.5})
+        values, elapsed = self.caget_many(ca, ["A", "B", "C"], ["B"], 0.05)
+        self.assertEqual(values, {"A": 1.5, "B": None, "C": None})
+        self.assertLess(elapsed, 0.5)
+        self.assert_polls_bounded(ca, 0.05)
+        self.assertEqual(ca.completed, ["A", "B"])
+        self.assertIn(("B", epics.dbr.STRING), ca.get_results)
+
+    def test_all_answered(self):
+        ca = LocalCA(connected=["A", "B"], values={"A": 1.5, "B": 2.5})
+        values, elapsed = self.caget_many(ca, ["A", "B"], (), 5.0)
+        self.assertEqual(values, {"A": 1.5, "B": 2.5})
+        self.assertLess(elapsed, 0.5)
+
+    def test_connect_many(self):
+        ca = LocalCA()
+        pvs = {
+            "A": types.SimpleNamespace(connected=True),
+            "B": types.SimpleNamespace(connected=False),
+        }
+        with mock.patch.object(epics, "ca", ca), mock.patch.object(
+            epics, "get_pv", lambda pvname, connect=False: pvs[pvname]
+        ):
+            self.assertEqual(connect_many(["A", "B"]), ["B"])
+            self.assertEqual(ca.polls, [])
+
+            start = time.monotonic()
+            self.assertEqual(connect_many(["A", "B"], 0.05), ["B"])
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assert_polls_bounded(ca, 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
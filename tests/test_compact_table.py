@@ -0,0 +1,110 @@
+"""
+unit tests for the CompactPatternTable class
+These use a hand made table and do not need the TPG
+"""
+
+import unittest
+import numpy as np
+from ScPatternSelect.tools.compact_table import CompactPatternTable
+from test_pattern_table import make_table
+
+
+class TestCompactPatternTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.rows = [
+            {
+                "PATTERN_NAME": "SC_SXR_STD_FR_10_Hz",
+                "IS_VERIFIED": "True",
+                "RUN_COUNT": 70000,
+                "SC_SXR_RATE_Hz": 10,
+                "SC_SXR_TIMING_SOURCE": "FR",
+                "SC_SXR_BUNCHES_PER_TRAIN": 2,
+                "TAGS": "SC_SXR_STD_FR_10_Hz",
+            },
+            {
+                "PATTERN_NAME": "SC_SXR_EXP_FR_1.3_kHz",
+                "IS_VERIFIED": "False",
+                "SC_SXR_RATE_Hz": 1326,
+                "SC_SXR_TIMING_SOURCE": "AC",
+                "SC_SXR_BUNCH_SPACING": -1,
+            },
+        ]
+        cls.compact = CompactPatternTable(make_table(cls.rows))
+
+        return super().setUpClass()
+
+    def test_columns(self):
+        columns = self.compact.columns
+        self.assertEqual(columns["IS_VERIFIED"].dtype, np.int8)
+        self.assertEqual(columns["SC_SXR_TIMING_SOURCE"].dtype, np.int8)
+        self.assertEqual(columns["SC_SXR_RATE_Hz"].dtype, np.int32)
+        self.assertEqual(columns["SC_SXR_BUNCHES_PER_TRAIN"].dtype, np.int8)
+        self.assertEqual(columns["RUN_COUNT"].dtype, np.int32)
+        self.assertEqual(columns["PATTERN_NAME"].dtype, np.int32)
+
+        # a name used as a tag is pooled once
+        self.assertEqual(
+            self.compact.strings.tolist(),
+            ["SC_SXR_STD_FR_10_Hz", "SC_SXR_EXP_FR_1.3_kHz", ""],
+        )
+        self.assertEqual(columns["TAGS"].tolist(), [0, 2])
+
+        # rate columns are views into the rates array
+        self.assertTrue(np.shares_memory(columns["SC_SXR_RATE_Hz"], self.compact.rates))
+
+    def test_decode(self):
+        self.assertEqual(list(self.compact), list(make_table([])))
+        self.assertEqual(self.compact["SC_SXR_TIMING_SOURCE"].tolist(), ["FR", "AC"])
+        self.assertEqual(self.compact["IS_VERIFIED"].tolist(), ["True", "False"])
+
+        row = self.compact.get_row(1)
+        self.assertEqual(row["PATTERN_NAME"], "SC_SXR_EXP_FR_1.3_kHz")
+        self.assertEqual(row["SC_SXR_RATE_Hz"], 1326)
+        self.assertEqual(row["SC_SXR_BUNCH_SPACING"], -1)
+        self.assertEqual(row["SC_HXR_TIMING_SOURCE"], "None")
+        self.assertEqual(row["TAGS"], "")
+
+    def test_round_trip(self):
+        table = make_table(self.rows)
+        table["SC_SXR_RATE_Hz"] = np.array([10.5, 1326.0])
+        table["SC_HXR_RATE_Hz"] = np.array([0, 3000000000], dtype=np.int64)
+        table["RUN_COUNT"] = np.array([0.25, 70000.0], dtype=np.float32)
+        table["SC_SXR_BUNCH_SPACING"] = np.array([True, False])
+        compact = CompactPatternTable(table)
+
+        for row_num in range(2):
+            row = compact.get_row(row_num)
+            for key, values in table.items():
+                value = np.asarray(values)[row_num].item()
+                self.assertEqual(row[key], value, key)
+                self.assertEqual(type(row[key]), type(value), key)
+
+        # the queries compare rates like int()
+        self.assertEqual(compact.rates.dtype, np.int64)
+        self.assertEqual(compact.rates[:, 4].tolist(), [10, 1326])
+        self.assertEqual(compact.rates[:, 3].tolist(), [0, 3000000000])
+
+    def test_many_categories(self):
+        time_srcs = [f"SRC{num}" for num in range(300)]
+        table = make_table(
+            [{"SC_SXR_TIMING_SOURCE": time_src} for time_src in time_srcs]
+        )
+        compact = CompactPatternTable(table)
+
+        self.assertEqual(compact.time_src_codes.dtype, np.int16)
+        self.assertEqual(compact["SC_SXR_TIMING_SOURCE"].tolist(), time_srcs)
+        self.assertEqual(compact.get_row(299)["SC_SXR_TIMING_SOURCE"], "SRC299")
+
+    def test_memory_footprint(self):
+        footprint = self.compact.get_memory_footprint()
+        self.assertEqual(footprint["SC_SXR_RATE_Hz"], 8)
+        self.assertEqual(footprint["SC_SXR_TIMING_SOURCE"], 2)
+        self.assertEqual(
+            footprint["total"],
+            sum(value for key, value in footprint.items() if key != "total"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+"""
+unit tests for the ConnectionPool and PatternTableMonitor classes
+The PVA context is replaced by a local stand in, these do not need the TPG
+"""
+
+import os
+import types
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from ScPatternSelect import ScPatternSelect
+from ScPatternSelect.tools import ConnectionPool, PatternTableCache
+from test_pattern_table import make_table
+
+
+class LocalContext:
+    """
+    stands in for p4p.client.thread.Context, the test posts the tables
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+        self.tables = {}
+        self.num_gets = 0
+        self.is_closed = False
+
+    def get(self, name, request=None, timeout=5.0):
+        self.num_gets += 1
+        if name not in self.tables:
+            raise TimeoutError(f"Timeout getting {name}")
+
+        return self.tables[name]
+
+    def monitor(self, name, callback, notify_disconnect=False):
+        self.callbacks[name] = callback
+        return types.SimpleNamespace(close=lambda: None)
+
+    def close(self):
+        self.is_closed = True
+
+
+class MonitorValue(dict):
+    """
+    stands in for a p4p Value from a monitor, counts the reads of the
+    table and marks the fields that changed like Value.changedSet
+    """
+
+    def __init__(self, table, timestamp, changed_set=("value",)):
+        super().__init__(
+            value=table,
+            timeStamp={
+                "secondsPastEpoch": timestamp,
+                "nanoseconds": 0,
+                "userTag": 0,
+            },
+        )
+        self.changed_set = set(changed_set)
+        self.num_table_reads = 0
+
+    def __getitem__(self, key):
+        if key == "value":
+            self.num_table_reads += 1
+        return super().__getitem__(key)
+
+    def changedSet(self):
+        return self.changed_set
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = ConnectionPool()
+        self.pool.pva = self.pva = LocalContext()
+        self.patt_sels = [
+            ScPatternSelect("SYS0", "1", "", connect=False) for _ in range(2)
+        ]
+        self.patt_table_name = self.patt_sels[0].globals.get_patt_table_name()
+
+        return super().setUp()
+
+    def make_table(self, pattern_name):
+        return make_table(
+            [
+                {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+                {"PATTERN_NAME": pattern_name, "IS_VERIFIED": "True"},
+            ]
+        )
+
+    def post(self, pattern_name):
+        self.pva.callbacks[self.patt_table_name](
+            {"value": self.make_table(pattern_name)}
+        )
+
+    def test_shared_snapshot(self):
+        monitors = [
+            self.pool.acquire_patt_table_monitor(self.patt_table_name, patt_sel)
+            for patt_sel in self.patt_sels
+        ]
+        self.assertIs(monitors[0], monitors[1])
+        self.assertEqual(self.pool.get_ref_counts()[self.patt_table_name], 2)
+
+        self.post("SC_SXR_STD_FR_10_Hz")
+        first, second = self.patt_sels
+        self.assertIs(first.patt_table_snapshot, second.patt_table_snapshot)
+        self.assertTrue(second.pattern_exists("SC_SXR_STD_FR_10_Hz"))
+
+        # a late subscriber gets the current snapshot right away
+        late = ScPatternSelect("SYS0", "1", "", connect=False)
+        self.pool.acquire_patt_table_monitor(self.patt_table_name, late)
+        self.assertIs(late.patt_table_snapshot, first.patt_table_snapshot)
+        self.assertTrue(late.wait_ready(0))
+
+    def test_unchanged_update(self):
+        monitor = self.pool.acquire_patt_table_monitor(
+            self.patt_table_name, self.patt_sels[0]
+        )
+        callback = self.pva.callbacks[self.patt_table_name]
+        callback(MonitorValue(self.make_table("SC_SXR_STD_FR_10_Hz"), 100))
+        snapshot = monitor.patt_table_snapshot
+
+        # only the timeStamp changed, the table is not read
+        value = MonitorValue(
+            self.make_table("SC_SXR_STD_FR_20_Hz"), 101, ["timeStamp.secondsPastEpoch"]
+        )
+        callback(value)
+        self.assertEqual(value.num_table_reads, 0)
+        self.assertIs(monitor.patt_table_snapshot, snapshot)
+
+        # the same timeStamp as the table of the snapshot
+        value = MonitorValue(self.make_table("SC_SXR_STD_FR_20_Hz"), 100)
+        callback(value)
+        self.assertEqual(value.num_table_reads, 0)
+        self.assertIs(self.patt_sels[0].patt_table_snapshot, snapshot)
+
+        # a new table is read
+        callback(MonitorValue(self.make_table("SC_SXR_STD_FR_20_Hz"), 102))
+        self.assertEqual(monitor.patt_table_version, 2)
+        self.assertTrue(self.patt_sels[0].pattern_exists("SC_SXR_STD_FR_20_Hz"))
+
+        # after the table was unavailable the same table is read again
+        monitor.get_pattern_table(0)
+        self.assertFalse(self.patt_sels[0].get_is_patt_table_available())
+        callback(MonitorValue(self.make_table("SC_SXR_STD_FR_20_Hz"), 102))
+        self.assertTrue(self.patt_sels[0].get_is_patt_table_available())
+        self.assertEqual(monitor.patt_table_version, 3)
+
+    def test_monitor_value(self):
+        monitor = self.pool.acquire_patt_table_monitor(
+            self.patt_table_name, self.patt_sels[0]
+        )
+        # the table delivered by the monitor is used, without a get
+        self.post("SC_SXR_STD_FR_10_Hz")
+        self.post("SC_SXR_STD_FR_20_Hz")
+        self.assertEqual(self.pva.num_gets, 0)
+        self.assertEqual(monitor.patt_table_version, 2)
+        self.assertTrue(self.patt_sels[0].pattern_exists("SC_SXR_STD_FR_20_Hz"))
+
+    def test_monitor_error(self):
+        self.pool.acquire_patt_table_monitor(self.patt_table_name, self.patt_sels[0])
+        callback = self.pva.callbacks[self.patt_table_name]
+
+        # a disconnect before the first table is left to ScPatternSelect
+        callback(Exception("disconnected"))
+        self.assertEqual(self.pva.num_gets, 0)
+
+        # after that an error falls back to a get
+        self.post("SC_SXR_STD_FR_10_Hz")
+        self.pva.tables[self.patt_table_name] = {
+            "value": self.make_table("SC_SXR_STD_FR_20_Hz")
+        }
+        callback(Exception("disconnected"))
+        self.assertEqual(self.pva.num_gets, 1)
+        self.assertTrue(self.patt_sels[0].pattern_exists("SC_SXR_STD_FR_20_Hz"))
+
+        # and the table is unavailable if the get times out
+        del self.pva.tables[self.patt_table_name]
+        callback(Exception("disconnected"))
+        self.assertEqual(self.pva.num_gets, 2)
+        self.assertFalse(self.patt_sels[0].get_is_patt_table_available())
+
+    def test_release(self):
+        for patt_sel in self.patt_sels:
+            self.pool.acquire_patt_table_monitor(self.patt_table_name, patt_sel)
+
+        first, second = self.patt_sels
+        self.pool.release_patt_table_monitor(self.patt_table_name, first)
+        self.post("SC_SXR_STD_FR_10_Hz")
+        self.assertIsNone(first.patt_table_snapshot)
+        self.assertEqual(second.get_num_patterns(), 2)
+        self.assertFalse(self.pva.is_closed)
+
+        self.pool.release_patt_table_monitor(self.patt_table_name, second)
+        self.assertTrue(self.pva.is_closed)
+        self.assertIsNone(self.pool.pva)
+        self.assertEqual(self.pool.get_ref_counts(), {"pva": 0})
+
+    def test_cache_writes(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            patt_sels = [
+                ScPatternSelect("SYS0", "1", "", cache_dir=cache_dir, connect=False)
+                for _ in range(3)
+            ]
+            monitor = None
+            for patt_sel in patt_sels:
+                monitor = self.pool.acquire_patt_table_monitor(
+                    self.patt_table_name, patt_sel, patt_sel.patt_table_cache
+                )
+            (cache_writer,) = monitor.cache_writers.values()
+
+            threads = []
+            write = PatternTableCache.write
+
+            def record_write(cache, table, timestamp=None):
+                threads.append(threading.current_thread())
+                return write(cache, table, timestamp)
+
+            # one write per update for all the subscribers, and not on
+            # the thread of the monitor callback
+            with mock.patch.object(PatternTableCache, "write", record_write):
+                callback = self.pva.callbacks[self.patt_table_name]
+                callback(MonitorValue(self.make_table("SC_SXR_STD_FR_10_Hz"), 100))
+                self.assertTrue(cache_writer.flush(5.0))
+                callback(MonitorValue(self.make_table("SC_SXR_STD_FR_20_Hz"), 101))
+                self.assertTrue(cache_writer.flush(5.0))
+
+            self.assertEqual(len(threads), 2)
+            self.assertNotIn(threading.current_thread(), threads)
+
+            # a new instance starts from the cached table
+            cached = ScPatternSelect(
+                "SYS0", "1", "", cache_dir=cache_dir, connect=False
+            )
+            self.assertTrue(cached.pattern_exists("SC_SXR_STD_FR_20_Hz"))
+            self.assertEqual(cached.patt_table_cache_timestamp, (101, 0, 0))
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+unit tests for the pv names built by the globals class
+These do not need the TPG
+"""
+
+import unittest
+from ScPatternSelect.tools import globals
+
+
+class TestGlobalsPvs(unittest.TestCase):
+    def setUp(self) -> None:
+        self.globals = globals("SYS0", "1", "sioc-sys0-ts01")
+
+        return super().setUp()
+
+    def test_tpg_pvs(self):
+        self.assertEqual(self.globals.get_tpg_base_pv(), "TPG:SYS0:1")
+        self.assertEqual(self.globals.get_patt_table_name(), "TPG:SYS0:1:PATTERNS")
+        self.assertEqual(self.globals.get_beam_stop_pv(), "TPG:SYS0:1:TPG_BEAM_OFF")
+        self.assertEqual(
+            self.globals.get_tpg_bc_reset_proc_pv(), "TPG:SYS0:1:TPG_BC_RESET.PROC"
+        )
+        self.assertIn("TPG:SYS0:1:MANUAL_LOAD", self.globals.get_ca_pvs())
+
+    def test_dest_pvs(self):
+        self.assertEqual(
+            self.globals.get_timeing_source_pv("SC_SXR"), "TPG:SYS0:1:DST04:TIME_SRC"
+        )
+        self.assertEqual(
+            self.globals.get_dest_timeslot_mask_pv(4),
+            self.globals.get_dest_pvs("SC_SXR")["timeslot_mask"],
+        )
+        with self.assertRaises(ValueError):
+            self.globals.get_offset_pv("SC_NOPE")
+        with self.assertRaises(ValueError):
+            self.globals.get_offset_pv(len(globals.DEST_NAMES))
+
+    def test_invalid_name(self):
+        with self.assertRaises(AssertionError):
+            globals("SYS 0", "1", "")
+
+
+if __name__ == "__main__":
+    unittest.main()
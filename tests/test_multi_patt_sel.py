@@ -0,0 +1,101 @@
+"""
+unit tests for the MultiScPatternSelect class
+The units are not connected and are given tables directly,
+these do not need the TPG
+"""
+
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from ScPatternSelect import MultiScPatternSelect, ScPatternSelect
+from test_pattern_table import make_table
+
+
+class TestMultiScPatternSelect(unittest.TestCase):
+    def setUp(self) -> None:
+        self.multi = MultiScPatternSelect(
+            [("SYS0", "1", ""), ("SYS0", "2", "")], connect=False
+        )
+        for unit_num, patt_sel in enumerate(self.multi.patt_sels.values()):
+            table = make_table(
+                [
+                    {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+                    {
+                        "PATTERN_NAME": f"SC_SXR_STD_FR_{unit_num + 1}0_Hz",
+                        "IS_VERIFIED": "True",
+                        "SC_SXR_RATE_Hz": (unit_num + 1) * 10,
+                        "SC_SXR_TIMING_SOURCE": "FR",
+                    },
+                ]
+            )
+            patt_sel.set_pattern_table({"value": table})
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.multi.close()
+
+        return super().tearDown()
+
+    def test_query(self):
+        fan_out_result = self.multi.query("pattern_exists", "SC_SXR_STD_FR_20_Hz")
+        self.assertEqual(
+            dict(fan_out_result.items()), {("SYS0", "1"): False, ("SYS0", "2"): True}
+        )
+        self.assertEqual(set(fan_out_result.latencies), set(self.multi.get_units()))
+
+        fan_out_result = self.multi.query("get_available_rates", "SC_SXR", "FR")
+        self.assertEqual(fan_out_result[("SYS0", "2")], [0, 20])
+
+    def test_errors(self):
+        fan_out_result = self.multi.query(
+            "get_available_rates", "SC_SXR", "bad time source"
+        )
+        self.assertIsNone(fan_out_result[("SYS0", "1")])
+        self.assertIsInstance(fan_out_result.errors[("SYS0", "1")], AssertionError)
+
+    def test_concurrent(self):
+        for patt_sel in self.multi.patt_sels.values():
+            patt_sel.get_pattern_running = lambda: time.sleep(0.2) or "pattern"
+
+        fan_out_result = self.multi.get_pattern_running()
+        self.assertEqual(list(fan_out_result.results.values()), ["pattern"] * 2)
+        self.assertLess(fan_out_result.elapsed, 0.35)
+
+    def test_construction_error(self):
+        patt_sels = []
+
+        def make_patt_sel(system, unit, ioc, *args, **kwargs):
+            if unit == "2":
+                raise TimeoutError(f"unit {unit}")
+            patt_sel = ScPatternSelect(system, unit, ioc, *args, **kwargs)
+            patt_sel.close = mock.Mock(wraps=patt_sel.close)
+            patt_sels.append(patt_sel)
+            return patt_sel
+
+        module = sys.modules[MultiScPatternSelect.__module__]
+        with mock.patch.object(
+            module, "ScPatternSelect", make_patt_sel
+        ), mock.patch.object(
+            ThreadPoolExecutor,
+            "shutdown",
+            autospec=True,
+            side_effect=ThreadPoolExecutor.shutdown,
+        ) as shutdown:
+            with self.assertRaises(TimeoutError):
+                MultiScPatternSelect(
+                    [("SYS0", "1", ""), ("SYS0", "2", ""), ("SYS0", "3", "")],
+                    connect=False,
+                )
+
+        # the units that were built are closed and the threads stopped
+        self.assertEqual(len(patt_sels), 2)
+        for patt_sel in patt_sels:
+            patt_sel.close.assert_called_once()
+        shutdown.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
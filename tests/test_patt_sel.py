@@ -3,6 +3,7 @@ unit tests for the ScPatternSelect class
 This will test load and apply patterns to the TPG, only run on dev
 """
 
+import os
 import unittest
 import ScPatternSelect
 from epics import caput
@@ -16,6 +17,17 @@ class TestPattSel(unittest.TestCase):
 
         return super().setUpClass()
 
+    def wait_for_readback(self, pvname, pattern_name):
+        """
+        waits for the monitor of a readback to show a pattern put by hand,
+        the readbacks are monitored so a read right after a put can lag
+        """
+        return self.patt_sel.get_readback(pvname).wait_for(
+            lambda patt_path: patt_path is not None
+            and os.path.split(patt_path)[-1] == pattern_name,
+            1.0,
+        )
+
     def test_get_pattern_row_num(self):
         # TODO: add better tests for the cases of existing patterns
         self.assertNotEqual(
@@ -69,6 +81,12 @@ class TestPattSel(unittest.TestCase):
             ),
             1,
         )
+        self.assertTrue(
+            self.wait_for_readback(
+                self.patt_sel.globals.get_pattern_loaded_pv(),
+                "SC_SXR_STD_FR_1_Hz_off_7",
+            )
+        )
         self.assertEqual(self.patt_sel.get_pattern_loaded(), "SC_SXR_STD_FR_1_Hz_off_7")
 
         # test applying pattern that is not loaded
@@ -85,6 +103,12 @@ class TestPattSel(unittest.TestCase):
             ),
             1,
         )
+        self.assertTrue(
+            self.wait_for_readback(
+                self.patt_sel.globals.get_pattern_running_pv(),
+                "SC_SXR_STD_FR_1_Hz_off_7",
+            )
+        )
         self.assertEqual(
             self.patt_sel.get_pattern_running(), "SC_SXR_STD_FR_1_Hz_off_7"
         )
@@ -119,6 +143,10 @@ class TestPattSel(unittest.TestCase):
             self.patt_sel.get_pattern_running(), "SC_SXR_STD_FR_10_Hz_off_7"
         )
 
+        # the readbacks already show the pattern and do not update again,
+        # running it again passes once the puts complete
+        self.assertTrue(self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz_off_7"))
+
     def test_asserts(self):
         """
         test the various asert methods
@@ -0,0 +1,312 @@
+"""
+unit tests for the PatternTableSnapshot class
+These use a hand made table and do not need the TPG
+"""
+
+import unittest
+from unittest import mock
+import numpy as np
+from ScPatternSelect.tools import globals
+from ScPatternSelect.tools import PatternTableSnapshot
+
+
+def make_table(rows):
+    """
+    returns a column name -> column values dictionary in the form of the
+    pattern NTTable "value" structure, unlisted dest rates are 0 and
+    unlisted timing sources are 'None'
+    """
+    table = {key: [] for key in globals.PATTERN_KEYS}
+    for row in rows:
+        for key in globals.PATTERN_KEYS:
+            if key.endswith(globals.TSOURCE_SFX):
+                default = "None"
+            elif key in ("PATTERN_NAME", "LAST_RUN", "IS_VERIFIED", "TAGS"):
+                default = ""
+            else:
+                default = 0
+            table[key].append(row.get(key, default))
+
+    return table
+
+
+class TestPatternTableSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.rows = [
+            {
+                "PATTERN_NAME": "SC_SXR_STD_FR_10_Hz",
+                "IS_VERIFIED": "True",
+                "SC_SXR_RATE_Hz": 10,
+                "SC_SXR_TIMING_SOURCE": "FR",
+            },
+            {
+                "PATTERN_NAME": "SC_SXR_STD_AC_10_Hz",
+                "IS_VERIFIED": "True",
+                "SC_SXR_RATE_Hz": 10,
+                "SC_SXR_TIMING_SOURCE": "AC",
+            },
+            {
+                "PATTERN_NAME": "SC_SXR_EXP_FR_1.3_kHz",
+                "IS_VERIFIED": "False",
+                "SC_BSYD_RATE_Hz": 10,
+                "SC_BSYD_TIMING_SOURCE": "FR",
+                "SC_SXR_RATE_Hz": 1326,
+                "SC_SXR_TIMING_SOURCE": "FR",
+            },
+            {
+                "PATTERN_NAME": "SC_SXR_STD_FR_10_Hz",
+                "IS_VERIFIED": "False",
+            },
+        ]
+        cls.snapshot = PatternTableSnapshot(make_table(cls.rows), version=1)
+
+        return super().setUpClass()
+
+    def test_columns(self):
+        self.assertEqual(self.snapshot.num_rows, 4)
+        self.assertEqual(self.snapshot.verified.tolist(), [True, True, False, False])
+        self.assertEqual(self.snapshot.rates[:, 4].tolist(), [10, 10, 1326, 0])
+
+        with self.assertRaises(ValueError):
+            self.snapshot.rates[0, 4] = 1
+
+    def test_name_index(self):
+        # first row wins for duplicate names
+        self.assertEqual(self.snapshot.name_index["SC_SXR_STD_FR_10_Hz"], 0)
+        self.assertEqual(self.snapshot.name_index["SC_SXR_EXP_FR_1.3_kHz"], 2)
+        self.assertNotIn("name_that_will_never_exist", self.snapshot.name_index)
+
+    def test_rate_index(self):
+        # a timing source of 'None' is indexed as 'FR'
+        key = (
+            ((0, "FR"), (10, "FR"), (0, "FR"), (1326, "FR"), (0, "FR")),
+            "False",
+        )
+        self.assertEqual(self.snapshot.rate_index[key], "SC_SXR_EXP_FR_1.3_kHz")
+
+        key = (((0, "FR"), (0, "FR"), (0, "FR"), (10, "AC"), (0, "FR")), "True")
+        self.assertEqual(self.snapshot.rate_index[key], "SC_SXR_STD_AC_10_Hz")
+
+    def test_available_rates(self):
+        self.assertEqual(
+            self.snapshot.get_available_rates(4, "FR", True).tolist(), [0, 10]
+        )
+        self.assertEqual(
+            self.snapshot.get_available_rates(4, "FR", False).tolist(), [0, 1326]
+        )
+        self.assertEqual(
+            self.snapshot.get_available_rates(4, "AC", True).tolist(), [0, 10]
+        )
+        self.assertEqual(self.snapshot.get_available_rates(1, "B", True).tolist(), [0])
+        self.assertEqual(
+            self.snapshot.get_available_rates(4, "FR", False, as_string=True),
+            ("0", "1326"),
+        )
+
+    def test_nearest_rows(self):
+        # 12 Hz to SXR is closest to the 10 Hz patterns, the AC one is left out
+        rows, distances = self.snapshot.find_nearest_rows(
+            [0, 0, 0, 12, 0], ["FR"] * 5, True, num_rows=2, metric="abs"
+        )
+        self.assertEqual(rows.tolist(), [0])
+        self.assertEqual(distances.tolist(), [2.0])
+
+        rows, distances = self.snapshot.find_nearest_rows(
+            [0, 10, 0, 1000, 0], ["FR"] * 5, False, num_rows=2
+        )
+        self.assertEqual(rows.tolist(), [2, 3])
+
+        rows, distances = self.snapshot.find_nearest_rows(
+            [0, 10, 0, 1326, 0], ["FR"] * 5, False
+        )
+        self.assertEqual(rows.tolist(), [2])
+        self.assertEqual(distances.tolist(), [0.0])
+
+    @mock.patch("ScPatternSelect.tools.pattern_table.NEAREST_SCAN_ROWS", 0)
+    def test_nearest_rows_index(self):
+        # ties sort by row, equally far above and below
+        snapshot = PatternTableSnapshot(
+            make_table(
+                [
+                    {"IS_VERIFIED": "True", "SC_SXR_RATE_Hz": 20},
+                    {"IS_VERIFIED": "True", "SC_SXR_RATE_Hz": 5},
+                    {"IS_VERIFIED": "True", "SC_SXR_RATE_Hz": 15},
+                    {"IS_VERIFIED": "True", "SC_SXR_RATE_Hz": 5},
+                    {"IS_VERIFIED": "False", "SC_SXR_RATE_Hz": 10},
+                ]
+            )
+        )
+        rows, distances = snapshot.find_nearest_rows(
+            [0, 0, 0, 10, 0], ["FR"] * 5, True, num_rows=3, metric="abs"
+        )
+        self.assertEqual(rows.tolist(), [1, 2, 3])
+        self.assertEqual(distances.tolist(), [5.0, 5.0, 5.0])
+
+        # no pattern of the timing source, or none at all
+        rows, distances = self.snapshot.find_nearest_rows(
+            [0, 0, 0, 10, 0], ["FR", "FR", "FR", "B", "FR"], True
+        )
+        self.assertEqual(rows.tolist(), [])
+        self.assertEqual(distances.tolist(), [])
+        rows, _ = PatternTableSnapshot(make_table([])).find_nearest_rows(
+            [0, 0, 0, 10, 0], ["FR"] * 5, True
+        )
+        self.assertEqual(rows.tolist(), [])
+
+        # the same rows as a scan of every row
+        rng = np.random.default_rng(0)
+        rates = [0, 0, 1, 10, 50, 100, 1000]
+        snapshot = PatternTableSnapshot(
+            make_table(
+                [
+                    {
+                        "IS_VERIFIED": str(bool(rng.random() < 0.8)),
+                        **{
+                            f"{dest}{globals.RATE_SFX}": int(rng.choice(rates))
+                            for dest in globals.DEST_NAMES[1:]
+                        },
+                        **{
+                            f"{dest}{globals.TSOURCE_SFX}": str(
+                                rng.choice(["FR", "AC"])
+                            )
+                            for dest in globals.DEST_NAMES[1:]
+                        },
+                    }
+                    for _ in range(500)
+                ]
+            )
+        )
+        for _ in range(50):
+            dest_rates = rng.choice([0, 0, 5, 10, 70, 2000], 5).tolist()
+            num_rows = int(rng.integers(1, 20))
+            for metric in ("log", "abs"):
+                args = (dest_rates, ["FR"] * 5, True, num_rows, metric)
+                rows, distances = snapshot.find_nearest_rows(*args)
+                with mock.patch(
+                    "ScPatternSelect.tools.pattern_table.NEAREST_SCAN_ROWS", 500
+                ):
+                    scan_rows, scan_distances = snapshot.find_nearest_rows(*args)
+                self.assertEqual(rows.tolist(), scan_rows.tolist())
+                self.assertEqual(distances.tolist(), scan_distances.tolist())
+
+    def test_diff_append_only(self):
+        rows = [dict(row) for row in self.rows]
+        rows[1]["RUN_COUNT"] = 1
+        rows[2]["IS_VERIFIED"] = "True"
+        rows.append(
+            {
+                "PATTERN_NAME": "SC_HXR_STD_FR_10_Hz",
+                "IS_VERIFIED": "True",
+                "SC_HXR_RATE_Hz": 10,
+                "SC_HXR_TIMING_SOURCE": "FR",
+            }
+        )
+        snapshot = PatternTableSnapshot(make_table(rows), 2, previous=self.snapshot)
+        rebuilt = PatternTableSnapshot(make_table(rows), 2)
+
+        self.assertTrue(snapshot.diff.is_append_only)
+        self.assertEqual(snapshot.diff.added, ["SC_HXR_STD_FR_10_Hz"])
+        self.assertEqual(snapshot.diff.removed, [])
+        self.assertEqual(
+            snapshot.diff.changed, ["SC_SXR_STD_AC_10_Hz", "SC_SXR_EXP_FR_1.3_kHz"]
+        )
+        self.assertEqual(snapshot.name_index, rebuilt.name_index)
+        self.assertEqual(snapshot.rate_index, rebuilt.rate_index)
+        self.assertEqual(
+            snapshot.get_available_rates(4, "FR", True).tolist(), [0, 10, 1326]
+        )
+        self.assertEqual(snapshot.get_available_rates(3, "FR", True).tolist(), [0, 10])
+
+    def test_diff_removed(self):
+        snapshot = PatternTableSnapshot(
+            make_table(self.rows[1:]), 2, previous=self.snapshot
+        )
+
+        # the duplicate SC_SXR_STD_FR_10_Hz row is now the first one
+        self.assertFalse(snapshot.diff.is_append_only)
+        self.assertEqual(snapshot.diff.removed, [])
+        self.assertEqual(snapshot.diff.changed, ["SC_SXR_STD_FR_10_Hz"])
+        self.assertEqual(snapshot.name_index["SC_SXR_STD_AC_10_Hz"], 0)
+
+        snapshot = PatternTableSnapshot(
+            make_table(self.rows[:2]), 2, previous=self.snapshot
+        )
+        self.assertEqual(snapshot.diff.removed, ["SC_SXR_EXP_FR_1.3_kHz"])
+        self.assertTrue(
+            PatternTableSnapshot(
+                make_table(self.rows[:2]), 3, previous=snapshot
+            ).diff.is_empty()
+        )
+
+    def test_diff_bulk_change(self):
+        rows = [
+            {
+                "PATTERN_NAME": f"SC_SXR_STD_FR_{row_num}_Hz",
+                "IS_VERIFIED": "True" if row_num % 3 else "False",
+                "SC_SXR_RATE_Hz": row_num % 50,
+                "SC_SXR_TIMING_SOURCE": "FR" if row_num % 7 else "AC",
+                "SC_HXR_RATE_Hz": row_num % 4,
+            }
+            for row_num in range(300)
+        ]
+        previous = PatternTableSnapshot(make_table(rows), 1)
+
+        # a third of the rows change, too many keys to look up one at a time
+        for row in rows[::3]:
+            row["IS_VERIFIED"] = "False" if row["IS_VERIFIED"] == "True" else "True"
+        snapshot = PatternTableSnapshot(make_table(rows), 2, previous=previous)
+        self.assertEqual(len(snapshot.diff.rate_changed_rows), 100)
+        self.assert_same_indexes(snapshot, PatternTableSnapshot(make_table(rows), 2))
+
+        # every row changes, the indexes are built again
+        for row in rows:
+            row["IS_VERIFIED"] = "False" if row["IS_VERIFIED"] == "True" else "True"
+        snapshot = PatternTableSnapshot(make_table(rows), 3, previous=snapshot)
+        self.assertTrue(snapshot.diff.is_append_only)
+        self.assertEqual(len(snapshot.diff.rate_changed_rows), 300)
+        self.assert_same_indexes(snapshot, PatternTableSnapshot(make_table(rows), 3))
+
+    def assert_same_indexes(self, snapshot, rebuilt):
+        self.assertEqual(snapshot.name_index, rebuilt.name_index)
+        self.assertEqual(snapshot.rate_index, rebuilt.rate_index)
+        self.assertEqual(
+            snapshot.available_rates.keys(), rebuilt.available_rates.keys()
+        )
+        for key, rate_list in rebuilt.available_rates.items():
+            self.assertEqual(snapshot.available_rates[key].tolist(), rate_list.tolist())
+
+    def test_unchanged_update(self):
+        table = make_table(self.rows)
+        snapshot = PatternTableSnapshot(table, 2, previous=self.snapshot)
+
+        # nothing is encoded or indexed again
+        self.assertTrue(snapshot.diff.is_empty())
+        for key in table:
+            self.assertIs(snapshot.table.columns[key], self.snapshot.table.columns[key])
+        self.assertIs(snapshot.names, self.snapshot.names)
+        self.assertIs(snapshot.rate_index, self.snapshot.rate_index)
+        self.assertIs(snapshot.available_rates, self.snapshot.available_rates)
+
+        # only the column that changed is encoded, the others are shared
+        table["LAST_RUN"] = ["2024-01-01"] * 4
+        table["RUN_COUNT"] = [1, 0, 0, 0]
+        updated = PatternTableSnapshot(table, 3, previous=snapshot)
+        self.assertEqual(updated.diff.changed, self.snapshot.names.tolist()[:3])
+        self.assertIs(updated.table.columns["TAGS"], snapshot.table.columns["TAGS"])
+        self.assertIs(updated.rates, snapshot.rates)
+        self.assertEqual(updated.table.get_row(1)["LAST_RUN"], "2024-01-01")
+        self.assertEqual(updated.table.get_row(0)["RUN_COUNT"], 1)
+        self.assertEqual(
+            updated.table.get_row(3)["PATTERN_NAME"], "SC_SXR_STD_FR_10_Hz"
+        )
+
+    def test_empty_table(self):
+        snapshot = PatternTableSnapshot(make_table([]), version=3)
+        self.assertEqual(snapshot.num_rows, 0)
+        self.assertEqual(snapshot.version, 3)
+        self.assertEqual(snapshot.get_available_rates(4, "FR", True).tolist(), [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
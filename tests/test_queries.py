@@ -0,0 +1,259 @@
+"""
+unit tests for the table queries of ScPatternSelect
+The TPG is served by a LocalTransport, these do not need the TPG
+"""
+
+import threading
+import unittest
+from ScPatternSelect import ScPatternSelect
+from ScPatternSelect.tools import LocalTransport, globals
+from test_pattern_table import make_table
+
+ROWS = [
+    {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+    {
+        "PATTERN_NAME": "SC_SXR_STD_FR_10_Hz",
+        "IS_VERIFIED": "True",
+        "SC_SXR_RATE_Hz": 10,
+        "SC_SXR_TIMING_SOURCE": "FR",
+    },
+    {
+        "PATTERN_NAME": "SC_SXR_STD_AC_10_Hz",
+        "IS_VERIFIED": "True",
+        "SC_SXR_RATE_Hz": 10,
+        "SC_SXR_TIMING_SOURCE": "AC",
+    },
+    {
+        "PATTERN_NAME": "SC_SXR_EXP_FR_1.3_kHz",
+        "IS_VERIFIED": "False",
+        "SC_BSYD_RATE_Hz": 10,
+        "SC_BSYD_TIMING_SOURCE": "FR",
+        "SC_SXR_RATE_Hz": 1326,
+        "SC_SXR_TIMING_SOURCE": "FR",
+    },
+    {"PATTERN_NAME": "SC_SXR_STD_FR_10_Hz", "IS_VERIFIED": "False"},
+]
+
+
+class TestQueries(unittest.TestCase):
+    def setUp(self) -> None:
+        self.transport = LocalTransport()
+        self.globals = globals("SYS0", "1", "")
+        self.transport.add_tpg(self.globals, make_table(ROWS))
+        self.patt_sel = ScPatternSelect("SYS0", "1", "", transport=self.transport)
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.patt_sel.close()
+
+        return super().tearDown()
+
+    def post(self, rows):
+        self.transport.post_table(
+            self.globals.get_patt_table_name(), {"value": make_table(rows)}
+        )
+
+    def test_name_lookups(self):
+        patt_sel = self.patt_sel
+        # first row wins for duplicate names
+        self.assertEqual(patt_sel.get_pattern_row_num("SC_SXR_STD_FR_10_Hz"), 1)
+        self.assertEqual(patt_sel.get_pattern_row_num("SC_SXR_EXP_FR_1.3_kHz"), 3)
+        self.assertEqual(patt_sel.get_pattern_row_num("name_that_will_never_exist"), -1)
+
+        self.assertTrue(patt_sel.pattern_exists("SC_SXR_STD_AC_10_Hz"))
+        self.assertFalse(patt_sel.pattern_exists("name_that_will_never_exist"))
+        self.assertTrue(patt_sel.is_pattern_verified("SC_SXR_STD_FR_10_Hz"))
+        self.assertFalse(patt_sel.is_pattern_verified("SC_SXR_EXP_FR_1.3_kHz"))
+        self.assertFalse(patt_sel.is_pattern_verified("name_that_will_never_exist"))
+        self.assertEqual(
+            patt_sel.get_relative_pattern_path("SC_SXR_STD_FR_10_Hz"),
+            "verified/SC_SXR_STD_FR_10_Hz",
+        )
+        self.assertEqual(
+            patt_sel.get_relative_pattern_path("SC_SXR_EXP_FR_1.3_kHz"),
+            "test/SC_SXR_EXP_FR_1.3_kHz",
+        )
+        pattern_data = patt_sel.get_pattern_data("verified/SC_SXR_STD_AC_10_Hz")
+        self.assertEqual(pattern_data["SC_SXR_TIMING_SOURCE"], "AC")
+        self.assertIsNone(patt_sel.get_pattern_data("name_that_will_never_exist"))
+
+    def test_name_lookups_updated(self):
+        # the index follows the rows of a new table
+        self.post(ROWS[3:] + ROWS[:3])
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_EXP_FR_1.3_kHz"), 0)
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_STD_FR_10_Hz"), 1)
+        self.assertFalse(self.patt_sel.is_pattern_verified("SC_SXR_STD_FR_10_Hz"))
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_STD_AC_10_Hz"), 4)
+
+        self.post(ROWS[:2])
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_STD_AC_10_Hz"), -1)
+
+        self.patt_sel.set_patt_table_unavailable()
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_STD_FR_10_Hz"), -1)
+        self.assertIsNone(
+            self.patt_sel.get_relative_pattern_path("SC_SXR_STD_FR_10_Hz")
+        )
+
+    def test_pattern_name_by_rate(self):
+        patt_sel = self.patt_sel
+        # the timing source 'None' of a 0 Hz dest matches 'FR'
+        self.assertEqual(patt_sel.get_pattern_name_by_rate(), "SC_SXR_STD_FR_0_Hz")
+        self.assertEqual(
+            patt_sel.get_pattern_name_by_rate(sxr_rate=10), "SC_SXR_STD_FR_10_Hz"
+        )
+        self.assertEqual(
+            patt_sel.get_pattern_name_by_rate(sxr_rate=10, sxr_time_src="AC"),
+            "SC_SXR_STD_AC_10_Hz",
+        )
+        self.assertEqual(
+            patt_sel.get_pattern_name_by_rate(dest_data={4: [10, "AC"]}),
+            "SC_SXR_STD_AC_10_Hz",
+        )
+        self.assertIsNone(patt_sel.get_pattern_name_by_rate(sxr_rate=20))
+        self.assertIsNone(patt_sel.get_pattern_name_by_rate(hxr_rate=10))
+
+        # the bsyd keepalive adds 10 Hz to bsyd past 1020 Hz
+        self.assertIsNone(patt_sel.get_pattern_name_by_rate(sxr_rate=1326))
+        self.assertEqual(
+            patt_sel.get_pattern_name_by_rate(sxr_rate=1326, is_verified=False),
+            "SC_SXR_EXP_FR_1.3_kHz",
+        )
+        self.assertEqual(
+            patt_sel.get_pattern_name_by_rate(
+                bsyd_rate=10, sxr_rate=1326, is_verified=False
+            ),
+            "SC_SXR_EXP_FR_1.3_kHz",
+        )
+        with self.assertRaises(AssertionError):
+            patt_sel.get_pattern_name_by_rate(sxr_rate=10, sxr_time_src="XX")
+
+    def test_pattern_name_by_rate_updated(self):
+        self.post(ROWS[:1] + [dict(ROWS[1], SC_SXR_RATE_Hz=20)])
+        self.assertIsNone(self.patt_sel.get_pattern_name_by_rate(sxr_rate=10))
+        self.assertEqual(
+            self.patt_sel.get_pattern_name_by_rate(sxr_rate=20), "SC_SXR_STD_FR_10_Hz"
+        )
+
+        self.patt_sel.set_patt_table_unavailable()
+        self.assertIsNone(self.patt_sel.get_pattern_name_by_rate(sxr_rate=20))
+
+    def test_pattern_names_by_rate(self):
+        patt_sel = self.patt_sel
+        dest_data_list = [
+            {},
+            {4: [10, "FR"]},
+            {4: [10, "AC"]},
+            {4: [20, "FR"]},
+            {4: [1326, "FR"]},
+            {2: [10, "FR"], 4: [1326, "FR"]},
+            {3: [10, "FR"]},
+        ]
+        for is_verified in [True, False]:
+            pattern_names = [
+                patt_sel.get_pattern_name_by_rate(
+                    dest_data=dict(dest_data), is_verified=is_verified
+                )
+                for dest_data in dest_data_list
+            ]
+            self.assertEqual(
+                patt_sel.get_pattern_names_by_rate(dest_data_list, None, is_verified),
+                pattern_names,
+            )
+
+            # the same configurations as an array of rates per dest 1-5
+            rates = [[0, 0, 0, 0, 0] for _ in dest_data_list]
+            time_srcs = [["FR"] * 5 for _ in dest_data_list]
+            for dest_rates, dest_time_srcs, dest_data in zip(
+                rates, time_srcs, dest_data_list
+            ):
+                for dest, (rate, time_src) in dest_data.items():
+                    dest_rates[dest - 1] = rate
+                    dest_time_srcs[dest - 1] = time_src
+            self.assertEqual(
+                patt_sel.get_pattern_names_by_rate(rates, time_srcs, is_verified),
+                pattern_names,
+            )
+        self.assertEqual(
+            patt_sel.get_pattern_names_by_rate([[0, 0, 0, 10, 0]]),
+            ["SC_SXR_STD_FR_10_Hz"],
+        )
+
+        # the dictionaries of the caller are not completed in place
+        self.assertEqual(dest_data_list[1], {4: [10, "FR"]})
+        self.assertEqual(patt_sel.get_pattern_names_by_rate([]), [])
+        with self.assertRaises(AssertionError):
+            patt_sel.get_pattern_names_by_rate([[0, 0, 0, 10, 0]], [["XX"] * 5])
+        with self.assertRaises(AssertionError):
+            patt_sel.get_pattern_names_by_rate([[0, 0, 0, 10.5, 0]])
+
+        self.patt_sel.set_patt_table_unavailable()
+        self.assertIsNone(patt_sel.get_pattern_names_by_rate(dest_data_list))
+
+    def test_snapshot_swap(self):
+        snapshot = self.patt_sel.get_patt_table_snapshot()
+        table = make_table(ROWS[3:] + ROWS[:3])
+        self.transport.post_table(self.globals.get_patt_table_name(), {"value": table})
+
+        # a new snapshot is swapped in, the old one is left as it was
+        new_snapshot = self.patt_sel.get_patt_table_snapshot()
+        self.assertIsNot(new_snapshot, snapshot)
+        self.assertEqual(new_snapshot.version, snapshot.version + 1)
+        self.assertEqual(self.patt_sel.patt_table_version, new_snapshot.version)
+        self.assertEqual(snapshot.name_index["SC_SXR_EXP_FR_1.3_kHz"], 3)
+        self.assertEqual(new_snapshot.name_index["SC_SXR_EXP_FR_1.3_kHz"], 0)
+
+        # the snapshot does not share the lists of the posted table
+        table["PATTERN_NAME"][0] = "name_that_will_never_exist"
+        self.assertEqual(new_snapshot.names[0], "SC_SXR_EXP_FR_1.3_kHz")
+
+        for array in [new_snapshot.names, new_snapshot.verified, new_snapshot.rates]:
+            with self.assertRaises(ValueError):
+                array[0] = array[1]
+
+    def test_older_snapshot(self):
+        snapshot = self.patt_sel.get_patt_table_snapshot()
+        self.post(ROWS[3:] + ROWS[:3])
+        new_snapshot = self.patt_sel.get_patt_table_snapshot()
+
+        # an older snapshot arriving late does not replace the new one
+        self.patt_sel.install_patt_table_snapshot(snapshot)
+        self.assertIs(self.patt_sel.get_patt_table_snapshot(), new_snapshot)
+        self.patt_sel.install_patt_table_snapshot(new_snapshot)
+        self.assertEqual(self.patt_sel.patt_table_version, new_snapshot.version)
+        self.assertEqual(self.patt_sel.get_pattern_row_num("SC_SXR_EXP_FR_1.3_kHz"), 0)
+
+    def test_concurrent_readers(self):
+        tables = [make_table(ROWS), make_table(ROWS[3:] + ROWS[:3])]
+        answers = []
+        is_done = threading.Event()
+
+        def read():
+            while not is_done.is_set():
+                answers.append(
+                    (
+                        self.patt_sel.get_pattern_name_by_rate(sxr_rate=10),
+                        self.patt_sel.get_pattern_row_num("SC_SXR_STD_AC_10_Hz"),
+                    )
+                )
+
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        for table_num in range(50):
+            self.transport.post_table(
+                self.globals.get_patt_table_name(), {"value": tables[table_num % 2]}
+            )
+        is_done.set()
+        for reader in readers:
+            reader.join()
+
+        # the readers never see a table that is missing or half built
+        self.assertTrue(answers)
+        for pattern_name, row_num in answers:
+            self.assertEqual(pattern_name, "SC_SXR_STD_FR_10_Hz")
+            self.assertIn(row_num, {2, 4})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+unit tests for NetworkStats and StatsServer
+The TPG is served by a LocalTransport, these do not need the TPG
+"""
+
+import unittest
+import urllib.request
+from ScPatternSelect import ScPatternSelect
+from ScPatternSelect.tools import LocalTransport, NetworkStats, StatsServer, globals
+from ScPatternSelect.tools import network_stats
+from test_pattern_table import make_table
+
+
+class TestNetworkStats(unittest.TestCase):
+    def setUp(self) -> None:
+        self.network_stats = NetworkStats()
+
+        return super().setUp()
+
+    def test_record(self):
+        for latency in [0.001] * 98 + [0.2, 20.0]:
+            self.network_stats.record("TPG:SYS0:1", "caput_load", latency)
+        self.network_stats.record("TPG:SYS0:1", "caput_load", 1.0, "timeout")
+        self.network_stats.record("TPG:SYS0:1", "pva_monitor", outcome="error")
+
+        stats = self.network_stats.get_stats()["TPG:SYS0:1"]
+        self.assertEqual(stats["caput_load"]["count"], 101)
+        self.assertEqual(stats["caput_load"]["timeouts"], 1)
+        self.assertEqual(stats["caput_load"]["p50"], 0.001)
+        self.assertEqual(stats["caput_load"]["p99"], 1.0)
+        self.assertEqual(stats["caput_load"]["max"], 20.0)
+        self.assertEqual(stats["pva_monitor"]["errors"], 1)
+        self.assertIsNone(stats["pva_monitor"]["mean"])
+        self.assertEqual(self.network_stats.get_stats("TPG:SYS0:2"), {})
+
+    def test_text(self):
+        self.network_stats.record("TPG:SYS0:1", "caput_load", 0.003)
+        self.network_stats.record_table_update("TPG:SYS0:1", 0.01)
+        text = self.network_stats.get_text()
+        self.assertIn(
+            'scpatternselect_operation_seconds_bucket{tpg="TPG:SYS0:1",'
+            'operation="caput_load",le="0.0025"} 0',
+            text,
+        )
+        self.assertIn(
+            'scpatternselect_operation_seconds_bucket{tpg="TPG:SYS0:1",'
+            'operation="caput_load",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn(
+            'scpatternselect_operations_total{tpg="TPG:SYS0:1",'
+            'operation="table_update",outcome="ok"} 1',
+            text,
+        )
+        self.assertIn('scpatternselect_table_update_rate_hz{tpg="TPG:SYS0:1"}', text)
+
+        with StatsServer(network_stats_=self.network_stats) as stats_server:
+            with urllib.request.urlopen(stats_server.get_url(), timeout=5) as response:
+                self.assertEqual(response.read().decode(), text)
+
+
+class TestRecording(unittest.TestCase):
+    def test_run_pattern(self):
+        network_stats.reset()
+        transport = LocalTransport()
+        transport.add_tpg(
+            globals("SYS0", "1", ""),
+            make_table(
+                [
+                    {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+                    {"PATTERN_NAME": "SC_SXR_STD_FR_10_Hz", "IS_VERIFIED": "True"},
+                ]
+            ),
+        )
+        patt_sel = ScPatternSelect("SYS0", "1", "", transport=transport)
+        self.assertTrue(patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+        patt_sel.close()
+
+        stats = patt_sel.stats()
+        for operation in [
+            "caput_path",
+            "caput_load",
+            "wait_loaded",
+            "caput_apply",
+            "wait_applied",
+            "table_update",
+        ]:
+            self.assertEqual(stats[operation]["count"], 1, operation)
+        self.assertGreater(stats["table_update_rate"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
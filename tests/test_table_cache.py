@@ -0,0 +1,142 @@
+"""
+unit tests for the PatternTableCache class
+These write to a temporary directory and do not need the TPG
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from ScPatternSelect.tools import (
+    PatternTableCache,
+    PatternTableCacheWriter,
+    PatternTableSnapshot,
+)
+from test_pattern_table import make_table
+
+
+class TestPatternTableCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = PatternTableCache(os.path.join(self.tmp_dir.name, "patt.cache"))
+        self.table = make_table(
+            [
+                {
+                    "PATTERN_NAME": "SC_SXR_STD_FR_10_Hz",
+                    "IS_VERIFIED": "True",
+                    "SC_SXR_RATE_Hz": 10,
+                    "SC_SXR_TIMING_SOURCE": "FR",
+                    "TAGS": "µ",
+                },
+                {
+                    "PATTERN_NAME": "SC_SXR_EXP_FR_1.3_kHz",
+                    "IS_VERIFIED": "False",
+                    "SC_SXR_RATE_Hz": 1326,
+                    "SC_SXR_TIMING_SOURCE": "FR",
+                },
+            ]
+        )
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
+
+    def test_round_trip(self):
+        self.assertTrue(self.cache.write(self.table, (1700000000, 5, 0)))
+        table, timestamp = self.cache.read()
+
+        self.assertEqual(timestamp, (1700000000, 5, 0))
+        self.assertEqual(list(table), list(self.table))
+        self.assertEqual(table["PATTERN_NAME"], self.table["PATTERN_NAME"])
+        self.assertEqual(table["TAGS"], ["µ", ""])
+        self.assertEqual(table["SC_SXR_RATE_Hz"].tolist(), [10, 1326])
+
+        # numeric columns are mapped read only from the file
+        with self.assertRaises(ValueError):
+            table["SC_SXR_RATE_Hz"][0] = 1
+
+        cached = PatternTableSnapshot(table, 1)
+        snapshot = PatternTableSnapshot(self.table, 1)
+        self.assertEqual(cached.name_index, snapshot.name_index)
+        self.assertEqual(cached.rate_index, snapshot.rate_index)
+        self.assertTrue(PatternTableSnapshot(self.table, 2, cached).diff.is_empty())
+
+    def test_empty_table(self):
+        self.assertTrue(self.cache.write(make_table([])))
+        table, timestamp = self.cache.read()
+
+        self.assertIsNone(timestamp)
+        self.assertEqual(PatternTableSnapshot(table, 1).num_rows, 0)
+
+    def test_bad_file(self):
+        self.assertIsNone(self.cache.read())
+
+        with open(self.cache.path, "wb") as cache_file:
+            cache_file.write(b"not a cache")
+        self.assertIsNone(self.cache.read())
+
+
+class BlockingCache(PatternTableCache):
+    """
+    records the writes, the first one waits until the test releases it
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.writes = []
+        self.is_writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, table, timestamp=None):
+        self.writes.append((timestamp, threading.current_thread()))
+        self.is_writing.set()
+        self.release.wait(5.0)
+        return super().write(table, timestamp)
+
+
+class TestPatternTableCacheWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = BlockingCache(os.path.join(self.tmp_dir.name, "patt.cache"))
+        self.table = make_table(
+            [{"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"}]
+        )
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.cache.release.set()
+        self.tmp_dir.cleanup()
+
+        return super().tearDown()
+
+    def test_newest_written(self):
+        writer = PatternTableCacheWriter(self.cache)
+        writer.write(self.table, (1, 0, 0))
+        self.assertTrue(self.cache.is_writing.wait(5.0))
+
+        # the writes queued while the disk is busy end in one write
+        for seconds in range(2, 5):
+            writer.write(self.table, (seconds, 0, 0))
+        self.assertFalse(writer.flush(0))
+        self.cache.release.set()
+        self.assertTrue(writer.flush(5.0))
+
+        self.assertEqual(
+            [timestamp for timestamp, _ in self.cache.writes], [(1, 0, 0), (4, 0, 0)]
+        )
+        for _, thread in self.cache.writes:
+            self.assertIsNot(thread, threading.current_thread())
+        self.assertEqual(self.cache.read()[1], (4, 0, 0))
+
+        # the table already in the file is not written again
+        writer.write(self.table, (4, 0, 0))
+        self.assertTrue(writer.flush(5.0))
+        self.assertEqual(len(self.cache.writes), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
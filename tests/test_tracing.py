@@ -0,0 +1,86 @@
+"""
+unit tests for the Tracer class
+The TPG is served by a LocalTransport, these do not need the TPG
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from ScPatternSelect import ScPatternSelect
+from ScPatternSelect.tools import LocalTransport, Tracer, globals, tracer
+from test_pattern_table import make_table
+
+
+class TestTracer(unittest.TestCase):
+    def test_spans(self):
+        local_tracer = Tracer()
+        with local_tracer.span("stopped"):
+            pass
+        self.assertEqual(local_tracer.events, [])
+
+        local_tracer.start()
+        with local_tracer.span("outer", pattern_name="SC_SXR_STD_FR_10_Hz"):
+            with local_tracer.span("inner"):
+                pass
+        with self.assertRaises(ValueError):
+            with local_tracer.span("raises"):
+                raise ValueError()
+        local_tracer.stop()
+
+        inner, outer, raises = local_tracer.events
+        self.assertEqual(outer["args"], {"pattern_name": "SC_SXR_STD_FR_10_Hz"})
+        self.assertEqual(raises["args"], {"error": "ValueError"})
+        self.assertLessEqual(outer["ts"], inner["ts"])
+        self.assertGreaterEqual(outer["ts"] + outer["dur"], inner["ts"] + inner["dur"])
+
+        with tempfile.TemporaryDirectory() as trace_dir:
+            trace_path = os.path.join(trace_dir, "trace.json")
+            local_tracer.write(trace_path)
+            with open(trace_path) as trace_file:
+                trace = json.load(trace_file)
+        phases = [event["ph"] for event in trace["traceEvents"]]
+        self.assertEqual(phases, ["M", "X", "X", "X"])
+
+    def test_run_pattern(self):
+        transport = LocalTransport()
+        transport.add_tpg(
+            globals("SYS0", "1", ""),
+            make_table(
+                [
+                    {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+                    {"PATTERN_NAME": "SC_SXR_STD_FR_10_Hz", "IS_VERIFIED": "True"},
+                ]
+            ),
+        )
+        patt_sel = ScPatternSelect("SYS0", "1", "", transport=transport)
+        tracer.clear()
+        tracer.start()
+        try:
+            self.assertTrue(patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+        finally:
+            tracer.stop()
+            patt_sel.close()
+
+        names = [event["name"] for event in tracer.get_trace()["traceEvents"]]
+        tracer.clear()
+        for name in [
+            "run_pattern",
+            "run_pattern.load",
+            "load_pattern",
+            "get_relative_pattern_path",
+            "caput_path",
+            "caput_load",
+            "run_pattern.loaded",
+            "run_pattern.apply",
+            "apply_pattern",
+            "pattern_exists",
+            "get_pattern_loaded",
+            "caput_apply",
+            "run_pattern.applied",
+        ]:
+            self.assertIn(name, names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,377 @@
+"""
+unit tests for ScPatternSelect and AsyncScPatternSelect on a LocalTransport
+The TPG is served from memory, these do not need the TPG
+"""
+
+import gc
+import time
+import weakref
+import asyncio
+import threading
+import unittest
+from ScPatternSelect import AsyncScPatternSelect, ScPatternSelect
+from ScPatternSelect.tools import LocalTransport, globals, network_stats, tracer
+from test_pattern_table import make_table
+
+
+def make_tpg_table(pattern_name):
+    return make_table(
+        [
+            {"PATTERN_NAME": "SC_SXR_STD_FR_0_Hz", "IS_VERIFIED": "True"},
+            {"PATTERN_NAME": pattern_name, "IS_VERIFIED": "True"},
+        ]
+    )
+
+
+class TestLocalTransport(unittest.TestCase):
+    def setUp(self) -> None:
+        self.transport = LocalTransport()
+        self.globals = globals("SYS0", "1", "")
+        self.transport.add_tpg(self.globals, self.make_table("SC_SXR_STD_FR_10_Hz"))
+        self.patt_sel = ScPatternSelect("SYS0", "1", "", transport=self.transport)
+
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.patt_sel.close()
+
+        return super().tearDown()
+
+    def make_table(self, pattern_name):
+        return make_tpg_table(pattern_name)
+
+    def test_run_pattern(self):
+        self.assertTrue(self.patt_sel.wait_ready(0))
+        result = self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz")
+        self.assertTrue(result, result)
+        self.assertEqual(self.patt_sel.get_pattern_loaded(), "SC_SXR_STD_FR_10_Hz")
+        self.assertEqual(self.patt_sel.get_pattern_running(), "SC_SXR_STD_FR_10_Hz")
+
+        self.assertFalse(self.patt_sel.run_pattern("SC_SXR_STD_FR_20_Hz"))
+        self.assertEqual(self.patt_sel.stop_beam(), 1)
+
+    def test_run_pattern_again(self):
+        self.assertTrue(self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+        self.assertTrue(self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+
+        # the IOC only posts changed values, the readbacks already show
+        # the pattern so the stages pass once the puts completed
+        self.transport.put_callbacks.pop(self.globals.get_load_pv())
+        self.transport.put_callbacks.pop(self.globals.get_apply_pv())
+        self.assertTrue(self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+
+        # a readback that showed another pattern needs an update after the put
+        self.transport.set_value(
+            self.globals.get_pattern_loaded_pv(), "verified/SC_SXR_STD_FR_0_Hz"
+        )
+        result = self.patt_sel.run_pattern(
+            "SC_SXR_STD_FR_10_Hz", {"loaded": 0.05, "applied": 0.05}
+        )
+        self.assertFalse(result)
+        self.assertEqual(result.failed_stage, "loaded")
+        self.assertGreaterEqual(result.latencies["loaded"], 0.05)
+
+    def test_apply_after_lagging_monitor(self):
+        network_stats.reset()
+        loaded_pv = self.globals.get_pattern_loaded_pv()
+        self.assertEqual(self.patt_sel.get_pattern_loaded(), "")
+
+        # the IOC has the new value, the monitor update has not come yet
+        self.transport.values[loaded_pv] = "verified/SC_SXR_STD_FR_10_Hz"
+        self.assertEqual(self.patt_sel.get_pattern_loaded(), "")
+        self.assertTrue(self.patt_sel.apply_pattern("SC_SXR_STD_FR_10_Hz"))
+        self.assertEqual(self.patt_sel.stats()["caget_readback"]["count"], 1)
+        self.assertFalse(self.patt_sel.apply_pattern("SC_SXR_STD_FR_0_Hz"))
+
+    def test_load_deadline(self):
+        timeouts = []
+        caput = self.transport.caput
+
+        def slow_caput(pvname, value, timeout=None):
+            timeouts.append(timeout)
+            time.sleep(0.02)
+            return caput(pvname, value, timeout)
+
+        self.transport.caput = slow_caput
+        self.assertTrue(self.patt_sel.load_pattern("SC_SXR_STD_FR_10_Hz", 0.1))
+        # both puts share one deadline
+        self.assertLessEqual(timeouts[1], 0.1 - 0.02)
+        self.assertEqual(self.patt_sel.load_pattern("SC_SXR_STD_FR_10_Hz"), True)
+        self.assertEqual(timeouts[2:], [None, None])
+
+    def test_table_update(self):
+        version = self.patt_sel.patt_table_version
+        self.transport.post_table(
+            self.globals.get_patt_table_name(),
+            {"value": self.make_table("SC_SXR_STD_FR_20_Hz")},
+        )
+        self.assertEqual(self.patt_sel.patt_table_version, version + 1)
+        self.assertTrue(self.patt_sel.pattern_exists("SC_SXR_STD_FR_20_Hz"))
+
+    def test_dest_timing_state(self):
+        dest_timing_state = self.patt_sel.get_dest_timing_state()
+        self.assertEqual(
+            dest_timing_state["SC_SXR"],
+            {"time_src": "FR", "offset": 0, "timeslot": 1, "timeslot_mask": 0x3F},
+        )
+
+    def test_unserved(self):
+        patt_sel = ScPatternSelect("SYS0", "2", "", transport=self.transport)
+        self.assertFalse(patt_sel.get_is_patt_table_available())
+        self.assertIsNone(patt_sel.get_pattern_running())
+        self.assertIsNone(patt_sel.stop_beam())
+        patt_sel.close()
+
+        self.patt_sel.close()
+        self.assertEqual(self.patt_sel.connection_pool.get_ref_counts(), {"pva": 0})
+
+    def test_readbacks(self):
+        loaded_pv = self.globals.get_pattern_loaded_pv()
+        running_pv = self.globals.get_pattern_running_pv()
+        self.transport.set_value(loaded_pv, "verified/SC_SXR_STD_FR_10_Hz")
+        pattern_loaded, timestamp = self.patt_sel.get_pattern_loaded_with_timestamp()
+        self.assertEqual(pattern_loaded, "SC_SXR_STD_FR_10_Hz")
+        self.assertIsNotNone(timestamp)
+
+        # an IOC update shows up without a get, with a new timestamp
+        time.sleep(0.01)
+        self.transport.set_value(running_pv, "test/SC_SXR_STD_FR_0_Hz")
+        self.transport.set_value(loaded_pv, "verified/SC_SXR_STD_FR_0_Hz")
+        pattern_loaded, new_timestamp = (
+            self.patt_sel.get_pattern_loaded_with_timestamp()
+        )
+        self.assertEqual(pattern_loaded, "SC_SXR_STD_FR_0_Hz")
+        self.assertGreater(new_timestamp, timestamp)
+        self.assertEqual(self.patt_sel.get_pattern_running(), "SC_SXR_STD_FR_0_Hz")
+        self.assertEqual(
+            self.patt_sel.get_pattern_running_data()["PATTERN_NAME"],
+            "SC_SXR_STD_FR_0_Hz",
+        )
+
+        # one subscription per PV, shared by every instance
+        patt_sel = ScPatternSelect("SYS0", "1", "", transport=self.transport)
+        self.assertEqual(patt_sel.get_pattern_loaded(), "SC_SXR_STD_FR_0_Hz")
+        self.assertEqual(len(self.transport.readbacks[loaded_pv]), 1)
+        self.assertEqual(self.patt_sel.connection_pool.get_ref_counts()[loaded_pv], 2)
+        patt_sel.close()
+
+    def test_readbacks_unserved(self):
+        patt_sel = ScPatternSelect("SYS0", "2", "", transport=self.transport)
+        self.assertEqual(patt_sel.get_pattern_loaded_with_timestamp(), (None, None))
+        self.assertEqual(patt_sel.get_pattern_running_with_timestamp(), (None, None))
+        self.assertIsNone(patt_sel.get_pattern_running_data())
+        patt_sel.close()
+
+    def test_not_blocking(self):
+        # TPG 2 has no table yet
+        globals_ = globals("SYS0", "2", "")
+        start = time.perf_counter()
+        patt_sel = ScPatternSelect(
+            "SYS0", "2", "", blocking=False, transport=self.transport
+        )
+        self.assertLess(time.perf_counter() - start, 0.1)
+        self.assertFalse(patt_sel.wait_ready(0))
+        self.assertIsNone(patt_sel.get_patt_table_snapshot())
+
+        ready = []
+        patt_sel.add_ready_callback(lambda: ready.append("first"))
+        self.assertEqual(ready, [])
+
+        # the monitor fills in the table when it is posted
+        timer = threading.Timer(
+            0.05,
+            self.transport.add_tpg,
+            [globals_, self.make_table("SC_SXR_STD_FR_10_Hz")],
+        )
+        timer.start()
+        self.assertTrue(patt_sel.wait_ready(5))
+        timer.join()
+        self.assertEqual(ready, ["first"])
+        self.assertTrue(patt_sel.pattern_exists("SC_SXR_STD_FR_10_Hz"))
+
+        # later callbacks run right away, earlier ones do not run again
+        patt_sel.add_ready_callback(lambda: ready.append("second"))
+        self.transport.post_table(
+            globals_.get_patt_table_name(),
+            {"value": self.make_table("SC_SXR_STD_FR_20_Hz")},
+        )
+        self.assertEqual(ready, ["first", "second"])
+        patt_sel.close()
+
+    def test_wait_ready_async(self):
+        globals_ = globals("SYS0", "2", "")
+        patt_sel = ScPatternSelect(
+            "SYS0", "2", "", blocking=False, transport=self.transport
+        )
+
+        async def wait_ready():
+            self.assertFalse(await patt_sel.wait_ready_async(0.01))
+            # the timed out wait removed its callback
+            self.assertEqual(patt_sel.patt_table_ready_callbacks, [])
+            loop = asyncio.get_running_loop()
+            loop.call_later(
+                0.01,
+                self.transport.add_tpg,
+                globals_,
+                self.make_table("SC_SXR_STD_FR_10_Hz"),
+            )
+            return await patt_sel.wait_ready_async(5)
+
+        self.assertTrue(asyncio.run(wait_ready()))
+        patt_sel.close()
+
+    def test_unclosed_released(self):
+        connection_pool = self.patt_sel.connection_pool
+        for _ in range(100):
+            patt_sel = ScPatternSelect("SYS0", "1", "", transport=self.transport)
+            patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz")
+        del patt_sel
+        gc.collect()
+
+        self.patt_sel.close()
+        self.assertEqual(connection_pool.get_ref_counts(), {"pva": 0})
+        self.assertEqual(
+            self.transport.monitors[self.globals.get_patt_table_name()], []
+        )
+        self.assertEqual(
+            self.transport.readbacks[self.globals.get_pattern_loaded_pv()], []
+        )
+
+    def test_transport_freed(self):
+        transport = LocalTransport()
+        transport.add_tpg(self.globals, self.make_table("SC_SXR_STD_FR_10_Hz"))
+        patt_sels = [
+            ScPatternSelect("SYS0", "1", "", transport=transport) for _ in range(2)
+        ]
+        # the instances on a transport share its pool while they are alive
+        self.assertIs(patt_sels[0].connection_pool, patt_sels[1].connection_pool)
+        patt_sels[0].run_pattern("SC_SXR_STD_FR_10_Hz")
+
+        # the pool and transport go away with the last instance
+        transport_ref = weakref.ref(transport)
+        pool_ref = weakref.ref(patt_sels[0].connection_pool)
+        patt_sels[0].close()
+        del transport, patt_sels
+        gc.collect()
+        self.assertIsNone(pool_ref())
+        self.assertIsNone(transport_ref())
+
+
+class TestAsyncLocalTransport(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.transport = LocalTransport()
+        self.globals = globals("SYS0", "1", "")
+        self.transport.add_tpg(self.globals, make_tpg_table("SC_SXR_STD_FR_10_Hz"))
+        self.patt_sel = AsyncScPatternSelect("SYS0", "1", "", transport=self.transport)
+        await self.patt_sel.connect(blocking=False)
+
+    async def asyncTearDown(self) -> None:
+        await self.patt_sel.close()
+
+    async def test_run_pattern(self):
+        self.assertTrue(await self.patt_sel.wait_ready(1))
+        self.assertFalse(await self.patt_sel.run_pattern("name_that_will_never_exist"))
+
+        result = await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz")
+        self.assertTrue(result, result)
+        pattern_running, timestamp = (
+            await self.patt_sel.get_pattern_running_with_timestamp()
+        )
+        self.assertEqual(pattern_running, "SC_SXR_STD_FR_10_Hz")
+        self.assertIsNotNone(timestamp)
+        self.assertEqual(await self.patt_sel.stop_beam(), 1)
+
+    async def test_run_pattern_again(self):
+        await self.patt_sel.wait_ready(1)
+        self.assertTrue(await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+
+        # the readbacks already show the pattern, the puts completing is enough
+        self.transport.put_callbacks.pop(self.globals.get_load_pv())
+        self.transport.put_callbacks.pop(self.globals.get_apply_pv())
+        self.assertTrue(await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+
+        # a readback that showed another pattern needs an update after the put
+        self.transport.set_value(
+            self.globals.get_pattern_loaded_pv(), "verified/SC_SXR_STD_FR_0_Hz"
+        )
+        result = await self.patt_sel.run_pattern(
+            "SC_SXR_STD_FR_10_Hz", {"loaded": 0.05}
+        )
+        self.assertFalse(result)
+        self.assertEqual(result.failed_stage, "loaded")
+
+    async def test_table_update(self):
+        await self.patt_sel.wait_ready(1)
+        self.transport.post_table(
+            self.globals.get_patt_table_name(),
+            {"value": make_tpg_table("SC_SXR_STD_FR_20_Hz")},
+        )
+        await self.patt_sel.patt_table_sub.wait_posted()
+        self.assertTrue(await self.patt_sel.pattern_exists("SC_SXR_STD_FR_20_Hz"))
+
+    async def test_unchanged_update(self):
+        await self.patt_sel.wait_ready(1)
+        patt_sel = self.patt_sel.patt_sel
+
+        def post(pattern_name, seconds):
+            self.transport.post_table(
+                self.globals.get_patt_table_name(),
+                {
+                    "value": make_tpg_table(pattern_name),
+                    "timeStamp": {
+                        "secondsPastEpoch": seconds,
+                        "nanoseconds": 0,
+                        "userTag": 0,
+                    },
+                },
+            )
+
+        post("SC_SXR_STD_FR_20_Hz", 100)
+        await self.patt_sel.patt_table_sub.wait_posted()
+        version = patt_sel.patt_table_version
+
+        # the same timeStamp as the table of the snapshot is dropped
+        post("SC_SXR_STD_FR_30_Hz", 100)
+        await self.patt_sel.patt_table_sub.wait_posted()
+        self.assertEqual(patt_sel.patt_table_version, version)
+        self.assertFalse(await self.patt_sel.pattern_exists("SC_SXR_STD_FR_30_Hz"))
+
+        post("SC_SXR_STD_FR_30_Hz", 101)
+        await self.patt_sel.patt_table_sub.wait_posted()
+        self.assertEqual(patt_sel.patt_table_version, version + 1)
+        self.assertTrue(await self.patt_sel.pattern_exists("SC_SXR_STD_FR_30_Hz"))
+
+    async def test_stats_and_spans(self):
+        await self.patt_sel.wait_ready(1)
+        network_stats.reset()
+        tracer.clear()
+        tracer.start()
+        try:
+            self.assertTrue(await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz"))
+        finally:
+            tracer.stop()
+
+        stats = self.patt_sel.stats()
+        for operation in ["caput_path", "caput_load", "caput_apply", "wait_applied"]:
+            self.assertEqual(stats[operation]["count"], 1)
+        span_names = {event["name"] for event in tracer.events}
+        self.assertLessEqual(
+            {"run_pattern", "run_pattern.loaded", "load_pattern", "caput_apply"},
+            span_names,
+        )
+        tracer.clear()
+
+    async def test_close(self):
+        await self.patt_sel.wait_ready(1)
+        await self.patt_sel.run_pattern("SC_SXR_STD_FR_10_Hz")
+        await self.patt_sel.close()
+        self.assertEqual(
+            self.transport.monitors[self.globals.get_patt_table_name()], []
+        )
+        self.assertEqual(
+            self.transport.readbacks[self.globals.get_pattern_loaded_pv()], []
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()